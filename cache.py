@@ -0,0 +1,94 @@
+"""Response cache for the Web API"""
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request, Response
+
+
+class ResponseCache:
+    """Size bounded LRU cache for encoded responses.
+    Entries are only valid for the snapshot version they were stored with,
+    whole cache is cleared when a different version is seen.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Returns cached value or None."""
+        with self._lock:
+            self._check_version(version)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+
+class EncodedResponse:
+    """Response body encoded once, with its gzip variant and a strong ETag for each.
+    ETag must change whenever body changes, e.g. derive it from snapshot version.
+    Variants are different representations, so gzip one has its own ETag.
+    """
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.gzip_body = gzip.compress(body, mtime=0)
+        self.etag = etag
+        self.gzip_etag = f"{etag}-gzip"
+
+
+def send_encoded(encoded: EncodedResponse) -> Response:
+    """Sends gzip body if client accepts it. Answers If-None-Match with 304 if it has
+    either variant, clients that cached one encoding may ask with the other one.
+    """
+    use_gzip = bool(request.accept_encodings["gzip"])
+    etag = encoded.gzip_etag if use_gzip else encoded.etag
+    if request.if_none_match.contains(encoded.etag) or request.if_none_match.contains(encoded.gzip_etag):
+        response = Response(status=304)
+    elif use_gzip:
+        response = Response(encoded.gzip_body, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(encoded.body, mimetype="application/json")
+
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    return response
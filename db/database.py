@@ -1,7 +1,10 @@
 import os
 import sqlite3
 import json
+import base64
 import logging
+import threading
+from collections import OrderedDict
 
 try:
     from appdata import App, AppSnippet
@@ -14,16 +17,23 @@ logging.basicConfig(level=logging.CRITICAL)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 APPS_DB_PATH = os.path.join(current_dir, "apps.db")
+# Query counts of the Web API, see queries.py
+QUERIES_DB_PATH = os.path.join(current_dir, "app_queries.db")
 INIT_FILE = os.path.join(current_dir, "init_apps.sql")
 
 APP_FIELDS = App.get_fields()
 APP_SNIPPET_FIELDS = AppSnippet.get_fields()
 
 JSON_FIELDS = ("developers", "publishers", "screenshots")
+FILTER_NAMES = ("tags", "genres", "categories")
 
 
-def insert_app(app: App, db):
-    """Inserts App object to database"""
+def insert_app(app: App, db, dimensions: "DimensionCache" = None):
+    """Inserts App object to database.
+    dimensions is the DimensionCache of db's connection, without it tag ids are looked up in database.
+    """
+    if dimensions is None:
+        dimensions = DimensionCache()
     app_id = app.app_id
     data = {}
     # Covert fields that are dictionary to json
@@ -42,32 +52,286 @@ def insert_app(app: App, db):
         REPLACE INTO apps
         VALUES ({','.join(columns)})""", data)
 
+    # Replace map rows, so ones removed from the app don't stay
+    for table in ("apps_genres", "apps_categories", "apps_tags"):
+        db.execute(f"DELETE FROM {table} WHERE app_id = ?", (app_id, ))
+
     if app.genres:
-        for name, _id in app.genres.items():
-            db.execute("REPLACE INTO genres VALUES (:genre_id, :name)",
-                                            {"genre_id": _id, "name": name})
-            db.execute("REPLACE INTO apps_genres VALUES (:app_id, :genre_id)",
-                                                {"app_id": app_id, "genre_id": _id})
+        dimensions.save_genres(app.genres, db)
+        db.executemany("INSERT INTO apps_genres VALUES (?, ?)", [(app_id, _id) for _id in app.genres.values()])
 
     if app.categories:
-        for name, _id in app.categories.items():
-            db.execute("REPLACE INTO categories VALUES (:category_id, :name)",
-                                                {"category_id": _id, "name": name})
-            db.execute("REPLACE INTO apps_categories VALUES (:app_id, :category_id)",
-                                                    {"app_id": app_id, "category_id": _id})
+        dimensions.save_categories(app.categories, db)
+        db.executemany("INSERT INTO apps_categories VALUES (?, ?)",
+                       [(app_id, _id) for _id in app.categories.values()])
 
     # Tags don't come with ids. they come with vote count for that tag
     if app.tags:
-        for name, votes in app.tags.items():
-            # Check tag name
-            tag_id = db.execute("SELECT tag_id FROM tags WHERE name = :name", {"name": name}).fetchone()
-            if tag_id:
-                db.execute("REPLACE INTO apps_tags VALUES (:app_id, :tag_id, :votes)",
-                                    {"app_id": app_id, "tag_id": tag_id[0], "votes": votes})
-            else:
-                db.execute("INSERT INTO tags VALUES (:tag_id, :name)", {"tag_id": tag_id, "name": name})
-                db.execute("REPLACE INTO apps_tags VALUES (:app_id, :tag_id, :votes)",
-                                {"app_id": app_id, "tag_id": db.lastrowid, "votes": votes})
+        tag_ids = dimensions.get_tag_ids(list(app.tags), db)
+        db.executemany("INSERT INTO apps_tags VALUES (?, ?, ?)",
+                       [(app_id, tag_ids[name], votes) for name, votes in app.tags.items()])
+
+    bump_data_version(db)
+
+
+def bump_data_version(db):
+    """Marks that data the Web API serves changed, it's committed with the change.
+    Web API reloads its snapshot when data_version changes, see snapshot.py.
+    """
+    db.execute("UPDATE data_version SET version = version + 1")
+
+
+def get_data_version(db) -> [int, None]:
+    """Returns data_version, None if database doesn't have one yet."""
+    try:
+        row = db.execute("SELECT version FROM data_version").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+class DimensionCache:
+    """Tags, genres and categories known to be in database, so insert_app()
+    only writes the new ones instead of looking up or replacing each of them per app.
+    Valid for one writing connection. Call clear() when its writes are rolled back,
+    rows inserted by them are gone but they would still be in the cache.
+    """
+
+    def __init__(self):
+        self.tags = {}  # name -> tag_id
+        self.genres = {}  # genre_id -> name
+        self.categories = {}  # category_id -> name
+
+    def load(self, db):
+        self.tags = dict(db.execute("SELECT name, tag_id FROM tags"))
+        self.genres = dict(db.execute("SELECT genre_id, name FROM genres"))
+        self.categories = dict(db.execute("SELECT category_id, name FROM categories"))
+
+    def clear(self):
+        self.tags, self.genres, self.categories = {}, {}, {}
+
+    def get_tag_ids(self, names: list, db) -> dict:
+        """Returns {name: tag_id}, tags that aren't in database are inserted together."""
+        sql = "SELECT name, tag_id FROM tags WHERE name IN (SELECT value FROM json_each(?))"
+        missing = [name for name in names if name not in self.tags]
+        if missing:
+            # Tags written through another connection or cache
+            self.tags.update(db.execute(sql, (json.dumps(missing), )))
+            new_names = [name for name in missing if name not in self.tags]
+            if new_names:
+                # Ignored if another process inserted it in between
+                db.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name, ) for name in new_names])
+                self.tags.update(db.execute(sql, (json.dumps(new_names), )))
+        return {name: self.tags[name] for name in names}
+
+    def save_genres(self, genres: dict, db):
+        """genres -> {name: genre_id}"""
+        self._save("genres", self.genres, genres, db)
+
+    def save_categories(self, categories: dict, db):
+        """categories -> {name: category_id}"""
+        self._save("categories", self.categories, categories, db)
+
+    @staticmethod
+    def _save(table: str, known: dict, items: dict, db):
+        rows = [(_id, name) for name, _id in items.items() if known.get(_id) != name]
+        if not rows:
+            return
+        db.executemany(f"REPLACE INTO {table} VALUES (?, ?)", rows)
+        for _id, name in rows:
+            # REPLACE deletes a row with the same name but another id
+            for other_id in [i for i, n in known.items() if n == name and i != _id]:
+                del known[other_id]
+            known[_id] = name
+
+
+def delete_failed_request(app_id: int, db):
+    db.execute("DELETE FROM failed_requests WHERE app_id == ?", (app_id, ))
+
+
+def insert_http_validators(app_id: int, validators: dict, db):
+    """Saves ETag and Last-Modified values of responses an app was saved from.
+    validators -> {api_provider: {"etag": [str, None], "last_modified": [str, None]}}
+    """
+    db.executemany(
+        "REPLACE INTO http_validators VALUES (?, ?, ?, ?)",
+        [(app_id, provider, v.get("etag"), v.get("last_modified")) for provider, v in validators.items()]
+    )
+
+
+def insert_app_update(app_id: int, last_updated: int, content_hash: [str, None], db):
+    """Records when app was last updated. Saved content_hash is kept if content_hash is None."""
+    db.execute("""\
+        INSERT INTO app_updates VALUES (:app_id, :last_updated, :content_hash)
+        ON CONFLICT (app_id) DO UPDATE SET
+            last_updated = excluded.last_updated,
+            content_hash = COALESCE(excluded.content_hash, content_hash)
+        """, {"app_id": app_id, "last_updated": last_updated, "content_hash": content_hash}
+    )
+
+
+def insert_tag_update(app_id: int, fetched_at: int, db):
+    """Records when SteamSpy's app details of app was last fetched."""
+    db.execute("REPLACE INTO tag_updates VALUES (?, ?)", (app_id, fetched_at))
+
+
+def insert_review_count(app_id: int, reviews: int, counted_at: int, db):
+    """Records review count of a saved app and its reviews per day since it was last recorded."""
+    db.execute("""\
+        INSERT INTO update_queue (app_id, reviews, reviews_at) VALUES (:app_id, :reviews, :counted_at)
+        ON CONFLICT (app_id) DO UPDATE SET
+            review_velocity = CASE
+                WHEN reviews IS NULL OR excluded.reviews_at <= reviews_at THEN review_velocity
+                ELSE MAX(0, excluded.reviews - reviews) * 86400.0 / (excluded.reviews_at - reviews_at)
+            END,
+            reviews = excluded.reviews,
+            reviews_at = excluded.reviews_at
+        """, {"app_id": app_id, "reviews": reviews, "counted_at": counted_at}
+    )
+
+
+def get_app_activity(db) -> list[tuple]:
+    """Returns what refresh intervals of saved apps are based on.
+    returns -> [(app_id, owner_count, coming_soon, review_velocity), ...]
+    """
+    return db.execute("""\
+        SELECT a.app_id, COALESCE(a.owner_count, 0), COALESCE(a.coming_soon, 0), COALESCE(q.review_velocity, 0)
+        FROM apps AS a
+        LEFT JOIN update_queue AS q ON q.app_id = a.app_id
+        """).fetchall()
+
+
+def insert_refresh_intervals(intervals: list, db):
+    """intervals -> [(app_id, seconds), ...]"""
+    db.executemany("""\
+        INSERT INTO update_queue (app_id, refresh_interval) VALUES (?, ?)
+        ON CONFLICT (app_id) DO UPDATE SET refresh_interval = excluded.refresh_interval
+        """, intervals
+    )
+
+
+def start_update_run(started_at: int, start_log: dict, db) -> tuple[int, dict, list]:
+    """Returns last update run if it didn't finish, so it can be resumed. Otherwise starts a new one.
+    start_log is update_log's counters, it's stored so an interrupted run can restore them.
+    returns -> (run_id, start_log of run, [(app_id, status, steam_requests), ...] done in run)
+    """
+    run = db.execute(
+        "SELECT run_id, start_log FROM update_runs WHERE finished_at IS NULL ORDER BY run_id DESC LIMIT 1"
+    ).fetchone()
+    if run is None:
+        db.execute(
+            "INSERT INTO update_runs (started_at, start_log) VALUES (?, ?)", (started_at, json.dumps(start_log))
+        )
+        return db.lastrowid, start_log, []
+
+    run_id, run_start_log = run
+    journal = db.execute(
+        "SELECT app_id, status, steam_requested FROM update_journal WHERE run_id = ?", (run_id, )
+    ).fetchall()
+    return run_id, json.loads(run_start_log), [(i[0], i[1], i[2]) for i in journal]
+
+
+# Shard of syncing applist, it's leased before the shards of apps
+APPLIST_SHARD = -1
+
+
+def get_shard(app_id: int, shard_count: int) -> int:
+    """Returns shard of app_id, same as SHARD_SQL. App ids are mostly multiples of 10,
+    so they are hashed first, otherwise app_id % shard_count would leave most shards empty.
+    """
+    return ((app_id * 2654435761) >> 16) % shard_count
+
+
+SHARD_SQL = "((l.app_id * 2654435761) >> 16) % :shard_count"
+
+
+def create_shards(run_id: int, shard_count: int, db):
+    """Creates APPLIST_SHARD and shards 0 to shard_count - 1 of run_id, if they aren't created yet."""
+    db.executemany(
+        "INSERT OR IGNORE INTO shard_leases VALUES (?, ?, NULL, 0, 0)",
+        [(run_id, shard) for shard in range(APPLIST_SHARD, shard_count)]
+    )
+
+
+def lease_shard(run_id: int, owner: str, now: int, expires_at: int, db) -> [int, None]:
+    """Leases a shard of run_id that isn't done and isn't leased at now, to owner until expires_at.
+    Shards of apps aren't leased until APPLIST_SHARD is done. Returns None if there's no shard to lease.
+    Should be called in a 'BEGIN IMMEDIATE' transaction, so two owners can't lease the same shard.
+    """
+    shards = db.execute(
+        "SELECT shard, expires_at FROM shard_leases WHERE run_id = ? AND done = 0 ORDER BY shard", (run_id, )
+    ).fetchall()
+    for shard, shard_expires_at in shards:
+        if shard_expires_at <= now:
+            db.execute(
+                "UPDATE shard_leases SET owner = ?, expires_at = ? WHERE run_id = ? AND shard = ?",
+                (owner, expires_at, run_id, shard)
+            )
+            return shard
+        if shard == APPLIST_SHARD:
+            return None
+    return None
+
+
+def renew_shard_lease(run_id: int, shard: int, owner: str, expires_at: int, db) -> bool:
+    """Extends owner's lease of shard. Returns False if owner doesn't have it anymore."""
+    db.execute(
+        "UPDATE shard_leases SET expires_at = ? WHERE run_id = ? AND shard = ? AND owner = ?",
+        (expires_at, run_id, shard, owner)
+    )
+    return db.rowcount == 1
+
+
+def release_shard(run_id: int, shard: int, owner: str, done: bool, db):
+    """Ends owner's lease of shard, so it can be leased again unless it's done."""
+    db.execute(
+        "UPDATE shard_leases SET owner = NULL, expires_at = 0, done = ? WHERE run_id = ? AND shard = ? AND owner = ?",
+        (done, run_id, shard, owner)
+    )
+
+
+def count_unfinished_shards(run_id: int, db) -> int:
+    return db.execute("SELECT COUNT(*) FROM shard_leases WHERE run_id = ? AND done = 0", (run_id, )).fetchone()[0]
+
+
+def finish_update_run(run_id: int, finished_at: int, db):
+    """Marks run as finished. Its journal, plan and shard leases are only needed to resume it, so they're deleted."""
+    db.execute("UPDATE update_runs SET finished_at = ? WHERE run_id = ?", (finished_at, run_id))
+    db.execute("DELETE FROM update_journal WHERE run_id = ?", (run_id, ))
+    db.execute("DELETE FROM update_plan WHERE run_id = ?", (run_id, ))
+    db.execute("DELETE FROM shard_leases WHERE run_id = ?", (run_id, ))
+
+
+def insert_journal_entry(run_id: int, app_id: int, status: str, steam_requests: int, db):
+    db.execute("REPLACE INTO update_journal VALUES (?, ?, ?, ?)", (run_id, app_id, status, steam_requests))
+
+
+def insert_exclusion(app_id: int, reason: str, next_check: int, db):
+    """Excludes app from updates until next_check."""
+    db.execute("REPLACE INTO exclusions VALUES (?, ?, ?)", (app_id, reason, next_check))
+
+
+def delete_exclusion(app_id: int, db):
+    """Removes app's exclusion and the records it was excluded for."""
+    db.execute("DELETE FROM exclusions WHERE app_id == ?", (app_id, ))
+    db.execute("DELETE FROM non_game_apps WHERE app_id == ?", (app_id, ))
+    db.execute("DELETE FROM apps_over_million WHERE app_id == ?", (app_id, ))
+
+
+def init_exclusions(now: int, recheck: dict, db):
+    """Excludes apps recorded before exclusions existed.
+    Their next checks are spread over recheck[reason] seconds, so they don't all expire at once.
+    recheck -> {"non_game_app": int, "over_million": int, "failed": int}
+    """
+    for reason, table, where in (
+        ("non_game_app", "non_game_apps", ""),
+        ("over_million", "apps_over_million", ""),
+        ("failed", "failed_requests", "WHERE error == 'failed'")
+    ):
+        db.execute(f"""\
+            INSERT OR IGNORE INTO exclusions
+            SELECT app_id, ?, ? + abs(random() % ?) FROM {table} {where}
+            """, (reason, now, recheck[reason]))
 
 
 def insert_app_over_million(app_id: int, db):
@@ -90,7 +354,9 @@ def get_applist(
         filters: dict, order: dict,
         coming_soon: bool, release_date: list,
         rating: int,
-        offset: int, limit: int, db
+        offset: int, limit: int, db,
+        dimensions: dict = None, filter_index=None,
+        cursor: str = None
         ) -> list[dict]:
     """
     Returns list of app snippets as dict objects.
@@ -107,30 +373,56 @@ def get_applist(
     release_date = [operator: str, value: str]
     limit: number of rows to return
     offset: row number to start from
+    dimensions: output of load_dimensions(), loaded from db if None
+    filter_index: FilterIndex to match filters with, filters are queried from db if None
+    cursor: next_cursor of the previous page, rows after it are returned instead of offset
+
+    Rows are always ordered by app_id last, so pages are stable and can be walked with cursors.
     """
     check_filters(filters)
-    check_order(order)
-    check_release_date(release_date)
-    check_rating(rating)
-
-    filters_sql = build_filters_sql(filters)
-    order_sql = build_order_sql(order)
-    release_date_sql = build_release_date_sql(release_date)
-    coming_soon_sql = build_coming_soon_sql(coming_soon)
-    rating_sql = build_rating_sql(rating)
-
-    combined_sql = build_combined_sql(filters_sql, order_sql, coming_soon_sql, release_date_sql, rating_sql, offset, limit)
-    ordered_apps = db.execute(combined_sql).fetchall()
-
-    applist = []
-    for app in ordered_apps:
-        snippet = {col: app[i] for i, col in enumerate(APP_SNIPPET_FIELDS)}
-        snippet["tags"] = get_tags(snippet["app_id"], db)
-        snippet["genres"] = get_genres(snippet["app_id"], db)
-        snippet["categories"] = get_categories(snippet["app_id"], db)
-        applist.append(snippet)
 
-    return applist
+    order = with_tiebreaker(order)
+    key = decode_cursor(cursor, order) if cursor else None
+    params = {"offset": offset, "limit": limit}
+
+    # Values are bound as parameters, only the shape of the request changes sql text
+    if filter_index is None:
+        filter_shape = tuple(f for f in FILTER_NAMES if filters.get(f))
+        params.update({f: json.dumps(filters[f]) for f in filter_shape})
+    else:
+        matched = filter_index.match_smaller(filters)
+        filter_shape = None
+        if matched is not None:
+            included, app_ids = matched
+            if included and not app_ids:
+                return []
+            filter_shape = "app_ids" if included else "excluded_app_ids"
+            params[filter_shape] = json.dumps(app_ids)
+
+    if coming_soon is not None:
+        params["coming_soon"] = get_coming_soon_param(coming_soon)
+    if release_date:
+        params["release_date"] = get_release_date_param(release_date[1])
+    if rating:
+        params["rating"] = get_rating_param(rating[1])
+    if key:
+        params.update({f"cursor_{i}": value for i, value in enumerate(key)})
+
+    shape = (
+        filter_shape,
+        tuple(order.items()),
+        coming_soon is not None,
+        release_date[0] if release_date else None,
+        rating[0] if rating else None,
+        tuple(value is None for value in key) if key else None
+    )
+    sql = QUERY_PLANS.get(shape, lambda: compile_applist_query(
+        filter_shape, order, coming_soon, release_date, rating, key
+    ))
+    ordered_apps = db.execute(sql, params).fetchall()
+
+    applist = [{col: app[i] for i, col in enumerate(APP_SNIPPET_FIELDS)} for app in ordered_apps]
+    return hydrate_applist(applist, db, dimensions)
 
 
 def check_filters(filters: dict):
@@ -171,6 +463,112 @@ def check_order(order: dict):
             raise ValueError(f"{direction} is not a valid direction. Direction can only be ASC or DESC.")
 
 
+def compile_applist_query(filter_shape, order, coming_soon, release_date, rating, key) -> str:
+    """Validates the parts of a get_applist() request that end up in sql text
+    and returns sql with named parameters for the rest.
+    filter_shape: "app_ids" or "excluded_app_ids" for app_ids FilterIndex matched or didn't match,
+    None for no filters or tuple of filter names to query from map tables
+    """
+    check_order(order)
+    if release_date:
+        check_comp_sign(release_date[0], "release_date")
+    if rating:
+        check_comp_sign(rating[0], "rating")
+
+    if isinstance(filter_shape, tuple):
+        filters_sql = build_filters_params_sql(filter_shape)
+    else:
+        filters_sql = build_app_ids_sql(filter_shape == "excluded_app_ids") if filter_shape else ""
+
+    return build_combined_sql(
+        filters_sql,
+        build_order_sql(order),
+        build_coming_soon_sql(":coming_soon" if coming_soon is not None else None),
+        build_release_date_sql([release_date[0], ":release_date"] if release_date else None),
+        build_rating_sql([rating[0], ":rating"] if rating else None),
+        ":offset", ":limit",
+        build_cursor_sql(order, key) if key else ""
+    )
+
+
+class QueryPlanCache:
+    """Caches sql of get_applist() by the shape of the request.
+    Shape is the request without its values, values are bound as parameters.
+    Same shape gives the same sql text, so sqlite's statement cache can reuse
+    the prepared statement and shapes are validated once.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.compiles = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shape, compile_plan) -> str:
+        """Returns cached sql for shape, calls compile_plan() to create it if missing."""
+        with self._lock:
+            sql = self._plans.get(shape)
+            if sql is not None:
+                self._plans.move_to_end(shape)
+                self.hits += 1
+                return sql
+
+        # Errors raised by compile_plan() aren't cached
+        sql = compile_plan()
+        with self._lock:
+            self._plans[shape] = sql
+            self.compiles += 1
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return sql
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "plans": len(self._plans),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "compiles": self.compiles
+            }
+
+
+QUERY_PLANS = QueryPlanCache(1024)
+
+
+def check_comp_sign(comp_sign: str, column: str):
+    """Raises error if comp_sign isn't a valid comparison operator."""
+    valid_comp_signs = ['<', '<=', '>', '>=', '=', '!=', "IS", "IS NOT"]
+    if comp_sign not in valid_comp_signs:
+        raise ValueError(f"{comp_sign} is not a valid comparison sign for {column}.")
+
+
+def get_coming_soon_param(coming_soon) -> int:
+    """Raises error if coming_soon isn't 0 or 1."""
+    if str(coming_soon) not in ("0", "1"):
+        raise ValueError(f"{coming_soon} is not a valid coming_soon value. Use 0 or 1.")
+    return int(coming_soon)
+
+
+def get_release_date_param(date_str: str) -> [str, None]:
+    """Raises error if date_str doesn't have numeric values when seperated by '-' character."""
+    if date_str == "NULL":
+        return None
+    for s in date_str.split('-'):
+        if not s.isnumeric():
+            raise ValueError(f"{s} is not a valid release_date string.")
+    return date_str
+
+
+def get_rating_param(value: str) -> [int, None]:
+    """Raises error if value isn't numeric."""
+    if value == "NULL":
+        return None
+    if not value.isnumeric():
+        raise ValueError(f"{value} is not a valid rating value.")
+    return int(value)
+
+
 def check_release_date(release_date: [list, tuple]):
     """Raises error if:
     1. First item isn't a valid comparison operator.
@@ -179,17 +577,8 @@ def check_release_date(release_date: [list, tuple]):
     """
     if not release_date:
         return
-    comp_sign = release_date[0]
-    date_str = release_date[1]
-    valid_comp_signs = ['<', '<=', '>', '>=', '=', '!=', "IS", "IS NOT"]
-
-    if comp_sign not in valid_comp_signs:
-        raise ValueError(f"{comp_sign} is not a valid comparison sign for release_date.")
-
-    if date_str != "NULL":
-        for s in date_str.split('-'):
-            if not s.isnumeric():
-                raise ValueError(f"{s} is not a valid release_date string.")
+    check_comp_sign(release_date[0], "release_date")
+    get_release_date_param(release_date[1])
 
 
 def check_rating(rating: list):
@@ -199,21 +588,13 @@ def check_rating(rating: list):
     """
     if not rating:
         return
-    comp_sign = rating[0]
-    value = rating[1]
-    valid_comp_signs = ['<', '<=', '>', '>=', '=', '!=', "IS", "IS NOT"]
-
-    if comp_sign not in valid_comp_signs:
-        raise ValueError(f"{comp_sign} is not a valid comparison sign for rating.")
-
-    if value != "NULL":
-        if not value.isnumeric():
-            raise ValueError(f"{s} is not a valid rating value.")
+    check_comp_sign(rating[0], "rating")
+    get_rating_param(rating[1])
 
 
-def build_combined_sql(filters, order, coming_soon, release_date, rating, offset, limit) -> str:
+def build_combined_sql(filters, order, coming_soon, release_date, rating, offset, limit, cursor="") -> str:
     """Returns executable sql string."""
-    where = " AND ".join([s for s in (filters, coming_soon, release_date, rating) if s])
+    where = " AND ".join([s for s in (filters, coming_soon, release_date, rating, cursor) if s])
     if where:
         where = f"WHERE {where}"
     return (
@@ -254,6 +635,27 @@ def build_filters_sql(filters: [dict, None]) -> str:
         return ""
 
 
+def build_filters_params_sql(filter_names: tuple) -> str:
+    """Same as build_filters_sql() but ids are read from a json array parameter named after the filter."""
+    columns = {"tags": "tag_id", "genres": "genre_id", "categories": "category_id"}
+    tables = [
+        f"SELECT DISTINCT app_id FROM apps_{f} WHERE {columns[f]} IN (SELECT value FROM json_each(:{f}))"
+        for f in filter_names
+    ]
+    if not tables:
+        return ""
+    return f"app_id IN ({' INTERSECT '.join(tables)})"
+
+
+def build_app_ids_sql(excluded: bool = False) -> str:
+    """Constructs sql statement for app_ids matched by FilterIndex, passed as json array parameter.
+    If excluded is True, app_ids that didn't match are passed instead.
+    """
+    if excluded:
+        return "app_id NOT IN (SELECT value FROM json_each(:excluded_app_ids))"
+    return "app_id IN (SELECT value FROM json_each(:app_ids))"
+
+
 def build_order_sql(order: dict) -> str:
     if not order:
         return ""
@@ -261,6 +663,68 @@ def build_order_sql(order: dict) -> str:
         return "ORDER BY " + ", ".join((f"{col} {direction}" for col, direction in order.items()))
 
 
+def with_tiebreaker(order: dict) -> dict:
+    """Returns order with app_id appended, so that rows with equal sort keys have a fixed order."""
+    if "app_id" in order:
+        return order
+    return {**order, "app_id": "ASC"}
+
+
+def encode_cursor(snippet: dict, order: dict) -> str:
+    """Returns an opaque cursor pointing after snippet."""
+    order = with_tiebreaker(order)
+    key = [snippet[col] for col in order]
+    payload = json.dumps([list(order.items()), key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, order: dict) -> list:
+    """Returns sort key stored in cursor.
+    Raises ValueError if cursor is malformed or was created for another order.
+    """
+    try:
+        cursor_order, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"{cursor} is not a valid cursor.")
+
+    order = with_tiebreaker(order)
+    if [tuple(i) for i in cursor_order] != list(order.items()) or len(key) != len(order):
+        raise ValueError("Cursor doesn't match the order of the request.")
+    for value in key:
+        if not isinstance(value, (int, float, str, type(None))):
+            raise ValueError(f"{value} is not a valid cursor value.")
+    return key
+
+
+def build_cursor_sql(order: dict, key: list) -> str:
+    """Constructs sql statement for rows coming after key in order.
+    Value of n-th column is read from parameter 'cursor_n'.
+    NULLs come first in ASC and last in DESC order.
+    (a, b) > (x, y) is expanded to: a > x OR (a IS x AND b > y)
+    """
+    terms = []
+    equal_sql = []
+    for i, (col, direction) in enumerate(order.items()):
+        name = f"cursor_{i}"
+        value = key[i]
+
+        if direction == "ASC":
+            after_sql = f"{col} IS NOT NULL" if value is None else f"{col} > :{name}"
+        elif value is None:
+            # Nothing comes after NULL in DESC order
+            after_sql = ""
+        else:
+            after_sql = f"({col} < :{name} OR {col} IS NULL)"
+
+        if after_sql:
+            terms.append(" AND ".join(equal_sql + [after_sql]))
+        equal_sql.append(f"{col} IS :{name}")
+
+    if not terms:
+        return "0"
+    return "(" + " OR ".join(f"({t})" for t in terms) + ")"
+
+
 def build_release_date_sql(release_date: [list, tuple]) -> str:
     if not release_date:
         return ""
@@ -284,29 +748,52 @@ def build_coming_soon_sql(coming_soon: [int, None]) -> str:
     return f"coming_soon = {coming_soon}"
 
 
-def get_app(app_id: int, db) -> App:
-    columns = [i for i in APP_FIELDS if i not in ("tags", "genres", "categories")]
-
-    query = db.execute(f"SELECT {','.join(columns)} FROM apps WHERE app_id=?", (app_id, )).fetchone()
-    if not query:
-        return None
+def get_app(app_id: int, db, dimensions: dict = None, map_db=None) -> App:
+    """Returns App or None if it doesn't exist."""
+    return get_apps([app_id], db, dimensions, map_db).get(app_id)
 
-    app_data = {}
-    for i, col in enumerate(columns):
-        if col in JSON_FIELDS:
-            print(col)
-            app_data[col] = json.loads(query[i])
-        else:
-            app_data[col] = query[i]
 
-    tags = get_tags(app_id, db)
-    genres = get_genres(app_id, db)
-    categories = get_categories(app_id, db)
+def get_apps(app_ids: list[int], db, dimensions: dict = None, map_db=None) -> dict:
+    """Same as get_app() for many apps, with one query per table.
+    Apps that don't exist are left out.
+    map_db: database to read tags, genres and categories from, db if None
+    returns -> {app_id: App}
+    """
+    if not app_ids:
+        return {}
+    if map_db is None:
+        map_db = db
+    if dimensions is None:
+        dimensions = load_dimensions(map_db)
 
-    for i in (("tags", tags), ("genres", genres), ("categories", categories)):
-        app_data.update({i[0]: i[1]})
+    columns = [i for i in APP_FIELDS if i not in ("tags", "genres", "categories")]
+    rows = db.execute(f"""
+        SELECT {','.join(columns)} FROM apps
+        WHERE app_id IN (SELECT value FROM json_each(?))""", (json.dumps(app_ids), )
+    ).fetchall()
+    if not rows:
+        return {}
+
+    found_ids = [row[0] for row in rows]
+    tags = get_tags_of_apps(found_ids, map_db, dimensions["tags"])
+    genres = get_genres_of_apps(found_ids, map_db, dimensions["genres"])
+    categories = get_categories_of_apps(found_ids, map_db, dimensions["categories"])
+
+    apps = {}
+    for row in rows:
+        app_data = {}
+        for i, col in enumerate(columns):
+            if col in JSON_FIELDS:
+                app_data[col] = json.loads(row[i])
+            else:
+                app_data[col] = row[i]
 
-    return App(app_data)
+        app_id = app_data["app_id"]
+        app_data["tags"] = tags.get(app_id)
+        app_data["genres"] = genres.get(app_id, {})
+        app_data["categories"] = categories.get(app_id, {})
+        apps[app_id] = App(app_data)
+    return apps
 
 
 def get_app_ids(db) -> list[int]:
@@ -363,12 +850,207 @@ def get_categories(app_id: int, db) -> dict:
     return {i[0]: i[1] for i in categories}
 
 
+def hydrate_applist(applist: list[dict], db, dimensions: dict = None) -> list[dict]:
+    """Fills 'tags', 'genres' and 'categories' of each snippet.
+    Runs one query per dimension for the whole page instead of per app.
+    """
+    if not applist:
+        return applist
+    if dimensions is None:
+        dimensions = load_dimensions(db)
+
+    app_ids = [snippet["app_id"] for snippet in applist]
+    tags = get_tags_of_apps(app_ids, db, dimensions["tags"])
+    genres = get_genres_of_apps(app_ids, db, dimensions["genres"])
+    categories = get_categories_of_apps(app_ids, db, dimensions["categories"])
+
+    for snippet in applist:
+        app_id = snippet["app_id"]
+        snippet["tags"] = tags.get(app_id)
+        snippet["genres"] = genres.get(app_id, {})
+        snippet["categories"] = categories.get(app_id, {})
+    return applist
+
+
+def get_tags_of_apps(app_ids: list[int], db, tag_names: dict) -> dict:
+    """Same as get_tags() but for many apps at once.
+    Apps without tags are left out.
+    returns -> {app_id: [{'id': value, 'name': value, 'votes': value}, ...]}
+    """
+    rows = db.execute(f"""
+        SELECT DISTINCT app_id, tag_id, votes FROM apps_tags
+        WHERE app_id IN (SELECT value FROM json_each(?))""", (json.dumps(app_ids), )
+    ).fetchall()
+
+    tags = {}
+    for app_id, _id, votes in rows:
+        tags.setdefault(app_id, []).append({"id": _id, "name": tag_names[_id], "votes": votes})
+    return tags
+
+
+def get_genres_of_apps(app_ids: list[int], db, genre_names: dict) -> dict:
+    """returns -> {app_id: {name: id}}"""
+    return _get_dimension_of_apps(app_ids, "genre", "genres", db, genre_names)
+
+
+def get_categories_of_apps(app_ids: list[int], db, category_names: dict) -> dict:
+    """returns -> {app_id: {name: id}}"""
+    return _get_dimension_of_apps(app_ids, "category", "categories", db, category_names)
+
+
+def _get_dimension_of_apps(app_ids, dimension, dimension_plural, db, names) -> dict:
+    rows = db.execute(f"""
+        SELECT DISTINCT app_id, {dimension}_id FROM apps_{dimension_plural}
+        WHERE app_id IN (SELECT value FROM json_each(?))
+        ORDER BY {dimension}_id""", (json.dumps(app_ids), )
+    ).fetchall()
+
+    result = {}
+    for app_id, _id in rows:
+        # Ids without a row in the dimension table are dropped like in get_genres()
+        if _id in names:
+            result.setdefault(app_id, {})[names[_id]] = _id
+    return result
+
+
 def get_non_game_apps(db) -> list[int]:
     """Returns list of app_ids"""
     result = db.execute("SELECT app_id FROM non_game_apps").fetchall()
     return [i[0] for i in result]
 
 
+def get_http_validators(app_ids: list, db) -> dict:
+    """returns -> {(app_id, api_provider): {"etag": [str, None], "last_modified": [str, None]}}"""
+    results = db.execute("""\
+        SELECT app_id, api_provider, etag, last_modified FROM http_validators
+        WHERE app_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(app_ids), )).fetchall()
+    return {(i[0], i[1]): {"etag": i[2], "last_modified": i[3]} for i in results}
+
+
+def get_app_updates(app_ids: list, db) -> dict:
+    """Returns update times and content hashes of apps.
+    returns -> {app_id: {"last_updated": int, "content_hash": [str, None]}}
+    """
+    results = db.execute("""\
+        SELECT app_id, last_updated, content_hash FROM app_updates
+        WHERE app_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(app_ids), )).fetchall()
+    return {i[0]: {"last_updated": i[1], "content_hash": i[2]} for i in results}
+
+
+def get_tag_updates(app_ids: list, db) -> dict:
+    """returns -> {app_id: time SteamSpy's app details of app was last fetched}"""
+    results = db.execute("""\
+        SELECT app_id, fetched_at FROM tag_updates
+        WHERE app_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(app_ids), )).fetchall()
+    return dict(results)
+
+
+def init_app_updates(db):
+    """Records apps saved before their updates were recorded as updated at 0,
+    so they're planned as the stalest apps, not as new ones.
+    """
+    db.execute("INSERT OR IGNORE INTO app_updates SELECT app_id, 0, NULL FROM apps")
+    db.execute("INSERT OR IGNORE INTO app_updates SELECT app_id, 0, NULL FROM apps_over_million")
+
+
+def insert_applist_page(apps: list, db):
+    """apps -> [(app_id, name, last_modified), ...]"""
+    db.executemany("REPLACE INTO applist VALUES (?, ?, ?)", apps)
+
+
+def get_applist_last_modified(db) -> int:
+    """Returns last_modified of the most recently modified app in applist, 0 if it's empty."""
+    return db.execute("SELECT COALESCE(MAX(last_modified), 0) FROM applist").fetchone()[0]
+
+
+def get_request_rates(db) -> dict:
+    """returns -> {api_provider: requests per second}"""
+    return dict(db.execute("SELECT api_provider, rate FROM request_rates"))
+
+
+def insert_request_rates(rates: dict, db):
+    """rates -> {api_provider: requests per second}"""
+    db.executemany("REPLACE INTO request_rates VALUES (?, ?)", list(rates.items()))
+
+
+def get_applist_length(db) -> int:
+    return db.execute("SELECT COUNT(*) FROM applist").fetchone()[0]
+
+
+def count_ignored_apps(now: int, db) -> int:
+    """Returns number of apps in applist that are excluded at now."""
+    return db.execute("""\
+        SELECT COUNT(*) FROM applist
+        WHERE app_id IN (SELECT app_id FROM exclusions WHERE next_check > ?)
+        """, (now, )).fetchone()[0]
+
+
+def count_rechecked_apps(now: int, db) -> int:
+    """Returns number of apps in applist whose exclusion expired at now."""
+    return db.execute("""\
+        SELECT COUNT(*) FROM applist
+        WHERE app_id IN (SELECT app_id FROM exclusions WHERE next_check <= ?)
+        """, (now, )).fetchone()[0]
+
+
+# Share of an app's refresh interval left until it's due, apps are due at 1 or less and new apps have -1.
+# Apps without a refresh interval in update_queue are due once they're updated before stale_before
+UPDATE_KEY_SQL = """\
+    CASE WHEN u.last_updated IS NULL THEN -1.0
+    ELSE COALESCE(q.refresh_interval, :now - :stale_before) * 1.0 / MAX(:now - u.last_updated, 1) END"""
+
+# Apps of applist to update
+PLANNED_APPS_SQL = f"""\
+    FROM applist AS l
+    LEFT JOIN app_updates AS u ON u.app_id = l.app_id
+    LEFT JOIN update_queue AS q ON q.app_id = l.app_id
+    WHERE COALESCE(u.last_updated, -1) <= :stale_before
+    AND {UPDATE_KEY_SQL} <= 1
+    AND l.app_id NOT IN (SELECT app_id FROM exclusions WHERE next_check > :now)
+    AND l.app_id NOT IN (SELECT app_id FROM update_journal WHERE run_id = :run_id)
+    AND {SHARD_SQL} = :shard
+    """
+
+
+def create_update_plan(now: int, stale_before: int, run_id: int, db,
+                       shard: int = 0, shard_count: int = 1) -> tuple[int, int]:
+    """Writes apps of shard to update in run_id to update_plan, replacing the shard's previous plan.
+    Applist is queried once per plan, get_planned_apps() pages through the plan.
+    New apps come first ordered by app_id, then due apps from the most overdue for their refresh interval,
+    so apps that go stale fastest are updated first. Apps updated after stale_before are never due.
+    Apps excluded at now and apps in run_id's journal are left out. See get_shard() for shards.
+    returns -> (number of new apps, number of stale apps) in plan
+    """
+    params = {"now": now, "stale_before": stale_before, "run_id": run_id, "shard": shard, "shard_count": shard_count}
+    db.execute("DELETE FROM update_plan WHERE run_id = :run_id AND shard = :shard", params)
+    db.execute(f"""\
+        INSERT INTO update_plan
+        SELECT :run_id, :shard, {UPDATE_KEY_SQL}, l.app_id, l.name
+        {PLANNED_APPS_SQL}
+        """, params)
+    return db.execute("""\
+        SELECT COALESCE(SUM(update_key < 0), 0), COALESCE(SUM(update_key >= 0), 0) FROM update_plan
+        WHERE run_id = :run_id AND shard = :shard
+        """, params).fetchone()
+
+
+def get_planned_apps(run_id: int, after: tuple, limit: int, db, shard: int = 0) -> list[dict]:
+    """Returns next 'limit' apps of shard's plan in run_id, see create_update_plan().
+    after -> (update_key, app_id) of last app of previous page, (-2, 0) for first page.
+    returns -> [{"app_id": int, "name": str, "update_key": float}, ...]
+    """
+    results = db.execute("""\
+        SELECT app_id, name, update_key FROM update_plan
+        WHERE run_id = ? AND shard = ? AND (update_key, app_id) > (?, ?)
+        ORDER BY update_key, app_id
+        LIMIT ?
+        """, (run_id, shard, after[0], after[1], limit)).fetchall()
+    return [{"app_id": i[0], "name": i[1], "update_key": i[2]} for i in results]
+
+
 def get_failed_requests(where: str, db) -> list[dict]:
     """returns -> [{app_id: int, api_provider: str, error: str, status_code: [int, None]}, ...]"""
     sql = f"SELECT app_id, api_provider, error, status_code FROM failed_requests {where}"
@@ -418,6 +1100,29 @@ def _load_filter_list(filter_name, db):
     return result
 
 
+def load_dimensions(db) -> dict:
+    """Loads dimension tables into memory.
+    returns -> {'tags': {id: name}, 'genres': {id: name}, 'categories': {id: name}}
+    """
+    return {
+        "tags": dict(db.execute("SELECT tag_id, name FROM tags").fetchall()),
+        "genres": dict(db.execute("SELECT genre_id, name FROM genres").fetchall()),
+        "categories": dict(db.execute("SELECT category_id, name FROM categories").fetchall()),
+    }
+
+
+def create_snapshot_indexes(db):
+    """Indexes map tables by app_id, so pages can be hydrated without full scans.
+    Meant for the in-memory copy, hot only snapshots don't copy indexes
+    and databases created before init_apps.sql had them don't have them.
+    """
+    db.executescript("""
+        CREATE INDEX IF NOT EXISTS apps_tags_app_id ON apps_tags (app_id);
+        CREATE INDEX IF NOT EXISTS apps_genres_app_id ON apps_genres (app_id);
+        CREATE INDEX IF NOT EXISTS apps_categories_app_id ON apps_categories (app_id);
+    """)
+
+
 def load_tag_list(db):
     return _load_filter_list('tag', db)
 
@@ -458,9 +1163,11 @@ def print_columns(table, db):
 
 
 class Connection:
-    """Context manager for database"""
-    def __init__(self, database: str):
-        self.con = sqlite3.connect(database)
+    """Context manager for database.
+    Waits up to 'timeout' seconds for other processes writing to it, e.g. updater workers.
+    """
+    def __init__(self, database: str, timeout: float = 60):
+        self.con = sqlite3.connect(database, timeout=timeout)
 
     def __enter__(self):
         return self.con.cursor()
@@ -0,0 +1,93 @@
+"""In-memory bitmap index for filtering apps by tags, genres and categories"""
+from itertools import compress
+
+FILTERS = {
+    # filter name : (map table, id column)
+    "tags": ("apps_tags", "tag_id"),
+    "genres": ("apps_genres", "genre_id"),
+    "categories": ("apps_categories", "category_id"),
+}
+
+# Maps "0"/"1" characters of bin() to 0/1 bytes, so bits can be passed to itertools.compress()
+BITS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+class FilterIndex:
+    """Keeps one bitmap of apps per tag, genre and category.
+    Bitmaps are python ints, bit n stands for the n-th app_id in ascending order.
+    Ids of the same filter are OR'ed, different filters are AND'ed,
+    same as build_filters_sql().
+    """
+
+    def __init__(self, db):
+        self.app_ids = [i[0] for i in db.execute("SELECT app_id FROM apps ORDER BY app_id").fetchall()]
+        self._positions = {app_id: i for i, app_id in enumerate(self.app_ids)}
+        # Bits of all apps
+        self._all = (1 << len(self.app_ids)) - 1
+        self.bitmaps = {name: self._load_bitmaps(table, column, db) for name, (table, column) in FILTERS.items()}
+
+    def _load_bitmaps(self, table: str, column: str, db) -> dict:
+        """returns -> {id: bitmap}"""
+        positions = {}
+        for app_id, _id in db.execute(f"SELECT app_id, {column} FROM {table}").fetchall():
+            # Skip rows of apps that aren't in apps table
+            if app_id in self._positions:
+                positions.setdefault(_id, []).append(self._positions[app_id])
+
+        # Set bits on a byte array then convert it to int at once,
+        # OR'ing ints one bit at a time would copy the whole bitmap for every row
+        size = (len(self.app_ids) + 7) // 8
+        bitmaps = {}
+        for _id, app_positions in positions.items():
+            bits = bytearray(size)
+            for p in app_positions:
+                bits[p >> 3] |= 1 << (p & 7)
+            bitmaps[_id] = int.from_bytes(bits, "little")
+        return bitmaps
+
+    def match(self, filters: dict) -> [list[int], None]:
+        """Returns app_ids matching filters in ascending order.
+        Returns None if filters don't have any ids.
+        """
+        bitmap = self._match_bitmap(filters)
+        if bitmap is None:
+            return None
+        return self._to_app_ids(bitmap)
+
+    def match_smaller(self, filters: dict) -> [tuple[bool, list[int]], None]:
+        """Returns (True, app_ids matching filters) or, when more than half of apps match,
+        (False, app_ids not matching them), so broad filters don't pass most of the catalog to sql.
+        Returns None if filters don't have any ids.
+        """
+        bitmap = self._match_bitmap(filters)
+        if bitmap is None:
+            return None
+        if bin(bitmap).count("1") * 2 > len(self.app_ids):
+            return False, self._to_app_ids(bitmap ^ self._all)
+        return True, self._to_app_ids(bitmap)
+
+    def _match_bitmap(self, filters: dict) -> [int, None]:
+        result = None
+        for name, ids in filters.items():
+            if not ids:
+                continue
+            bitmaps = self.bitmaps[name]
+            matched = 0
+            for _id in ids:
+                matched |= bitmaps.get(_id, 0)
+            result = matched if result is None else result & matched
+        return result
+
+    def _to_app_ids(self, bitmap: int) -> list[int]:
+        # Least significant bit first
+        bits = bin(bitmap)[:1:-1]
+        if bits.count("1") * 32 > len(bits):
+            # Many apps, bits are selected in C instead of a loop over each of them
+            return list(compress(self.app_ids, bits.encode().translate(BITS)))
+
+        app_ids = []
+        i = bits.find("1")
+        while i != -1:
+            app_ids.append(self.app_ids[i])
+            i = bits.find("1", i + 1)
+        return app_ids
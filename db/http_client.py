@@ -0,0 +1,101 @@
+"""HTTP client for the updater"""
+import re
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Returned by conditional requests when server responds with 304 - Not Modified
+NOT_MODIFIED = object()
+
+# Query parameters holding credentials, their values are hidden in logged urls
+SECRET_PARAMS = re.compile(r"([?&](?:key|access_token)=)[^&#\s'\"]*")
+
+
+class HTTPClient:
+    """Keeps one requests.Session per host, so connections are kept alive
+    and reused across requests instead of connecting for each one.
+    Thread safe, each session's pool holds up to 'pool_size' connections.
+
+    'hosts' maps hosts to other base urls, e.g. {"steamspy.com": "http://127.0.0.1:8000"},
+    so a local server can stand in for an API without changing its urls.
+    """
+
+    def __init__(self, pool_size: int, timeout: float, hosts: dict = None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.hosts = hosts or {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, headers: dict = None) -> requests.Response:
+        url = self._rewrite(url)
+        return self._session(urlsplit(url).netloc).get(url, headers=headers, timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _rewrite(self, url: str) -> str:
+        parts = urlsplit(url)
+        base = self.hosts.get(parts.netloc)
+        if base is None:
+            return url
+        return base.rstrip("/") + url[len(f"{parts.scheme}://{parts.netloc}"):]
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+                self._sessions[host] = session
+            return session
+
+
+def conditional_headers(validators: dict) -> dict:
+    """Returns If-None-Match and If-Modified-Since headers for stored validators."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def get_validators(response: requests.Response) -> dict:
+    """Returns validators of a response, values are None if server didn't send them."""
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified")
+    }
+
+
+def get_retry_after(response: requests.Response) -> [float, None]:
+    """Returns seconds to wait from Retry-After header, None if it isn't sent or valid.
+    Header is either seconds or an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def redact_url(text: str) -> str:
+    """Returns text with values of credential query parameters in its urls replaced,
+    so API keys aren't written to logs. Works on any text, e.g. tracebacks with urls in them.
+    """
+    return SECRET_PARAMS.sub(r"\1REDACTED", text)
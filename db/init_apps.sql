@@ -22,6 +22,12 @@ CREATE TABLE IF NOT EXISTS apps (
     mac INTEGER,
     linux INTEGER
 );
+-- DATA VERSION
+-- Incremented when data the Web API serves is committed, other writes of the updater don't change it
+CREATE TABLE IF NOT EXISTS data_version (
+    version INTEGER
+);
+INSERT INTO data_version SELECT 0 WHERE NOT EXISTS (SELECT * FROM data_version);
 -- APPS OVER MILLION
 CREATE TABLE IF NOT EXISTS apps_over_million (
     app_id INTEGER PRIMARY KEY
@@ -57,6 +63,10 @@ CREATE TABLE IF NOT EXISTS apps_categories (
     app_id INTEGER,
     category_id INTEGER
 );
+-- Map rows are looked up and replaced by app_id
+CREATE INDEX IF NOT EXISTS apps_tags_app_id ON apps_tags (app_id);
+CREATE INDEX IF NOT EXISTS apps_genres_app_id ON apps_genres (app_id);
+CREATE INDEX IF NOT EXISTS apps_categories_app_id ON apps_categories (app_id);
 -- NON-GAME APPS
 CREATE TABLE IF NOT EXISTS non_game_apps (
     app_id INTEGER UNIQUE
@@ -67,4 +77,99 @@ CREATE TABLE IF NOT EXISTS failed_requests (
     api_provider TEXT,
     error TEXT,
     status_code INTEGER
-);
\ No newline at end of file
+);
+-- HTTP VALIDATORS
+-- ETag and Last-Modified of the responses an app was last saved from
+CREATE TABLE IF NOT EXISTS http_validators (
+    app_id INTEGER,
+    api_provider TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    PRIMARY KEY (app_id, api_provider)
+);
+-- APP UPDATES
+-- When each app was last updated and hash of its saved content
+CREATE TABLE IF NOT EXISTS app_updates (
+    app_id INTEGER PRIMARY KEY,
+    last_updated INTEGER,
+    content_hash TEXT
+);
+-- TAG UPDATES
+-- When SteamSpy's app details, which has the tags its bulk listing lacks, was last fetched for each app
+CREATE TABLE IF NOT EXISTS tag_updates (
+    app_id INTEGER PRIMARY KEY,
+    fetched_at INTEGER
+);
+-- UPDATE RUNS
+-- finished_at is NULL while a run is going on or if it was interrupted
+CREATE TABLE IF NOT EXISTS update_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at INTEGER,
+    finished_at INTEGER,
+    start_log TEXT
+);
+-- UPDATE JOURNAL
+-- Apps done in each run, committed together with their data.
+-- steam_requested is the number of requests made to Steam for the app
+CREATE TABLE IF NOT EXISTS update_journal (
+    run_id INTEGER,
+    app_id INTEGER,
+    status TEXT,
+    steam_requested INTEGER,
+    PRIMARY KEY (run_id, app_id)
+);
+-- UPDATE PLAN
+-- Apps to update in each shard of a run, written once when the run or shard starts.
+-- update_key orders them, see UPDATE_KEY_SQL in database.py
+CREATE TABLE IF NOT EXISTS update_plan (
+    run_id INTEGER,
+    shard INTEGER,
+    update_key REAL,
+    app_id INTEGER,
+    name TEXT,
+    PRIMARY KEY (run_id, shard, update_key, app_id)
+);
+-- APPLIST
+-- Apps on Steam, last_modified is from Steam's applist
+CREATE TABLE IF NOT EXISTS applist (
+    app_id INTEGER PRIMARY KEY,
+    name TEXT,
+    last_modified INTEGER
+);
+CREATE INDEX IF NOT EXISTS applist_last_modified ON applist (last_modified);
+-- EXCLUSIONS
+-- Apps that aren't updated until next_check, reason is non_game_app, over_million or failed
+CREATE TABLE IF NOT EXISTS exclusions (
+    app_id INTEGER PRIMARY KEY,
+    reason TEXT,
+    next_check INTEGER
+);
+CREATE INDEX IF NOT EXISTS exclusions_next_check ON exclusions (next_check);
+-- REQUEST RATES
+-- Requests per second each API provider allowed in the last update, see AdaptiveTokenBucket
+CREATE TABLE IF NOT EXISTS request_rates (
+    api_provider TEXT PRIMARY KEY,
+    rate REAL
+);
+-- SHARD LEASES
+-- Shards of an update run leased by update workers, see get_shard() for an app's shard.
+-- A lease expires at expires_at unless its owner renews it, shard -1 is syncing applist
+CREATE TABLE IF NOT EXISTS shard_leases (
+    run_id INTEGER,
+    shard INTEGER,
+    owner TEXT,
+    expires_at INTEGER,
+    done INTEGER,
+    PRIMARY KEY (run_id, shard)
+);
+-- UPDATE QUEUE
+-- Seconds until each saved app is due to be updated again, set at the start of each update.
+-- reviews is the review count of the app when it was saved at reviews_at,
+-- review_velocity is reviews per day between its last two saves
+CREATE TABLE IF NOT EXISTS update_queue (
+    app_id INTEGER PRIMARY KEY,
+    refresh_interval INTEGER,
+    reviews INTEGER,
+    reviews_at INTEGER,
+    review_velocity REAL
+);
@@ -0,0 +1,32 @@
+"""Lease heartbeat for updater workers"""
+import threading
+import traceback
+
+
+class LeaseKeeper(threading.Thread):
+    """Renews a lease every 'interval' seconds until stop() is called.
+    renew() extends the lease and returns False if it's lost, e.g. it expired and another worker took it.
+    Work done under the lease should stop once 'lost' is True.
+    """
+
+    def __init__(self, renew, interval: float):
+        super().__init__(name="LeaseKeeper", daemon=True)
+        self.renew = renew
+        self.interval = interval
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not self.renew():
+                    self.lost = True
+                    print("\nLease is lost, stopping its work...")
+                    return
+            except Exception:
+                # Lease is kept until it expires, next renewal may work
+                print(f"\nCouldn't renew lease:\n{traceback.format_exc()}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
@@ -0,0 +1,208 @@
+"""Live metrics of the updater"""
+import os
+import json
+import time
+import bisect
+import threading
+from itertools import accumulate
+from collections import deque
+
+# Upper bounds of request latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Counts observations in buckets by their upper bounds, like Prometheus histograms.
+    Not thread safe, UpdateMetrics locks around it.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Last one counts observations over the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> [float, None]:
+        """Returns upper bound of the bucket q quantile is in, None if it's over the largest bound."""
+        if not self.count:
+            return None
+        for bound, count in zip(self.buckets, accumulate(self.counts)):
+            if count >= q * self.count:
+                return bound
+        return None
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            # Cumulative like Prometheus buckets, "+Inf" is count
+            "buckets": dict(zip([str(b) for b in self.buckets], accumulate(self.counts)))
+        }
+
+
+class UpdateMetrics:
+    """Counts apps, requests and errors of an update and times requests per API provider.
+    Thread safe, workers record to it while MetricsReporter reads it.
+    'gauges' maps names to functions returning a current value, e.g. queue depths, read on snapshot().
+    apps per second of the last 'window' seconds gives the ETA of 'planned' apps.
+    """
+
+    def __init__(self, planned: int = 0, window: float = 300):
+        self.planned = planned
+        self.window = window
+        self.gauges = {}
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._apps = {}  # status -> count
+        self._requests = {}  # api_provider -> {result: count}
+        self._latency = {}  # api_provider -> Histogram
+        self._errors = {}  # api_provider -> {error class: count}
+        self._samples = deque()  # (monotonic time, apps done)
+        self._lock = threading.Lock()
+
+    def observe_request(self, api_provider: str, seconds: float, result: str):
+        """result is status code of response or name of the exception request raised."""
+        with self._lock:
+            results = self._requests.setdefault(api_provider, {})
+            results[result] = results.get(result, 0) + 1
+            self._latency.setdefault(api_provider, Histogram()).observe(seconds)
+
+    def count_error(self, api_provider: str, error: str):
+        with self._lock:
+            errors = self._errors.setdefault(api_provider, {})
+            errors[error] = errors.get(error, 0) + 1
+
+    def count_app(self, status: str):
+        with self._lock:
+            self._apps[status] = self._apps.get(status, 0) + 1
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            done = sum(self._apps.values())
+            self._samples.append((now, done))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+            sample_time, sample_done = self._samples[0]
+
+            elapsed = now - self._start
+            recent_rate = (done - sample_done) / (now - sample_time) if now > sample_time else 0
+            snapshot = {
+                "started_at": int(self.started_at),
+                "elapsed": round(elapsed, 1),
+                "planned": self.planned,
+                "done": done,
+                "apps_per_sec": round(done / elapsed, 3) if elapsed else 0,
+                "recent_apps_per_sec": round(recent_rate, 3),
+                "eta": round(max(0, self.planned - done) / recent_rate) if recent_rate else None,
+                "apps": dict(self._apps),
+                "requests": {provider: dict(results) for provider, results in self._requests.items()},
+                "latency": {provider: histogram.as_dict() for provider, histogram in self._latency.items()},
+                "errors": {provider: dict(errors) for provider, errors in self._errors.items()}
+            }
+
+        gauges = {}
+        for name, get_value in list(self.gauges.items()):
+            try:
+                gauges[name] = get_value()
+            except Exception:
+                gauges[name] = None
+        snapshot["gauges"] = gauges
+        return snapshot
+
+
+def to_prometheus(snapshot: dict) -> str:
+    """Returns snapshot of UpdateMetrics in Prometheus' text format."""
+    lines = []
+
+    def add(name: str, kind: str, samples: list):
+        lines.append(f"# TYPE updater_{name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"updater_{name}{label_text} {value}")
+
+    add("planned_apps", "gauge", [({}, snapshot["planned"])])
+    add("apps_total", "counter", [({"status": s}, n) for s, n in snapshot["apps"].items()])
+    add("apps_per_second", "gauge", [({}, snapshot["apps_per_sec"])])
+    add("recent_apps_per_second", "gauge", [({}, snapshot["recent_apps_per_sec"])])
+    add("eta_seconds", "gauge", [({}, snapshot["eta"])])
+    add("requests_total", "counter", [
+        ({"provider": p, "result": r}, n) for p, results in snapshot["requests"].items() for r, n in results.items()
+    ])
+    add("errors_total", "counter", [
+        ({"provider": p, "error": e}, n) for p, errors in snapshot["errors"].items() for e, n in errors.items()
+    ])
+
+    lines.append("# TYPE updater_request_seconds histogram")
+    for provider, histogram in snapshot["latency"].items():
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'updater_request_seconds_bucket{{provider="{provider}",le="{bound}"}} {count}')
+        lines.append(f'updater_request_seconds_bucket{{provider="{provider}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'updater_request_seconds_sum{{provider="{provider}"}} {histogram["sum"]}')
+        lines.append(f'updater_request_seconds_count{{provider="{provider}"}} {histogram["count"]}')
+
+    for name, value in snapshot["gauges"].items():
+        add(name, "gauge", [({}, value)])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsReporter(threading.Thread):
+    """Writes snapshots of metrics to json_path and prom_path every 'interval' seconds
+    and prints a progress line. Files are replaced as a whole, readers never see half of one.
+    """
+
+    def __init__(self, metrics: UpdateMetrics, json_path: str, prom_path: str, interval: float):
+        super().__init__(name="MetricsReporter", daemon=True)
+        self.metrics = metrics
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def stop(self) -> dict:
+        """Stops the thread and writes the last snapshot, which is returned."""
+        self._stop_event.set()
+        self.join()
+        return self.report(progress=False)
+
+    def report(self, progress: bool = True) -> dict:
+        snapshot = self.metrics.snapshot()
+        write_file(self.json_path, json.dumps(snapshot, indent=2))
+        write_file(self.prom_path, to_prometheus(snapshot))
+        if progress:
+            eta = "-" if snapshot["eta"] is None else format_seconds(snapshot["eta"])
+            print(
+                f"\rApps: {snapshot['done']:,} / {snapshot['planned']:,}"
+                f" | {snapshot['recent_apps_per_sec']:.2f} apps/sec | ETA: {eta}", end=""
+            )
+        return snapshot
+
+
+def write_file(path: str, text: str):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def format_seconds(seconds: float) -> str:
+    """Returns seconds as h:mm:ss"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
@@ -0,0 +1,100 @@
+"""Pool of read-only sqlite connections"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ReadPool:
+    """Hands out read-only connections to a database, one per thread at a time.
+    Connections are opened lazily up to 'size', after that threads wait
+    for a connection to be returned. Connections are reused across requests.
+    """
+
+    def __init__(self, uri: str, size: int, cached_statements: int = 128, init_sql: str = None):
+        self.uri = uri
+        self.size = size
+        self.cached_statements = cached_statements
+        # Executed on each new connection, e.g. pragmas
+        self.init_sql = init_sql
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.in_use = 0
+        self.acquires = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @contextmanager
+    def connection(self):
+        """Yields a cursor of a connection that only this thread uses until it exits."""
+        con = self._acquire()
+        try:
+            yield con.cursor()
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._idle.put(con)
+
+    def _acquire(self) -> sqlite3.Connection:
+        start = time.perf_counter()
+        try:
+            con = self._idle.get_nowait()
+            waited = False
+        except queue.Empty:
+            con = self._open()
+            waited = con is None
+            if waited:
+                con = self._idle.get()
+
+        wait_time = time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.acquires += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+        return con
+
+    def _open(self) -> [sqlite3.Connection, None]:
+        """Opens a new connection, returns None if pool is full."""
+        with self._lock:
+            if self.opened >= self.size:
+                return None
+            self.opened += 1
+        try:
+            # Connection is passed between threads but never used by two at once
+            con = sqlite3.connect(
+                self.uri, uri=True, check_same_thread=False, cached_statements=self.cached_statements
+            )
+            if self.init_sql:
+                con.executescript(self.init_sql)
+            return con
+        except sqlite3.Error:
+            with self._lock:
+                self.opened -= 1
+            raise
+
+    def close(self):
+        """Closes idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self.opened,
+                "in_use": self.in_use,
+                "acquires": self.acquires,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 6),
+                "max_wait_time": round(self.max_wait_time, 6)
+            }
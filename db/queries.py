@@ -0,0 +1,111 @@
+"""Counts of apps queried from the Web API, the updater refreshes apps clients query more often"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import traceback
+from collections import Counter
+
+# Query scores halve every this many seconds, so they follow what clients query lately
+HALF_LIFE = 7 * 24 * 60 * 60
+
+
+class QueryRecorder(threading.Thread):
+    """Counts app_ids queried from the Web API and adds them to query scores in database at 'path'
+    every 'interval' seconds. It's a separate database from apps.db, so writing to it
+    doesn't make the API reload its snapshot. Thread safe, record() only counts in memory.
+    """
+
+    def __init__(self, path: str, interval: float, half_life: float = HALF_LIFE):
+        super().__init__(name="QueryRecorder", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.half_life = half_life
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def record(self, app_ids: list):
+        with self._lock:
+            self._counts.update(app_ids)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        """Stops the thread and flushes the last counts."""
+        self._stop_event.set()
+        self.join()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+
+        now = int(time.time())
+        try:
+            con = connect(self.path)
+            with con:
+                scores = get_scores(list(counts), now, self.half_life, con)
+                con.executemany(
+                    "REPLACE INTO app_queries VALUES (?, ?, ?)",
+                    [(app_id, scores.get(app_id, 0) + count, now) for app_id, count in counts.items()]
+                )
+            con.close()
+            self.flushes += 1
+        except sqlite3.Error:
+            # Counts are added back, they're written with the next flush
+            print(f"Couldn't save query counts:\n{traceback.format_exc()}")
+            self.failed_flushes += 1
+            with self._lock:
+                self._counts.update(counts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._counts)
+        return {"pending_apps": pending, "flushes": self.flushes, "failed_flushes": self.failed_flushes}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    con = sqlite3.connect(path, timeout=60)
+    con.execute("""\
+        CREATE TABLE IF NOT EXISTS app_queries (
+            app_id INTEGER PRIMARY KEY,
+            score REAL,
+            scored_at INTEGER
+        )""")
+    return con
+
+
+def get_scores(app_ids: [list, None], now: int, half_life: float, con: sqlite3.Connection) -> dict:
+    """Returns query scores of app_ids (all apps if it's None) decayed to now.
+    returns -> {app_id: score}
+    """
+    if app_ids is None:
+        rows = con.execute("SELECT app_id, score, scored_at FROM app_queries")
+    else:
+        rows = con.execute(
+            "SELECT app_id, score, scored_at FROM app_queries WHERE app_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(app_ids), )
+        )
+    return {app_id: score * 0.5 ** (max(0, now - scored_at) / half_life) for app_id, score, scored_at in rows}
+
+
+def get_query_scores(path: str, now: int, half_life: float = HALF_LIFE) -> dict:
+    """Returns query scores of all apps decayed to now, {} if nothing is recorded at path yet.
+    A score is about the number of queries of an app in the last half_life / ln(2) seconds.
+    returns -> {app_id: score}
+    """
+    if not os.path.exists(path):
+        return {}
+    con = connect(path)
+    try:
+        return get_scores(None, now, half_life, con)
+    finally:
+        con.close()
@@ -0,0 +1,104 @@
+"""Rate limiting for API requests made by the updater"""
+import time
+import threading
+
+
+class TokenBucket:
+    """Lets at most 'rate' requests per second through, with bursts up to 'capacity'.
+    Thread safe, acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Lets no request through for the next 'seconds' seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # Tokens don't pile up while paused
+            self._tokens = 0
+            self._last = self._paused_until
+
+    def succeeded(self):
+        """Called when a request let through got a healthy response."""
+
+    def throttled(self, retry_after: float = None):
+        """Called when server responded that requests are too many or it's overloaded.
+        Waits 'retry_after' seconds before the next request if it's given.
+        """
+        if retry_after:
+            self.pause(retry_after)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """TokenBucket that finds the rate a server allows with additive increase, multiplicative decrease.
+    Rate grows by 'increase' requests per second, for every second of healthy responses,
+    and is multiplied by 'decrease' when throttled, staying between 'min_rate' and 'max_rate'.
+    Throttles in 'cooldown' seconds after a decrease are taken as responses
+    to requests made before it, so they don't decrease the rate again.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float,
+                 increase: float, decrease: float = 0.5, cooldown: float = 0, capacity: float = 1):
+        super().__init__(rate, capacity)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.set_rate(rate)
+        self._decreased_at = None
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def succeeded(self):
+        with self._lock:
+            # Responses come 'rate' times a second, so rate grows by 'increase' a second
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self, retry_after: float = None):
+        with self._lock:
+            now = time.monotonic()
+            if self._decreased_at is None or now - self._decreased_at >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._decreased_at = now
+        super().throttled(retry_after)
+
+
+class RequestBudget:
+    """Thread safe counter for a limited number of requests."""
+
+    def __init__(self, limit: int, used: int = 0):
+        self.limit = limit
+        self.used = used
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Uses one request from budget, returns False if there is none left."""
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
@@ -0,0 +1,102 @@
+"""On-disk store of raw API responses for the updater"""
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class RawStore:
+    """Keeps every response body the updater fetched, so apps can be rebuilt without requests.
+    Bodies are gzipped and stored by their sha256 under 'objects',
+    identical bodies are stored once. 'index.db' records which body was fetched
+    for which app from which provider and when. Thread safe.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.objects_dir = os.path.join(path, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(
+            os.path.join(path, "index.db"), isolation_level=None, check_same_thread=False
+        )
+        self._con.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                api_provider TEXT,
+                app_id INTEGER,
+                fetched_at INTEGER,
+                hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS responses_app_id ON responses (app_id, api_provider);
+        """)
+
+    def save(self, api_provider: str, app_id: int, body: bytes, fetched_at: int = None) -> str:
+        """Stores body and records it as app_id's response from api_provider. Returns its hash."""
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            # Written to a temporary file first, so a crash never leaves half a body behind
+            temp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(gzip.compress(body, mtime=0))
+            os.replace(temp_path, object_path)
+
+        if fetched_at is None:
+            fetched_at = int(time.time())
+        with self._lock:
+            self._con.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?)", (api_provider, app_id, fetched_at, digest)
+            )
+        return digest
+
+    def load(self, digest: str) -> bytes:
+        with open(self._object_path(digest), "rb") as f:
+            return gzip.decompress(f.read())
+
+    def load_latest(self, api_provider: str, app_id: int) -> [bytes, None]:
+        """Returns the last saved body of app_id from api_provider, None if there's none."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT hash FROM responses WHERE app_id = ? AND api_provider = ? ORDER BY rowid DESC LIMIT 1",
+                (app_id, api_provider)
+            ).fetchone()
+        return self.load(row[0]) if row else None
+
+    def latest(self):
+        """Yields (app_id, {api_provider: body}) with the last saved body from each provider, ordered by app_id.
+        Rows are read from their own connection as they're yielded, so the index is never in memory as a whole.
+        """
+        con = sqlite3.connect(os.path.join(self.path, "index.db"))
+        try:
+            rows = con.execute("""
+                SELECT app_id, api_provider, hash, MAX(rowid) FROM responses
+                GROUP BY app_id, api_provider
+                ORDER BY app_id
+                """)
+
+            app_id = None
+            bodies = {}
+            for row_app_id, api_provider, digest, _ in rows:
+                if row_app_id != app_id:
+                    if bodies:
+                        yield app_id, bodies
+                    app_id = row_app_id
+                    bodies = {}
+                bodies[api_provider] = self.load(digest)
+            if bodies:
+                yield app_id, bodies
+        finally:
+            con.close()
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:] + ".json.gz")
@@ -0,0 +1,189 @@
+"""In-memory snapshots of apps database for the Web API"""
+import os
+import time
+import sqlite3
+import threading
+import traceback
+import itertools
+from urllib.request import pathname2url
+
+try:
+    from database import (
+        APP_SNIPPET_FIELDS, get_data_version, get_apps,
+        create_snapshot_indexes, load_dimensions,
+        load_tag_list, load_genre_list, load_category_list
+    )
+    from filter_index import FilterIndex
+    from pool import ReadPool
+except ImportError:
+    from .database import (
+        APP_SNIPPET_FIELDS, get_data_version, get_apps,
+        create_snapshot_indexes, load_dimensions,
+        load_tag_list, load_genre_list, load_category_list
+    )
+    from .filter_index import FilterIndex
+    from .pool import ReadPool
+
+
+# Size of sqlite's prepared statement cache per connection
+STATEMENT_CACHE_SIZE = 512
+# Tables /GetAppList needs, loaded in hot only mode besides AppSnippet columns of apps
+HOT_TABLES = ("tags", "genres", "categories", "apps_tags", "apps_genres", "apps_categories")
+# Bytes of database file to memory map for reading app details from disk
+DETAILS_MMAP_SIZE = 256 * 1024 * 1024
+# Numbers memdb databases of snapshots. id() isn't used, a freed snapshot's id can be reused
+# while its memdb is still open by connections of its pools
+_snapshot_numbers = itertools.count()
+
+
+def get_file_uri(path: str) -> str:
+    """Returns sqlite URI opening database file at path read-only. Path is escaped,
+    so '?', '#', '%' and Windows paths aren't taken as parts of the URI.
+    """
+    return f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+
+
+def get_snapshot_version(path: str) -> str:
+    """Returns a string that changes whenever data the Web API serves is committed to database.
+    Updater's other writes, e.g. its journal, don't change it.
+    Databases without data_version fall back to changing whenever the file is written to.
+    """
+    source = sqlite3.connect(get_file_uri(path), uri=True)
+    try:
+        version = get_data_version(source)
+    finally:
+        source.close()
+    if version is None:
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    return f"v{version}"
+
+
+class Snapshot:
+    """Copy of apps database in memory and the data derived from it.
+    Nothing is written to a snapshot after it's loaded.
+    Copy is a shared memdb database, so connections from 'pool'
+    can read it from many threads at once without copying it again.
+
+    If hot_only is True, only AppSnippet columns of apps and HOT_TABLES are copied.
+    Other columns are left NULL in memory, so app details are read with 'details_pool',
+    which reads the database file on disk, see get_apps().
+    """
+
+    def __init__(self, path: str, pool_size: int, hot_only: bool = False):
+        self.path = path
+        self.version = get_snapshot_version(path)
+        self.hot_only = hot_only
+        uri = f"file:/snapshot-{self.version}-{next(_snapshot_numbers)}?vfs=memdb"
+
+        # This connection keeps the database alive, memdb is freed when its last connection closes
+        self.con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if hot_only:
+            load_hot_tables(path, self.con, uri)
+        else:
+            source = sqlite3.connect(path)
+            source.backup(self.con)
+            source.close()
+        create_snapshot_indexes(self.con)
+        self.pool = ReadPool(uri + "&mode=ro", pool_size, STATEMENT_CACHE_SIZE)
+
+        if hot_only:
+            self.details_pool = ReadPool(
+                get_file_uri(path), pool_size, STATEMENT_CACHE_SIZE,
+                init_sql=f"PRAGMA mmap_size = {DETAILS_MMAP_SIZE}"
+            )
+        else:
+            self.details_pool = self.pool
+
+        self.app_count = self.con.execute("SELECT COUNT(*) FROM apps").fetchone()[0]
+        self.tag_list = load_tag_list(self.con)
+        self.genre_list = load_genre_list(self.con)
+        self.category_list = load_category_list(self.con)
+        self.dimensions = load_dimensions(self.con)
+        self.filter_index = FilterIndex(self.con)
+
+    def get_apps(self, app_ids: list[int]) -> dict:
+        """Returns details of app_ids, see database.get_apps().
+        In hot only mode they are read from the file with their tags, genres and categories
+        in one read transaction, so an app is never mixed from two states of database
+        while the updater writes to it.
+        returns -> {app_id: App}
+        """
+        if not self.hot_only:
+            with self.pool.connection() as db:
+                return get_apps(app_ids, db, self.dimensions)
+
+        with self.details_pool.connection() as db:
+            db.execute("BEGIN")
+            try:
+                # Dimensions of snapshot are the file's until the updater writes to it
+                dimensions = self.dimensions
+                if f"v{get_data_version(db)}" != self.version:
+                    dimensions = load_dimensions(db)
+                return get_apps(app_ids, db, dimensions)
+            finally:
+                db.execute("ROLLBACK")
+
+
+def load_hot_tables(path: str, db, uri: str):
+    """Copies AppSnippet columns of apps and HOT_TABLES from database at path
+    to db, which is a connection to memdb database at uri.
+    Tables are created with the same schema, so queries don't need to know what's left out.
+    """
+    # Databases attached to a memdb connection would be opened with memdb too,
+    # so the snapshot is attached to the file instead
+    source = sqlite3.connect(get_file_uri(path), uri=True)
+    for table in ("apps", ) + HOT_TABLES:
+        create_sql = source.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table, )
+        ).fetchone()[0]
+        db.execute(create_sql)
+    db.commit()
+
+    source.execute("ATTACH DATABASE ? AS snapshot", (uri, ))
+    # One transaction, so all tables are read from the same state of the file
+    source.execute("BEGIN")
+    columns = ",".join(APP_SNIPPET_FIELDS)
+    source.execute(f"INSERT INTO snapshot.apps ({columns}) SELECT {columns} FROM main.apps")
+    for table in HOT_TABLES:
+        source.execute(f"INSERT INTO snapshot.{table} SELECT * FROM main.{table}")
+    source.commit()
+    source.close()
+
+
+class SnapshotReloader(threading.Thread):
+    """Loads a new Snapshot in background when data in database changes, see get_snapshot_version().
+    Readers should take 'current' once per request and use it until they finish,
+    swapping it doesn't affect requests that already took the old snapshot.
+    """
+
+    def __init__(self, path: str, interval: float, pool_size: int, hot_only: bool = False):
+        super().__init__(name="SnapshotReloader", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.pool_size = pool_size
+        self.hot_only = hot_only
+        self.current = Snapshot(path, pool_size, hot_only)
+        self.reload_count = 0
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception:
+                # Keep serving the old snapshot
+                print(f"Couldn't reload snapshot:\n{traceback.format_exc()}")
+
+    def reload(self) -> bool:
+        """Loads a new snapshot if database changed. Returns True if it did."""
+        if get_snapshot_version(self.path) == self.current.version:
+            return False
+
+        start = time.perf_counter()
+        snapshot = Snapshot(self.path, self.pool_size, self.hot_only)
+        # Assignment is atomic, old snapshot is freed when last request using it finishes
+        self.current = snapshot
+        self.reload_count += 1
+        print(f"Loaded snapshot {snapshot.version} in {time.perf_counter() - start:.1f} secs.")
+        return True
@@ -5,8 +5,14 @@ import math
 import datetime
 import traceback
 import json
+import hashlib
 import logging
 import re
+import random
+import threading
+from itertools import takewhile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
 
 import requests
 
@@ -17,12 +23,27 @@ try:
         ServerError, RequestFailedWithUnknownError
     )
     from update_logger import UpdateLogger
+    from ratelimit import TokenBucket, AdaptiveTokenBucket, RequestBudget
+    from writer import DBWriter
+    from raw_store import RawStore
+    from metrics import UpdateMetrics, MetricsReporter
+    from lease import LeaseKeeper
+    from queries import get_query_scores
+    from http_client import HTTPClient, NOT_MODIFIED, conditional_headers, get_validators, get_retry_after, redact_url
     from appdata import App
     from database import (
-        APPS_DB_PATH, Connection,
+        APPS_DB_PATH, Connection, DimensionCache,
         insert_app, insert_non_game_app,
         insert_failed_request, insert_app_over_million,
-        get_non_game_apps, get_failed_requests
+        delete_failed_request, insert_http_validators, insert_app_update,
+        start_update_run, finish_update_run, insert_journal_entry,
+        get_http_validators, get_app_updates, init_app_updates, get_tag_updates, insert_tag_update,
+        insert_applist_page, get_applist_last_modified, get_applist_length,
+        count_ignored_apps, get_planned_apps, create_update_plan,
+        insert_exclusion, delete_exclusion, init_exclusions, count_rechecked_apps,
+        get_request_rates, insert_request_rates,
+        APPLIST_SHARD, create_shards, lease_shard, renew_shard_lease, release_shard, count_unfinished_shards,
+        QUERIES_DB_PATH, insert_review_count, get_app_activity, insert_refresh_intervals
     )
 except ImportError:
     from .errors import (
@@ -31,12 +52,27 @@ except ImportError:
         ServerError, RequestFailedWithUnknownError
     )
     from .update_logger import UpdateLogger
+    from .ratelimit import TokenBucket, AdaptiveTokenBucket, RequestBudget
+    from .writer import DBWriter
+    from .raw_store import RawStore
+    from .metrics import UpdateMetrics, MetricsReporter
+    from .lease import LeaseKeeper
+    from .queries import get_query_scores
+    from .http_client import HTTPClient, NOT_MODIFIED, conditional_headers, get_validators, get_retry_after, redact_url
     from .appdata import App
     from .database import (
-        APPS_DB_PATH, Connection,
+        APPS_DB_PATH, Connection, DimensionCache,
         insert_app, insert_non_game_app,
         insert_failed_request, insert_app_over_million,
-        get_non_game_apps, get_failed_requests
+        delete_failed_request, insert_http_validators, insert_app_update,
+        start_update_run, finish_update_run, insert_journal_entry,
+        get_http_validators, get_app_updates, init_app_updates, get_tag_updates, insert_tag_update,
+        insert_applist_page, get_applist_last_modified, get_applist_length,
+        count_ignored_apps, get_planned_apps, create_update_plan,
+        insert_exclusion, delete_exclusion, init_exclusions, count_rechecked_apps,
+        get_request_rates, insert_request_rates,
+        APPLIST_SHARD, create_shards, lease_shard, renew_shard_lease, release_shard, count_unfinished_shards,
+        QUERIES_DB_PATH, insert_review_count, get_app_activity, insert_refresh_intervals
     )
 
 logging.debug(f"Apps Database Path: {APPS_DB_PATH}")
@@ -46,7 +82,12 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 DEBUG_LOG = os.path.join(current_dir, "./debug.log")
 UPDATE_LOG_PATH = os.path.join(current_dir, "update_log.json")
-UPDATE_HISTORY_LOG_PATH = os.path.join(current_dir, "update_history.log")
+# One json record per update run
+UPDATE_HISTORY_PATH = os.path.join(current_dir, "update_history.jsonl")
+# Metrics of the running update, rewritten every METRICS_INTERVAL seconds
+METRICS_JSON_PATH = os.path.join(current_dir, "update_metrics.json")
+METRICS_PROM_PATH = os.path.join(current_dir, "update_metrics.prom")
+METRICS_INTERVAL = 10
 
 # Init Loggers
 logging.basicConfig(level=logging.DEBUG)
@@ -56,145 +97,772 @@ update_log = update_logger.log
 
 OWNER_LIMIT = 1_000_000
 REQUEST_TIMEOUT = 15
-# Time to wait in between request in seconds
+# Time to wait in between request in seconds, on the first update
 RATE_LIMIT = 1
+# Request rates of Steam and SteamSpy adapt to responses between these, in requests per second.
+# Rate learned in an update is used in the next one
+MIN_REQUEST_RATE = 0.1
+MAX_REQUEST_RATE = 4
+# Rate grows this many requests per second, for every second of healthy responses
+REQUEST_RATE_INCREASE = 0.01
+# Rate is multiplied by this when server responds with 429 or 5xx
+REQUEST_RATE_DECREASE = 0.5
+# Seconds to wait after a 429 if server doesn't send Retry-After
+TOO_MANY_REQUESTS_WAIT = 10
 STEAM_REQUEST_LIMIT = 100_000
+# Number of apps processed at the same time
+WORKERS = 8
+
+# Apps updated less than this many seconds ago are skipped
+MIN_UPDATE_AGE = 24 * 60 * 60
+# Saved apps are updated again after a refresh interval between MIN_UPDATE_AGE and this,
+# apps that change often or that clients query are refreshed more often, see get_refresh_interval()
+MAX_REFRESH_INTERVAL = 30 * 24 * 60 * 60
+# Each point of an app's activity score halves its refresh interval
+ACTIVITY_WEIGHTS = {
+    # per log10 of owners in thousands
+    "owners": 0.5,
+    # per log10 of new reviews per day
+    "reviews": 1.5,
+    # per log10 of query score, see queries.py
+    "queries": 2,
+    # upcoming apps' release dates and prices change often
+    "coming_soon": 4
+}
+# Apps are planned and loaded from database this many at a time
+PLAN_CHUNK_SIZE = 1000
+# Apps per page of applist
+APPLIST_PAGE_SIZE = 10_000
+# Excluded apps are checked again after a random time up to this many seconds, per reason
+EXCLUSION_RECHECK = {
+    "non_game_app": 90 * 24 * 60 * 60,
+    "over_million": 30 * 24 * 60 * 60,
+    "failed": 14 * 24 * 60 * 60
+}
+
+# Apps are split into this many shards for workers, see run_worker()
+SHARD_COUNT = 64
+# Seconds a worker's lease of a shard lasts unless it's renewed, it's renewed every third of it.
+# Renewals wait for write transactions of other workers, which last up to WRITE_INTERVAL, so keep it well above that
+LEASE_DURATION = 120
+# Seconds a worker waits before checking for a shard again, when other workers have all of them
+LEASE_POLL_INTERVAL = 10
+
+# Writes are committed every WRITE_BATCH_SIZE writes or WRITE_INTERVAL seconds
+WRITE_BATCH_SIZE = 500
+WRITE_INTERVAL = 5
+
+# SteamSpy allows 1 request per minute to its bulk listing
+STEAMSPY_BULK_RATE_LIMIT = 60
+# Set to False to request every app from SteamSpy one by one
+STEAMSPY_BULK = True
+# Fields of SteamSpy's app details that its bulk listing also has, kept for apps under OWNER_LIMIT
+STEAMSPY_BULK_FIELDS = ("owners", "ccu", "price", "positive", "negative")
+# Apps in bulk listing have their tags from SteamSpy's app details fetched again after this many seconds
+TAGS_MAX_AGE = 30 * 24 * 60 * 60
+
+# Each provider has its own limit, requests to different providers don't wait for each other
+LIMITERS = {
+    provider: AdaptiveTokenBucket(
+        1 / RATE_LIMIT, MIN_REQUEST_RATE, MAX_REQUEST_RATE,
+        REQUEST_RATE_INCREASE, REQUEST_RATE_DECREASE, cooldown=REQUEST_TIMEOUT
+    ) for provider in ("steam", "steamspy")
+}
+LIMITERS["steamspy_bulk"] = TokenBucket(1 / STEAMSPY_BULK_RATE_LIMIT)
 
 # File paths
-APPLIST_FILE = os.path.join(current_dir, "applist.json")
-APPLIST_FILTERED_FILE = os.path.join(current_dir, "applist_filtered.json")
+# Every response fetched for an app is kept here, see raw_store.py
+RAW_STORE_PATH = os.path.join(current_dir, "raw")
 
 # API's
 # Append appid to app details API to get app details
-APPLIST_API = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+# Paged applist, needs STEAM_API_KEY. Without it whole applist is fetched from APPLIST_V2_API
+APPLIST_API = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+APPLIST_V2_API = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+STEAM_API_KEY = os.environ.get("STEAM_API_KEY")
 STEAM_APP_DETAILS_API_BASE = "https://store.steampowered.com/api/appdetails/?appids="
 STEAMSPY_APP_DETAILS_API_BASE = "https://steamspy.com/api.php?request=appdetails&appid="
+# Append page number to get ~1000 apps of SteamSpy's bulk listing
+STEAMSPY_ALL_API_BASE = "https://steamspy.com/api.php?request=all&page="
+# Set to send requests of all APIs above to another server, e.g. http://127.0.0.1:8000 for test/mock_server.py
+UPDATE_API_URL = os.environ.get("UPDATE_API_URL")
+
+# Requests to all APIs go through this client
+http_client = HTTPClient(WORKERS, REQUEST_TIMEOUT, hosts={
+    urlsplit(api).netloc: UPDATE_API_URL
+    for api in (APPLIST_API, STEAM_APP_DETAILS_API_BASE, STEAMSPY_APP_DETAILS_API_BASE)
+} if UPDATE_API_URL else None)
 
 # Format
 DATETIME_FORMAT = "%Y-%m-%d %H:%M"
 
+# Set while main() runs, see write()
+db_writer = None
+# Tags, genres and categories in database, only used from db_writer's thread, see start_db_writer()
+dimension_cache = DimensionCache()
+# Set while main() runs, see fetchProxy()
+raw_store = None
+# Request, app and error counts of this update, written to files by MetricsReporter while main() runs
+metrics = UpdateMetrics()
+# Writes of the app a worker thread is processing, see run_app()
+app_writes = threading.local()
+# Loaded for each chunk of planned apps, see iter_planned_apps()
+http_validators = {}
+app_updates = {}
+tag_updates = {}
+# {app_id: STEAMSPY_BULK_FIELDS of its bulk listing entry} of apps under OWNER_LIMIT
+steamspy_bulk = {}
+
+# update_log keys counting each status of process_app
+STATUS_COUNTERS = {
+    "over_million": "apps_over_million",
+    "non_game_app": "non_game_apps",
+    "failed_request": "failed_requests",
+    "updated": "updated_apps",
+    "unchanged": "unchanged_apps"
+}
+# update_log keys restored from journal when an interrupted run is resumed
+JOURNAL_COUNTERS = ["steam_request_count"] + list(STATUS_COUNTERS.values())
+
 tracker = {
-    "last_index": 0,
     "steam_request_count": 0,
     "updated_apps": 0,
     "non_game_apps": 0,
     "ignored_apps": 0,
     "failed_requests": 0,
-    "apps_over_million": 0
+    "apps_over_million": 0,
+    "unchanged_apps": 0
 }
 
 
 def main():
     print("||===            UPDATE             ===||")
     print(f"||=== Start Date : {get_datetime_str()} ===||")
+    if UPDATE_API_URL:
+        print(f"APIs are requested from: {UPDATE_API_URL}")
 
     # Get App List from Steam
-    applist = load_applist()
-    applist_index = update_log["applist_index"]
-    remaining_apps = applist[applist_index:]
+    sync_applist()
+    now = int(time.time())
+    stale_before = now - MIN_UPDATE_AGE
+    with Connection(APPS_DB_PATH) as db:
+        init_app_updates(db)
+        init_exclusions(now, EXCLUSION_RECHECK, db)
+        schedule_apps(now, db)
+        for provider, rate in get_request_rates(db).items():
+            LIMITERS[provider].set_rate(rate)
+        start_log = {key: update_log.get(key, 0) for key in JOURNAL_COUNTERS}
+        run_id, start_log, journal = start_update_run(int(time.time()), start_log, db)
+
+        applist_length = get_applist_length(db)
+        ignored_count = count_ignored_apps(now, db)
+        rechecked_count = count_rechecked_apps(now, db)
+        new_count, stale_count = create_update_plan(now, stale_before, run_id, db)
+
+    # Journal is committed with apps' data, so an interrupted run continues exactly where it stopped
+    if journal:
+        print(f"Resuming interrupted run, apps done: {len(journal):,}")
+        update_log.update(start_log)
+        for app_id, status, steam_requests in journal:
+            count_result(status, steam_requests)
+
+    remaining_length = new_count + stale_count
+    update_log["applist_length"] = applist_length
+    update_log["remaining_length"] = remaining_length
+    update_log["ignored_apps"] += ignored_count
+    tracker["ignored_apps"] += ignored_count
+    steam_budget = RequestBudget(STEAM_REQUEST_LIMIT, tracker["steam_request_count"])
 
-    # !!!!!!!!!!!!!!!
-    remaining_apps = [
-        {"app_id": 659, "name": "Portal 2 - Pre-order"},
-    ]
-    # !!!!!!!!!!!!!!!
+    print(f"Applist: {applist_length:,} items")
+    print(f"Apps to be ignored: {ignored_count:,} items")
+    print(f"Apps not due yet: {applist_length - ignored_count - remaining_length - len(journal):,} items")
+    print(f"Apps to update: {remaining_length:,} items ({new_count:,} new, {stale_count:,} due)")
+    print(f"Excluded apps to check again: {rechecked_count:,} items")
 
-    applist_length = len(applist)
-    remaining_length = len(remaining_apps)
+    over_million = {}
+    if STEAMSPY_BULK and remaining_length:
+        over_million = load_over_million()
 
+    metrics.planned = remaining_length
+    reporter = start_fetching(METRICS_JSON_PATH, METRICS_PROM_PATH)
+    print("Fetching apps:")
+    try:
+        update_apps(run_id, iter_planned_apps(run_id), over_million, steam_budget)
+    finally:
+        stop_fetching(reporter)
+    # An interrupted or failed run isn't finished, the next one resumes it from its journal
+    with Connection(APPS_DB_PATH) as db:
+        finish_update_run(run_id, int(time.time()), db)
 
-    update_log["applist_length"] = applist_length
-    update_log["remaining_length"] = remaining_length
 
-    apps_to_ignore = get_apps_to_ignore()
+def run_worker(worker: str):
+    """Updates apps with other workers, each running this in its own process sharing apps.db.
+    Applist sync and apps of each shard (see get_shard()) are leased from shard_leases,
+    so workers don't update the same apps. Leases are renewed while a worker works on them,
+    shards of a crashed worker are leased again once their leases expire.
+    Each worker has its own rate limits and Steam request budget.
+    """
+    print(f"||===        UPDATE WORKER: {worker}        ===||")
+    print(f"||=== Start Date : {get_datetime_str()} ===||")
+    if UPDATE_API_URL:
+        print(f"APIs are requested from: {UPDATE_API_URL}")
 
-    print(f"Applist: {applist_length:,} items")
-    print(f"Starting from: {applist_index}")
-    print(f"Apps to be ignored: {len(apps_to_ignore):,} items")
-    print("Fetching apps:")
+    now = int(time.time())
+    stale_before = now - MIN_UPDATE_AGE
+    with Connection(APPS_DB_PATH) as db:
+        # Workers starting at the same time join the same run
+        db.execute("BEGIN IMMEDIATE")
+        init_app_updates(db)
+        init_exclusions(now, EXCLUSION_RECHECK, db)
+        for provider, rate in get_request_rates(db).items():
+            LIMITERS[provider].set_rate(rate)
+        run_id, _, _ = start_update_run(now, {}, db)
+        if not count_unfinished_shards(run_id, db):
+            # First worker of the run schedules apps for all of them
+            schedule_apps(now, db)
+        create_shards(run_id, SHARD_COUNT, db)
+    print(f"Run: {run_id} | Shards: {SHARD_COUNT}")
+
+    steam_budget = RequestBudget(STEAM_REQUEST_LIMIT)
+    over_million = None
+    reporter = start_fetching(
+        METRICS_JSON_PATH.replace(".json", f".{worker}.json"), METRICS_PROM_PATH.replace(".prom", f".{worker}.prom")
+    )
+    try:
+        while True:
+            with Connection(APPS_DB_PATH) as db:
+                db.execute("BEGIN IMMEDIATE")
+                shard = lease_shard(run_id, worker, int(time.time()), int(time.time()) + LEASE_DURATION, db)
+                unfinished_shards = count_unfinished_shards(run_id, db)
+
+            if shard is None:
+                if not unfinished_shards:
+                    break
+                # Other workers have the rest, wait in case one of them crashes
+                time.sleep(LEASE_POLL_INTERVAL)
+                continue
 
-    for i, app_data in enumerate(remaining_apps):
-        # print(f"Progress: {i:,} / {remaining_length:,}", end="\r")
+            print(f"\nLeased shard: {shard}")
+            lease = LeaseKeeper(lambda: renew_lease(run_id, shard, worker), LEASE_DURATION / 3)
+            lease.start()
+            done = False
+            try:
+                if shard == APPLIST_SHARD:
+                    sync_applist()
+                    done = True
+                else:
+                    if over_million is None:
+                        over_million = load_over_million() if STEAMSPY_BULK else {}
+                    with Connection(APPS_DB_PATH) as db:
+                        metrics.planned += sum(create_update_plan(now, stale_before, run_id, db, shard, SHARD_COUNT))
+                    planned_apps = iter_planned_apps(run_id, shard)
+                    if not update_apps(run_id, takewhile(lambda _: not lease.lost, planned_apps),
+                                       over_million, steam_budget):
+                        return
+                    # Journal is committed before the shard is done
+                    db_writer.flush()
+                    done = not lease.lost
+            finally:
+                lease.stop()
+                with Connection(APPS_DB_PATH) as db:
+                    release_shard(run_id, shard, worker, done, db)
+            print(f"\nShard {shard} {'is done' if done else 'is released'}")
 
-        tracker["last_index"] = i
-        app_id = app_data["app_id"]
-        name = app_data["name"]
+        with Connection(APPS_DB_PATH) as db:
+            finish_update_run(run_id, int(time.time()), db)
+        print("All shards are done")
+    finally:
+        stop_fetching(reporter)
 
-        # If app is not a game skip
-        if app_id in apps_to_ignore:
-            update_log["ignored_apps"] += 1
-            tracker["ignored_apps"] += 1
-            continue
 
-        # Save log every 100th iteration
-        if i % 100 == 0:
-            update_logger.save()
+def renew_lease(run_id: int, shard: int, worker: str) -> bool:
+    with Connection(APPS_DB_PATH) as db:
+        return renew_shard_lease(run_id, shard, worker, int(time.time()) + LEASE_DURATION, db)
+
+
+def load_over_million() -> dict:
+    """Loads SteamSpy's bulk listing, see load_steamspy_bulk(). Returns its apps over million."""
+    print("Loading SteamSpy's bulk listing:")
+    under_million, over_million = load_steamspy_bulk()
+    steamspy_bulk.update(under_million)
+    print("")
+    return over_million
+
+
+def start_fetching(metrics_json_path: str, metrics_prom_path: str) -> MetricsReporter:
+    """Starts db_writer, raw_store and a MetricsReporter writing to given paths, which is returned."""
+    global db_writer, raw_store
+    db_writer = start_db_writer()
+    raw_store = RawStore(RAW_STORE_PATH)
+    metrics.gauges.update({
+        "write_queue": lambda: db_writer.queue_size,
+        "steam_request_rate": lambda: LIMITERS["steam"].rate,
+        "steamspy_request_rate": lambda: LIMITERS["steamspy"].rate
+    })
+    reporter = MetricsReporter(metrics, metrics_json_path, metrics_prom_path, METRICS_INTERVAL)
+    reporter.start()
+    return reporter
 
-        # Wait Before Making Any Request
-        time.sleep(RATE_LIMIT)
 
-        # Create App
-        app = App({"app_id": app_id, "name": name})
+def stop_fetching(reporter: MetricsReporter):
+    """Stops what start_fetching() started and saves learned request rates."""
+    global db_writer, raw_store
+    reporter.stop()
+    try:
+        # Raises if writer stopped because of an error
+        db_writer.close()
+    finally:
+        print(
+            f"\nWrites: {db_writer.writes:,} | Failed Writes: {db_writer.failed_writes:,}"
+            f" | Commits: {db_writer.commits:,}"
+        )
+        db_writer = None
+        raw_store.close()
+        raw_store = None
+    rates = {provider: LIMITERS[provider].rate for provider in ("steam", "steamspy")}
+    print("Request rates: " + " | ".join(f"{provider}: {rate:.2f}/s" for provider, rate in rates.items()))
+    with Connection(APPS_DB_PATH) as db:
+        insert_request_rates(rates, db)
 
-        # FETCH FROM STEAMSPY
-        steamspy_response = fetchProxy("steamspy", app_id)
-        if steamspy_response is None:
-            update_log["failed_requests"] += 1
-            tracker["failed_requests"] += 1
-            continue
 
-        # Check minimum owner
-        min_owner_count = get_min_owner_count(steamspy_response)
+def update_apps(run_id: int, planned_apps, over_million: dict, steam_budget: RequestBudget) -> bool:
+    """Updates planned_apps, WORKERS apps at a time. Returns False if Steam request limit is reached.
+    planned_apps -> iterable of {"app_id": int, "name": str, ...}
+    """
+    # Apps are processed by WORKERS threads and results are handled as they finish,
+    # journal keeps track of done apps, so a slow app doesn't hold up the others
+    executor = ThreadPoolExecutor(max_workers=WORKERS)
+    in_flight = {}  # future -> app_id
+    metrics.gauges["in_flight_apps"] = lambda: len(in_flight)
+    try:
+        for app_data in planned_apps:
+            app_id = app_data["app_id"]
+            # Apps over million are known from bulk listing, they don't need any request
+            if app_id in over_million:
+                skip_over_million(run_id, app_id, over_million.pop(app_id))
+                continue
 
-        if min_owner_count > OWNER_LIMIT:
-            with Connection(APPS_DB_PATH) as db:
-                insert_app_over_million(app_id, db)
-                update_log["apps_over_million"] += 1
-                tracker["apps_over_million"] += 1
-            continue
+            in_flight[executor.submit(run_app, run_id, app_id, app_data["name"], steam_budget)] = app_id
 
-        # Update app info
-        data_from_steamspy = map_steamspy_response(steamspy_response)
-        app.update(data_from_steamspy)
+            if len(in_flight) >= WORKERS * 2 and not handle_finished(in_flight):
+                return stop_apps(in_flight)
 
-        # FETCH FROM STEAM
-        if tracker["steam_request_count"] + 1 > STEAM_REQUEST_LIMIT:
-            print("\nSteam request limit reached!")
-            break
+        while in_flight:
+            if not handle_finished(in_flight):
+                return stop_apps(in_flight)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return True
 
-        steam_response = fetchProxy("steam", app_id)
 
+def stop_apps(in_flight: dict) -> bool:
+    """Cancels apps of in_flight -> {future: app_id} that haven't started. Apps already running
+    are waited for and their results handled, their writes are committed so they're counted too.
+    Returns False.
+    """
+    for future in list(in_flight):
+        if future.cancel():
+            forget_app(in_flight.pop(future))
+    while in_flight:
+        handle_finished(in_flight)
+    return False
+
+
+def handle_finished(in_flight: dict) -> bool:
+    """Waits until an app of in_flight -> {future: app_id} is done, then handles results of all done apps.
+    Returns False if update should stop.
+    """
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    keep_going = True
+    for future in done:
+        keep_going = handle_result(in_flight.pop(future), future) and keep_going
+    return keep_going
+
+
+def handle_result(app_id: int, future) -> bool:
+    """Records result of process_app. Returns False if update should stop."""
+    status, steam_requests = future.result()
+    forget_app(app_id)
+
+    if status == "limit_reached":
+        print("\nSteam request limit reached!")
+        return False
+
+    if steam_requests:
         update_log["last_request_to_steam"] = get_datetime_str()
-        update_log["steam_request_count"] += 1
-        tracker["steam_request_count"] += 1
+    count_result(status, steam_requests)
+    metrics.count_app(status)
+    return True
+
+
+def skip_over_million(run_id: int, app_id: int, bulk_data: dict):
+    # Stored as its SteamSpy response, so replay() knows it's over million
+    raw_store.save("steamspy", app_id, json.dumps(bulk_data).encode())
+    write(write_group, [
+        (insert_app_over_million, (app_id, )),
+        (insert_exclusion, (app_id, "over_million", get_next_check("over_million"))),
+        (insert_app_update, (app_id, int(time.time()), None)),
+        (insert_journal_entry, (run_id, app_id, "over_million", 0))
+    ])
+    forget_app(app_id)
+    count_result("over_million", 0)
+    metrics.count_app("over_million")
+
+
+def schedule_apps(now: int, db):
+    """Sets refresh intervals of saved apps in update_queue, see get_refresh_interval()."""
+    query_scores = get_query_scores(QUERIES_DB_PATH, now)
+    intervals = [
+        (app_id, get_refresh_interval(owner_count, review_velocity, coming_soon, query_scores.get(app_id, 0)))
+        for app_id, owner_count, coming_soon, review_velocity in get_app_activity(db)
+    ]
+    insert_refresh_intervals(intervals, db)
+    daily_count = sum(1 for _, interval in intervals if interval == MIN_UPDATE_AGE)
+    print(f"Scheduled apps: {len(intervals):,} items ({daily_count:,} refreshed every {MIN_UPDATE_AGE // 3600} hours)")
+
+
+def get_refresh_interval(owner_count: int, review_velocity: float, coming_soon: bool, query_score: float) -> int:
+    """Returns seconds after which a saved app is due to be updated again.
+    It's MAX_REFRESH_INTERVAL halved for each point of the app's activity score (see ACTIVITY_WEIGHTS),
+    but not less than MIN_UPDATE_AGE.
+    """
+    score = (
+        ACTIVITY_WEIGHTS["owners"] * math.log10(1 + owner_count / 1000)
+        + ACTIVITY_WEIGHTS["reviews"] * math.log10(1 + review_velocity)
+        + ACTIVITY_WEIGHTS["queries"] * math.log10(1 + query_score)
+        + ACTIVITY_WEIGHTS["coming_soon"] * bool(coming_soon)
+    )
+    return max(MIN_UPDATE_AGE, int(MAX_REFRESH_INTERVAL / 2 ** score))
+
+
+def iter_planned_apps(run_id: int, shard: int = 0):
+    """Yields apps of shard's plan, see create_update_plan(). Apps are loaded PLAN_CHUNK_SIZE at a time,
+    with their app_updates, http_validators and tag_updates, so applist is never in memory as a whole.
+    """
+    after = (-2, 0)
+    while True:
+        with Connection(APPS_DB_PATH) as db:
+            chunk = get_planned_apps(run_id, after, PLAN_CHUNK_SIZE, db, shard)
+            app_ids = [app["app_id"] for app in chunk]
+            app_updates.update(get_app_updates(app_ids, db))
+            http_validators.update(get_http_validators(app_ids, db))
+            tag_updates.update(get_tag_updates(app_ids, db))
+
+        if not chunk:
+            return
+        yield from chunk
+        after = (chunk[-1]["update_key"], chunk[-1]["app_id"])
+
+
+def forget_app(app_id: int):
+    """Drops data loaded for app_id by iter_planned_apps(), once it's done."""
+    app_updates.pop(app_id, None)
+    tag_updates.pop(app_id, None)
+    for provider in ("steamspy", "steam"):
+        http_validators.pop((app_id, provider), None)
+
+
+def count_result(status: str, steam_requests: int):
+    if status not in STATUS_COUNTERS:
+        raise ValueError(f"Unexpected status value {status}, from process_app")
 
+    update_log["steam_request_count"] += steam_requests
+    tracker["steam_request_count"] += steam_requests
+    update_log[STATUS_COUNTERS[status]] = update_log.get(STATUS_COUNTERS[status], 0) + 1
+    tracker[STATUS_COUNTERS[status]] += 1
+
+
+def run_app(run_id: int, app_id: int, name: str, steam_budget: RequestBudget) -> tuple[str, int]:
+    """Runs process_app and writes its writes with app's journal entry as one group,
+    so they are committed together. Returns result of process_app.
+    """
+    app_writes.writes = []
+    try:
+        status, steam_requests = process_app(app_id, name, steam_budget)
+        writes = app_writes.writes
+    finally:
+        app_writes.writes = None
+
+    if status != "limit_reached":
+        writes.append((insert_journal_entry, (run_id, app_id, status, steam_requests)))
+    if writes:
+        write(write_group, writes)
+    return status, steam_requests
+
+
+def process_app(app_id: int, name: str, steam_budget: RequestBudget) -> tuple[str, int]:
+    """Fetches app from SteamSpy and Steam then saves it.
+    Runs in worker threads, so it doesn't touch update_log or tracker.
+    returns -> (status, number of requests made to Steam)
+
+    Apps in steamspy_bulk already passed the owner check, so Steam is requested first.
+    Games among them take SteamSpy's fields from their bulk listing entry and tags from
+    their stored app details, which is fetched again only if it's older than TAGS_MAX_AGE.
+
+    Apps that were saved before are requested with their stored validators.
+    If neither API has changed since, or app's content hash is the same as
+    the saved one, app is "unchanged" and only its update time is written.
+    If only one of them changed, the other one's last response is taken from raw_store.
+    """
+    # Create App
+    app = App({"app_id": app_id, "name": name})
+    validators = {
+        provider: dict(http_validators.get((app_id, provider), {})) for provider in ("steamspy", "steam")
+    }
+
+    # FETCH FROM STEAMSPY
+    steamspy_response = None
+    tags_fetched = app_id not in steamspy_bulk
+    if tags_fetched:
+        # Check owner count before using Steam's budget
+        steamspy_response = fetchProxy("steamspy", app_id, validators["steamspy"])
+        if steamspy_response is None:
+            return "failed_request", 0
+        if steamspy_response is not NOT_MODIFIED and get_min_owner_count(steamspy_response) > OWNER_LIMIT:
+            write(insert_app_over_million, app_id)
+            exclude(app_id, "over_million")
+            mark_updated(app_id)
+            return "over_million", 0
+
+    # FETCH FROM STEAM
+    if not steam_budget.take():
+        return "limit_reached", 0
+
+    steam_requests = 1
+    steam_response = fetchProxy("steam", app_id, validators["steam"])
+    if steam_response is None:
+        return "failed_request", steam_requests
+
+    if steamspy_response is None:
+        if steam_response is not NOT_MODIFIED and not is_game(steam_response):
+            status, _ = handle_steam_response(app_id, steam_response, app)
+            return status, steam_requests
+
+        steamspy_response = load_bulk_response(app_id, steamspy_bulk[app_id])
+        if steamspy_response is None:
+            tags_fetched = True
+            steamspy_response = fetchProxy("steamspy", app_id, validators["steamspy"])
+            if steamspy_response is None:
+                return "failed_request", steam_requests
+
+    if steamspy_response is NOT_MODIFIED and steam_response is NOT_MODIFIED:
+        mark_updated(app_id)
+        return "unchanged", steam_requests
+
+    # Only one of them changed, other one's data is needed to save the app.
+    # It's fetched again only if its last response isn't stored
+    if steamspy_response is NOT_MODIFIED:
+        steamspy_response = load_stored_response("steamspy", app_id)
+        if steamspy_response is None:
+            validators["steamspy"] = {}
+            steamspy_response = fetchProxy("steamspy", app_id, validators["steamspy"])
+            if steamspy_response is None:
+                return "failed_request", steam_requests
+    elif steam_response is NOT_MODIFIED:
+        steam_response = load_stored_response("steam", app_id)
         if steam_response is None:
-            update_log["failed_requests"] += 1
-            tracker["failed_requests"] += 1
-            continue
+            if not steam_budget.take():
+                return "limit_reached", steam_requests
+            steam_requests += 1
+            validators["steam"] = {}
+            steam_response = fetchProxy("steam", app_id, validators["steam"])
+            if steam_response is None:
+                return "failed_request", steam_requests
+
+    status, content_hash = save_app(app, steamspy_response, steam_response)
+    # Not counted in save_app(), replayed apps would record the time of the replay
+    if status == "updated":
+        count_reviews(app)
+    if status in ("updated", "unchanged"):
+        write(insert_http_validators, app_id, validators)
+        write(delete_failed_request, app_id)
+        write(delete_exclusion, app_id)
+        if tags_fetched:
+            write(insert_tag_update, app_id, int(time.time()))
+        mark_updated(app_id, content_hash)
+    elif status == "over_million":
+        mark_updated(app_id)
+
+    return status, steam_requests
+
+
+def load_bulk_response(app_id: int, bulk_entry: dict) -> [dict, None]:
+    """Returns app's stored SteamSpy app details with the fields of its bulk listing entry,
+    which is stored as its SteamSpy response, so replay() rebuilds app the same.
+    Returns None if its app details isn't stored or is older than TAGS_MAX_AGE.
+    """
+    if tag_updates.get(app_id, 0) < time.time() - TAGS_MAX_AGE:
+        return None
+    stored = load_stored_response("steamspy", app_id)
+    if stored is None or "tags" not in stored:
+        return None
+    response = dict(stored, **bulk_entry)
+    raw_store.save("steamspy", app_id, json.dumps(response).encode())
+    return response
 
-        status, data_from_steam = handle_steam_response(app_id, steam_response, app)
-        if status == "non_game_app":
-            update_log["non_game_apps"] += 1
-            tracker["non_game_apps"] += 1
-        elif status == "failed_request":
-            update_log["failed_requests"] += 1
-            tracker["failed_requests"] += 1
-        elif status == "updated":
-            app.update(data_from_steam)
 
-            with Connection(APPS_DB_PATH) as db:
-                insert_app(app, db)
-                db.execute("DELETE FROM failed_requests WHERE app_id == ?", (app_id, ))
+def load_stored_response(api_provider: str, app_id: int) -> [dict, None]:
+    """Returns app's last response from api_provider in raw_store, same as fetchProxy() returned it.
+    Returns None if it isn't stored.
+    """
+    body = raw_store.load_latest(api_provider, app_id) if raw_store is not None else None
+    if body is None:
+        return None
+    response = json.loads(body)
+    if api_provider == "steam":
+        return response.get(str(app_id))
+    return response
+
+
+def save_app(app: App, steamspy_response: dict, steam_response: dict) -> tuple[str, str]:
+    """Maps responses to app and saves it, unless its content hash is the same as the saved one.
+    returns -> (status, content hash of app if it's a game else None)
+    """
+    # Check minimum owner
+    if get_min_owner_count(steamspy_response) > OWNER_LIMIT:
+        write(insert_app_over_million, app.app_id)
+        exclude(app.app_id, "over_million")
+        return "over_million", None
+
+    # Update app info
+    data_from_steamspy = map_steamspy_response(steamspy_response)
+    app.update(data_from_steamspy)
+
+    status, data_from_steam = handle_steam_response(app.app_id, steam_response, app)
+    if status != "updated":
+        return status, None
+
+    app.update(data_from_steam)
+    content_hash = get_content_hash(app)
+    if content_hash == app_updates.get(app.app_id, {}).get("content_hash"):
+        return "unchanged", content_hash
+
+    write(insert_cached_app, app)
+    return "updated", content_hash
+
+
+def count_reviews(app: App):
+    """Records app's review count, so its review velocity is known when it's scheduled."""
+    reviews = (app.positive_reviews or 0) + (app.negative_reviews or 0)
+    write(insert_review_count, app.app_id, reviews, int(time.time()))
+
+
+def replay():
+    """Saves apps again from the last responses in raw store, without making any request.
+    Used to rebuild database after map_steam_data or map_steamspy_response changes.
+    """
+    print(f"Replaying responses from: {RAW_STORE_PATH}")
+    global db_writer
+    store = RawStore(RAW_STORE_PATH)
+    db_writer = start_db_writer()
+
+    counts = {}
+    try:
+        for app_id, bodies in store.latest():
+            responses = {provider: json.loads(body) for provider, body in bodies.items()}
+            status = replay_app(app_id, responses.get("steamspy"), responses.get("steam", {}).get(str(app_id)))
+            counts[status] = counts.get(status, 0) + 1
+            if sum(counts.values()) % 1000 == 0:
+                print(f"\rReplayed: {sum(counts.values()):,}", end="")
+    finally:
+        db_writer.close()
+        db_writer = None
+        store.close()
+
+    print(f"\nReplayed: {sum(counts.values()):,}")
+    for status, count in sorted(counts.items()):
+        print(f"{status:<15}: {count:,}")
+
+
+def replay_app(app_id: int, steamspy_response: [dict, None], steam_response: [dict, None]) -> str:
+    """Saves app from stored responses. Returns status, "incomplete" if a needed response isn't stored."""
+    if steamspy_response is not None and get_min_owner_count(steamspy_response) > OWNER_LIMIT:
+        write(insert_app_over_million, app_id)
+        exclude(app_id, "over_million")
+        return "over_million"
+
+    if steam_response is None:
+        return "incomplete"
+
+    # Applist isn't stored, names are taken from responses
+    if steam_response["success"] and "name" in steam_response["data"]:
+        name = steam_response["data"]["name"]
+    else:
+        name = (steamspy_response or {}).get("name", "")
+    app = App({"app_id": app_id, "name": name})
+
+    if steamspy_response is None:
+        # Apps in bulk listing that aren't games have no SteamSpy response
+        if is_game(steam_response):
+            return "incomplete"
+        status, _ = handle_steam_response(app_id, steam_response, app)
+        return status
+
+    status, _ = save_app(app, steamspy_response, steam_response)
+    if status == "updated":
+        write(delete_exclusion, app_id)
+    return status
+
+
+def mark_updated(app_id: int, content_hash: str = None):
+    """Records that app_id is up to date now. content_hash is kept if it's None."""
+    write(insert_app_update, app_id, int(time.time()), content_hash)
+
+
+def exclude(app_id: int, reason: str):
+    """Excludes app_id from planned apps until it's time to check it again, see EXCLUSION_RECHECK."""
+    write(insert_exclusion, app_id, reason, get_next_check(reason))
+
+
+def get_next_check(reason: str) -> int:
+    # Randomized, so apps excluded in the same run aren't all checked again in the same run
+    recheck = EXCLUSION_RECHECK[reason]
+    return int(time.time()) + random.randint(recheck // 2, recheck)
+
+
+def get_content_hash(app: App) -> str:
+    return hashlib.sha1(json.dumps(app.as_dict(), sort_keys=True).encode()).hexdigest()
+
+
+def start_db_writer() -> DBWriter:
+    """Loads dimension_cache and starts a DBWriter, which clears it if a write is rolled back."""
+    with Connection(APPS_DB_PATH) as db:
+        dimension_cache.load(db)
+    writer = DBWriter(APPS_DB_PATH, WRITE_BATCH_SIZE, WRITE_INTERVAL, on_rollback=dimension_cache.clear)
+    writer.start()
+    return writer
+
+
+def insert_cached_app(app: App, db):
+    """insert_app() with dimension_cache, written by db_writer."""
+    insert_app(app, db, dimension_cache)
+
+
+def write(func, *args):
+    """Calls func(*args, db). Inside run_app() it's added to app's writes,
+    otherwise handed to db_writer if main() is running,
+    or written right away (e.g. when used by diagnostics.py).
+    """
+    writes = getattr(app_writes, "writes", None)
+    if writes is not None:
+        writes.append((func, args))
+    elif db_writer is not None:
+        db_writer.submit(func, *args)
+    else:
+        with Connection(APPS_DB_PATH) as db:
+            func(*args, db)
 
-            update_log["updated_apps"] += 1
-            tracker["updated_apps"] += 1
-        else:
-            raise ValueError(f"Unexpected status value {status}, from handle_steam_response")
 
+def write_group(writes: list, db):
+    """Calls each func(*args, db) of writes -> [(func, args), ...]"""
+    for func, args in writes:
+        func(*args, db)
 
 
-def fetchProxy(api_provider: str, app_id: int) -> dict:
+def fetchProxy(api_provider: str, app_id: int, validators: dict = None) -> dict:
+    """Fetches app details of app_id from api_provider.
+    See fetch() for validators. Returns None if request failed.
+    """
     if api_provider == "steam":
         api_base = STEAM_APP_DETAILS_API_BASE
     elif api_provider == "steamspy":
@@ -205,7 +873,12 @@ def fetchProxy(api_provider: str, app_id: int) -> dict:
     api = api_base + str(app_id)
 
     try:
-        response = fetch(api)
+        LIMITERS[api_provider].acquire()
+        response = fetch(api, validators, api_provider)
+        if response is NOT_MODIFIED:
+            return response
+        if raw_store is not None:
+            raw_store.save(api_provider, app_id, json.dumps(response).encode())
         if api_provider == "steam":
             return response[str(app_id)]
 
@@ -214,37 +887,51 @@ def fetchProxy(api_provider: str, app_id: int) -> dict:
     except Exception as e:
         error_name = type(e).__name__
 
-        with Connection(APPS_DB_PATH) as db:
-            if issubclass(type(e), FetchError) and not isinstance(e, RequestTimeoutError):
-                status_code = e.response.status_code
-            else:
-                status_code = None
-                debug_log({
-                    "error": error_name,
-                    "url": api,
-                    "traceback": traceback.format_exc()
-                })
+        if issubclass(type(e), FetchError) and not isinstance(e, RequestTimeoutError):
+            status_code = e.response.status_code
+        else:
+            status_code = None
+            debug_log({
+                "error": error_name,
+                "url": redact_url(api),
+                "traceback": redact_url(traceback.format_exc())
+            })
 
-            insert_failed_request(app_id, api_provider, error_name, status_code, db)
+        write(insert_failed_request, app_id, api_provider, error_name, status_code)
+        metrics.count_error(api_provider, error_name)
 
-        print(f"\nError: {error_name} | Code: {status_code} | URL: {api}\nSkipping...")
+        print(f"\nError: {error_name} | Code: {status_code} | URL: {redact_url(api)}\nSkipping...")
         return None
 
 
-def fetch(api: str) -> dict:
-    """Makes a request to an API and returns JSON. If request fails will raise Exeception."""
+def fetch(api: str, validators: dict = None, api_provider: str = None) -> dict:
+    """Makes a request to an API and returns JSON. If request fails will raise Exeception.
+    If validators is given, request is conditional on them and NOT_MODIFIED is
+    returned when server responds with 304. validators is updated with the response's.
+    api_provider's limiter is told how server responded and requests are timed as api_provider's.
+    """
+    limiter = LIMITERS.get(api_provider)
+    headers = conditional_headers(validators) if validators else None
     attempt = 0
     while attempt < 2:
-        response = attempt_request(api)
+        response = attempt_request(api, headers, api_provider)
         msg = {
             "status_code": response.status_code,
-            "url": response.url,
+            "url": redact_url(response.url),
             "headers": response.headers,
             "text": response.text
         }
 
         if response.status_code == requests.codes.ok:
+            if limiter is not None:
+                limiter.succeeded()
+            if validators is not None:
+                validators.update(get_validators(response))
             return response.json()
+        elif response.status_code == requests.codes.not_modified and headers:
+            if limiter is not None:
+                limiter.succeeded()
+            return NOT_MODIFIED
         elif 400 <= response.status_code < 500:
             debug_log(msg)
 
@@ -256,13 +943,22 @@ def fetch(api: str) -> dict:
                 raise NotFoundError(response, update_log)
             elif response.status_code == 429:
                 attempt += 1
-                print(f"\nHTTPError: 429 - Too Many Requests | URL: {response.url}")
-                print("Waiting 30 secs...")
-                time.sleep(30)
+                retry_after = get_retry_after(response)
+                wait = TOO_MANY_REQUESTS_WAIT if retry_after is None else retry_after
+                print(f"\nHTTPError: 429 - Too Many Requests | URL: {redact_url(response.url)}")
+                print(f"Waiting {wait:.0f} secs...")
+                # Limiter waits for all requests to the provider, not only this one
+                if limiter is not None:
+                    limiter.throttled(wait)
+                    limiter.acquire()
+                else:
+                    time.sleep(wait)
                 print("Trying again...")
                 continue
         elif 500 <= response.status_code < 600:
             debug_log(msg)
+            if limiter is not None:
+                limiter.throttled(get_retry_after(response))
             # Raise error cuz dont know how to handle it
             raise ServerError(response, update_log)
         else:
@@ -273,10 +969,11 @@ def fetch(api: str) -> dict:
     raise TooManyRequestsError(response, update_log)
 
 
-def attempt_request(api: str):
+def attempt_request(api: str, headers: dict = None, api_provider: str = None):
     """
     Tries 3 times before raising TimeoutError
     If a connection error occurs tries to connect infinitely
+    Each try is timed in metrics as api_provider's, "other" if it's None
     """
     attempt = 1
     attempt_wait = 5
@@ -284,17 +981,22 @@ def attempt_request(api: str):
     connection_errors = 0
     # 60 sec * 10 = 10 mins
     connection_error_limit = 60
+    api_provider = api_provider or "other"
 
     while attempt <= 3:
+        start = time.perf_counter()
         try:
-            response = requests.get(api, timeout=REQUEST_TIMEOUT)
+            response = http_client.get(api, headers)
+            metrics.observe_request(api_provider, time.perf_counter() - start, str(response.status_code))
             return response
         except requests.Timeout:
-            logging.debug(f"Request Timed Out: {api}")
+            metrics.observe_request(api_provider, time.perf_counter() - start, "Timeout")
+            logging.debug(f"Request Timed Out: {redact_url(api)}")
             logging.debug(f"Attempt: {attempt}")
             time.sleep(attempt * attempt_wait)
             attempt += 1
         except requests.exceptions.ConnectionError as connection_error:
+            metrics.observe_request(api_provider, time.perf_counter() - start, "ConnectionError")
             if connection_errors == 0:
                 print("")
             connection_errors += 1
@@ -310,86 +1012,124 @@ def attempt_request(api: str):
     raise RequestTimeoutError(update_log)
 
 
+def is_game(steam_response: dict) -> bool:
+    return steam_response["success"] and steam_response["data"]["type"] == "game"
+
+
 def handle_steam_response(app_id, steam_response, app_details):
     """Handles Steam Response and inserts app"""
     if steam_response["success"]:
         steam_data = steam_response["data"]
         # Check if app is a game
         if steam_data["type"] != "game":
-            with Connection(APPS_DB_PATH) as db:
-                insert_non_game_app(app_id, db)
+            write(insert_non_game_app, app_id)
+            exclude(app_id, "non_game_app")
             return "non_game_app", None
         else:
             app_details_from_steam = map_steam_data(steam_data)
             return "updated", app_details_from_steam
     else:
-        with Connection(APPS_DB_PATH) as db:
-            insert_failed_request(app_id, "steam", "failed", None, db)
+        write(insert_failed_request, app_id, "steam", "failed", None)
+        exclude(app_id, "failed")
         return "failed_request", None
 
 
-def fetch_applist(api: str):
-    """Steam's response format: {
+def sync_applist():
+    """Saves Steam's applist to applist table page by page.
+    Only apps modified since the last sync are requested.
+    """
+    if not STEAM_API_KEY:
+        sync_applist_v2()
+        return
+
+    with Connection(APPS_DB_PATH) as db:
+        if_modified_since = get_applist_last_modified(db)
+
+    print(f"Syncing applist modified since: {if_modified_since}")
+    last_appid = 0
+    synced = 0
+    while True:
+        api = (
+            f"{APPLIST_API}?key={STEAM_API_KEY}&if_modified_since={if_modified_since}"
+            f"&last_appid={last_appid}&max_results={APPLIST_PAGE_SIZE}"
+        )
+        response = fetch(api, api_provider="steam_applist")["response"]
+        apps = [(app["appid"], app["name"], app["last_modified"]) for app in response.get("apps", []) if app["name"]]
+        with Connection(APPS_DB_PATH) as db:
+            insert_applist_page(apps, db)
+
+        synced += len(apps)
+        print(f"\rSynced apps: {synced:,}", end="")
+        if not response.get("have_more_results"):
+            break
+        last_appid = response["last_appid"]
+    print("")
+
+
+def sync_applist_v2():
+    """Saves Steam's whole applist from APPLIST_V2_API, which can't be paged.
+    Steam's response format: {
         'applist': {
             'apps': [
                 {appid: int, name: str}
             ]
         }"""
-
-    update_log["last_request_to_steam"] = get_datetime_str()
-    response_json = fetch(api)
-    applist = []
-
-    # Save each app that has a name
-    for app in response_json["applist"]["apps"]:
-        if app["name"]:
-            applist.append(
-                {
-                    "app_id": app["appid"],
-                    "name": app["name"]
-                }
+    print(f"Fetching applist from: {APPLIST_V2_API}")
+    apps = fetch(APPLIST_V2_API, api_provider="steam_applist")["applist"]["apps"]
+    with Connection(APPS_DB_PATH) as db:
+        for i in range(0, len(apps), APPLIST_PAGE_SIZE):
+            # Save each app that has a name
+            insert_applist_page(
+                [(app["appid"], app["name"], None) for app in apps[i:i + APPLIST_PAGE_SIZE] if app["name"]], db
             )
-    return applist
 
 
-def load_applist() -> dict:
-    print("Checking if applist already fetched...")
-    if update_log["applist_fetched"]:
-        print("Applist alredy fetched!")
-    else:
-        print(f"Fetching applist from: {APPLIST_API}")
-
-        applist = fetch_applist(APPLIST_API)
-
-        # Save to File
-        print("Saving applist...")
-        save_json(applist, APPLIST_FILE)
-        update_log["applist_fetched"] = True
-
-    with open(APPLIST_FILE, "r") as f:
-        applist = json.load(f)
-
-    return applist
-
+def load_steamspy_bulk() -> tuple[dict, dict]:
+    """Loads SteamSpy's bulk listing page by page, until an empty page.
+    If a page fails, stops there. Apps that aren't loaded are requested one by one.
+    returns -> ({app_id: STEAMSPY_BULK_FIELDS of bulk listing entry} of apps under OWNER_LIMIT,
+                {app_id: bulk listing entry} of apps over OWNER_LIMIT)
+    """
+    under_million = {}
+    over_million = {}
+    page = 0
+    while True:
+        api = STEAMSPY_ALL_API_BASE + str(page)
+        try:
+            LIMITERS["steamspy_bulk"].acquire()
+            response = fetch(api, api_provider="steamspy_bulk")
+        except Exception as e:
+            metrics.count_error("steamspy_bulk", type(e).__name__)
+            print(f"\nError: {type(e).__name__} | URL: {api}\nStopping bulk listing at page {page}...")
+            break
 
-def get_apps_to_ignore() -> list:
-    apps_to_ignore = []
+        if not response:
+            break
 
-    with Connection(APPS_DB_PATH) as db:
-        non_game_apps = get_non_game_apps(db)
-        failed_requests = get_failed_requests("WHERE error == 'failed'", db)
+        under, over = split_by_owner_count(response)
+        for app_id in under:
+            entry = response[str(app_id)]
+            under_million[app_id] = {key: entry[key] for key in STEAMSPY_BULK_FIELDS if key in entry}
+        over_million.update({app_id: response[str(app_id)] for app_id in over})
+        page += 1
+        print(f"\rPages: {page} | Apps: {len(under_million) + len(over_million):,}", end="")
 
-    if failed_requests:
-        # Get only app_ids
-        failed_list = [i["app_id"] for i in failed_requests]
-        for _id in failed_list:
-            apps_to_ignore.append(_id)
+    return under_million, over_million
 
-    if non_game_apps:
-        for _id in non_game_apps:
-            apps_to_ignore.append(_id)
 
-    return apps_to_ignore
+def split_by_owner_count(page: dict) -> tuple[set, set]:
+    """Splits apps of a SteamSpy bulk listing page by OWNER_LIMIT.
+    page -> {app_id: {'owners': str, ...}, ...}
+    returns -> (app_ids under OWNER_LIMIT, app_ids over OWNER_LIMIT)
+    """
+    under_million = set()
+    over_million = set()
+    for app_id, app_details in page.items():
+        if get_min_owner_count(app_details) > OWNER_LIMIT:
+            over_million.add(int(app_id))
+        else:
+            under_million.add(int(app_id))
+    return under_million, over_million
 
 
 def map_steam_data(steam_data: dict) -> dict:
@@ -598,10 +1338,27 @@ def debug_log(msg: dict):
         f.write("\n||======================================================||\n")
 
 
-def update_history(msg: str):
-    with open(UPDATE_HISTORY_LOG_PATH, "a") as f:
-        f.write(msg)
-        f.write("\n||======================================================||\n")
+def update_history(record: dict):
+    """Appends record of an update run to UPDATE_HISTORY_PATH as a json line"""
+    with open(UPDATE_HISTORY_PATH, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def create_history_record(state: str, run_time: float, worker: str = None, error: str = None) -> dict:
+    """Returns record of this update run for update_history().
+    state -> "successful", "failed" or "interrupted"
+    """
+    return {
+        "state": state,
+        "worker": worker,
+        "finished_at": get_datetime_str(),
+        "run_time": round(run_time, 3),
+        "applist_length": update_log["applist_length"],
+        "remaining_length": update_log["remaining_length"],
+        "counters": dict(tracker),
+        "metrics": metrics.snapshot(),
+        "error": error
+    }
 
 
 def create_output(update_log, run_time, traceback=None):
@@ -611,7 +1368,7 @@ def create_output(update_log, run_time, traceback=None):
 
     if traceback:
         state = "Update Failed"
-        traceback_section = f"\nUpdate failed due to an error:\n{traceback.format_exc()}"
+        traceback_section = f"\nUpdate failed due to an error:\n{redact_url(traceback.format_exc())}"
     else:
         state = "Update Successful"
         traceback_section = ""
@@ -628,8 +1385,9 @@ Non-Game Apps     : {tracker["non_game_apps"]:,}
 Ignored Apps      : {tracker["ignored_apps"]:,}
 Failed Requests   : {tracker["failed_requests"]:,}
 Apps Over Million : {tracker["apps_over_million"]:,}
+Unchanged Apps    : {tracker["unchanged_apps"]:,}
 ---------------------------------------------
-Total Iterations: {tracker["updated_apps"] + tracker["non_game_apps"] + tracker["failed_requests"] + tracker["apps_over_million"] + tracker["ignored_apps"]:,}
+Total Iterations: {tracker["updated_apps"] + tracker["non_game_apps"] + tracker["failed_requests"] + tracker["apps_over_million"] + tracker["ignored_apps"] + tracker["unchanged_apps"]:,}
 {traceback_section}"""
 
 
@@ -640,15 +1398,42 @@ if __name__ == "__main__":
     time_passed = now - last_request_to_steam
     a_day = datetime.timedelta(hours=24)
 
+    usage = (
+        "Use '--ignore-timer' to skip safety check for last request to Steam.\n"
+        "Use '--replay' to save apps again from stored responses, without making any request.\n"
+        "Use '--worker NAME' to update with other workers, each one started with a different NAME.\n"
+    )
     ignore_timer = False
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        # Workers share their progress through database, update_log.json is left to single process updates
+        start_time = time.time()
+        record = None
+        try:
+            run_worker(sys.argv[2])
+            record = create_history_record("successful", subtract_times(time.time(), start_time), sys.argv[2])
+        except Exception:
+            print(redact_url(traceback.format_exc()))
+            record = create_history_record(
+                "failed", subtract_times(time.time(), start_time), sys.argv[2], redact_url(traceback.format_exc())
+            )
+        except KeyboardInterrupt:
+            record = create_history_record("interrupted", subtract_times(time.time(), start_time), sys.argv[2])
+        finally:
+            if record is not None:
+                update_history(record)
+        exit(0)
+
     if len(sys.argv) == 2:
         if sys.argv[1] == "-h":
-            print("Use '--ignore-timer' to skip safety check for last request to Steam.\n")
+            print(usage)
             exit(0)
         elif sys.argv[1] == "--ignore-timer":
             ignore_timer = True
+        elif sys.argv[1] == "--replay":
+            replay()
+            exit(0)
         else:
-            print("Use '--ignore-timer' to skip safety check for last request to Steam.\n")
+            print(usage)
             exit(0)
 
     if not ignore_timer:
@@ -668,32 +1453,34 @@ if __name__ == "__main__":
     ul = update_log
     start_time = time.time()
     output = ""
+    record = None
     try:
         main()
         run_time = subtract_times(time.time(), start_time)
         output = create_output(ul, run_time)
+        record = create_history_record("successful", run_time)
         ul["reset_log"] = True
 
     except Exception as e:
         run_time = subtract_times(time.time(), start_time)
         output = create_output(ul, run_time, traceback=traceback)
+        record = create_history_record("failed", run_time, error=redact_url(traceback.format_exc()))
 
     except KeyboardInterrupt:
         run_time = subtract_times(time.time(), start_time)
         output = create_output(ul,  run_time)
+        record = create_history_record("interrupted", run_time)
 
     finally:
-        update_history(output)
+        if record is not None:
+            update_history(record)
         print(f"\n\n{output}")
 
         run_time = subtract_times(time.time(), start_time)
-        ul["applist_index"] += tracker["last_index"]
-        ul["remaining_length"] = ul["applist_length"] - ul["remaining_length"]
         update_logger.save()
 
         print(f"||=== End Date  : {get_datetime_str()} ===||")
         print(f"--> Run Time            : {run_time:.1f} hours")
         print(f"--> Total Steam Requests: {ul['steam_request_count']}")
         print(f"--> Total Apps Ignored  : {ul['ignored_apps']}")
-        print(f"--> Recording applist_index as : {ul['applist_index']}")
         print()
@@ -1,21 +1,25 @@
 """Manages update_log"""
+import os
 import json
+import threading
 
 DEFAULT_LOG = {
     "last_request_to_steam": "2000-01-01 00:00",
     "reset_log": False,
-    "applist_fetched": False,
     "applist_length": 0,
     "remaining_length": 0,
-    "applist_index": 0,
     "steam_request_count": 0,
     "updated_apps": 0,
     "non_game_apps": 0,
     "ignored_apps": 0,
     "failed_requests": 0,
-    "apps_over_million": 0
+    "apps_over_million": 0,
+    "unchanged_apps": 0
 }
 
+# Shared by all loggers, errors.py and update.py each have one for the same file
+_save_lock = threading.Lock()
+
 
 class UpdateLogger:
     """On init loads file.
@@ -39,8 +43,15 @@ class UpdateLogger:
         return log
 
     def save(self):
-        with open(self.file, "w") as f:
-            json.dump(self.log, f, indent=2)
+        """Writes log to file. Thread safe, fetch errors save it from worker threads
+        while the main thread updates it, so it's copied first and file is replaced as a whole.
+        """
+        with _save_lock:
+            data = json.dumps(dict(self.log), indent=2)
+            temp_path = f"{self.file}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(data)
+            os.replace(temp_path, self.file)
 
     def _reset_log(self):
         # Don't reset last request date
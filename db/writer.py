@@ -0,0 +1,139 @@
+"""Single writer thread for the updater"""
+import time
+import queue
+import sqlite3
+import threading
+import traceback
+
+# Queued to stop the writer
+STOP = object()
+
+
+class WriterError(Exception):
+    """Raised when writes are handed to a DBWriter that stopped because of an error"""
+
+
+class DBWriter(threading.Thread):
+    """Writes to database from one thread, so fetching threads never wait for disk.
+    Writes are functions called as func(*args, db). They are committed together
+    in one transaction every 'batch_size' writes or 'interval' seconds.
+    Each write runs in its own savepoint, a failing write is rolled back alone.
+    on_rollback is called after a failed write is rolled back, e.g. to drop caches of written rows.
+    'timeout' is seconds to wait for other processes writing to the same database.
+
+    If beginning, committing or rolling back a transaction fails (e.g. database stays locked),
+    the uncommitted batch is rolled back and the thread stops. 'error' is set to the exception,
+    writes after it are dropped and submit(), flush() and close() raise WriterError.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, interval: float = 5, on_rollback=None, timeout: float = 60):
+        super().__init__(name="DBWriter", daemon=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_rollback = on_rollback
+        self.timeout = timeout
+
+        self.writes = 0
+        self.failed_writes = 0
+        self.commits = 0
+        self.error = None
+        self._queue = queue.Queue()
+
+    def submit(self, func, *args):
+        self._check_error()
+        self._queue.put((func, args))
+
+    @property
+    def queue_size(self) -> int:
+        """Number of writes waiting to be written"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Blocks until everything submitted before is committed."""
+        self._check_error()
+        done = threading.Event()
+        self._queue.put((done, None))
+        # Thread may stop before it gets to done
+        while not done.wait(1) and self.is_alive():
+            pass
+        self._check_error()
+
+    def close(self):
+        """Commits remaining writes and stops the thread."""
+        self._queue.put((STOP, None))
+        self.join()
+        self._check_error()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise WriterError(f"Writer stopped, its uncommitted writes are lost: {self.error!r}") from self.error
+
+    def run(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout)
+        db = con.cursor()
+        pending = 0
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    func, args = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    func, args = None, None
+
+                if func is not None and args is not None:
+                    if not con.in_transaction:
+                        db.execute("BEGIN")
+                        deadline = time.monotonic() + self.interval
+                    self._write(func, args, db)
+                    pending += 1
+
+                # Commit on batch size, interval, flush and stop
+                if pending and (func is None or args is None or pending >= self.batch_size
+                                or time.monotonic() >= deadline):
+                    con.commit()
+                    self.commits += 1
+                    pending = 0
+                    deadline = None
+
+                if isinstance(func, threading.Event):
+                    func.set()
+                elif func is STOP:
+                    break
+        except Exception as e:
+            self.error = e
+            print(f"\nWriter stopped:\n{traceback.format_exc()}")
+            try:
+                con.rollback()
+            except sqlite3.Error:
+                pass
+            if self.on_rollback is not None:
+                self.on_rollback()
+            self._drain()
+        finally:
+            con.close()
+
+    def _drain(self):
+        """Drops queued writes and wakes up threads waiting in flush()."""
+        while True:
+            try:
+                func, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(func, threading.Event):
+                func.set()
+
+    def _write(self, func, args, db):
+        db.execute("SAVEPOINT write")
+        try:
+            func(*args, db)
+            db.execute("RELEASE write")
+            self.writes += 1
+        except Exception:
+            db.execute("ROLLBACK TO write")
+            db.execute("RELEASE write")
+            self.failed_writes += 1
+            if self.on_rollback is not None:
+                self.on_rollback()
+            print(f"\nWrite failed: {getattr(func, '__name__', func)}{args}\n{traceback.format_exc()}")
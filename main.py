@@ -1,7 +1,8 @@
 """Web API for Steam apps database"""
 import time
+import atexit
 import json
-import sqlite3
+import hashlib
 from flask import (
     Flask,
     request,
@@ -23,42 +24,65 @@ try:
         get_applist,
         Connection,
         APPS_DB_PATH,
+        QUERIES_DB_PATH,
         get_failed_requests,
         get_non_game_apps,
-        load_tag_list, load_genre_list, load_category_list
+        encode_cursor, with_tiebreaker,
+        QUERY_PLANS
     )
 
     from .db.appdata import (
         App,
         AppSnippet
     )
+    from .db.snapshot import SnapshotReloader
+    from .db.queries import QueryRecorder
+    from .cache import ResponseCache, EncodedResponse, send_encoded
 except ImportError:
     from db.database import (
         get_app,
         get_applist,
         Connection,
         APPS_DB_PATH,
+        QUERIES_DB_PATH,
         get_failed_requests,
         get_non_game_apps,
-        load_tag_list, load_genre_list, load_category_list
+        encode_cursor, with_tiebreaker,
+        QUERY_PLANS
     )
 
     from db.appdata import (
         App,
         AppSnippet
     )
-
-# Load db into memory
-source = sqlite3.connect(APPS_DB_PATH, check_same_thread=False, uri=True)
-MEMORY_CON = sqlite3.connect(':memory:', check_same_thread=False)
-source.backup(MEMORY_CON)
-source.close()
-
-
-APP_COUNT = MEMORY_CON.cursor().execute("SELECT COUNT(*) from apps").fetchone()[0]
-TAG_LIST = load_tag_list(MEMORY_CON)
-GENRE_LIST = load_genre_list(MEMORY_CON)
-CATEGORY_LIST = load_category_list(MEMORY_CON)
+    from db.snapshot import SnapshotReloader
+    from db.queries import QueryRecorder
+    from cache import ResponseCache, EncodedResponse, send_encoded
+
+# Load db into memory, reloaded in background when app data in apps.db changes
+RELOAD_INTERVAL = 60
+# Max number of threads reading the snapshot at the same time
+READ_POOL_SIZE = 8
+# Keep only columns /GetAppList needs in memory, app details are read from apps.db
+HOT_SNAPSHOT = True
+SNAPSHOTS = SnapshotReloader(APPS_DB_PATH, RELOAD_INTERVAL, READ_POOL_SIZE, HOT_SNAPSHOT)
+SNAPSHOTS.start()
+
+# Apps queried from /GetAppDetails and /GetAppDetailsBatch are counted,
+# the updater refreshes apps clients query more often. Counts are saved every QUERIES_FLUSH_INTERVAL seconds
+QUERIES_FLUSH_INTERVAL = 60
+QUERIES = QueryRecorder(QUERIES_DB_PATH, QUERIES_FLUSH_INTERVAL)
+QUERIES.start()
+# Counts recorded since the last flush are saved when the server exits
+atexit.register(QUERIES.stop)
+
+# Max number of apps /GetAppDetailsBatch returns
+BATCH_LIMIT = 50
+
+APPLIST_CACHE_SIZE = 512
+APPLIST_CACHE = ResponseCache(APPLIST_CACHE_SIZE)
+# Responses of endpoints that only change with the snapshot
+STATIC_CACHE = ResponseCache(16)
 
 init_colorama(autoreset=True)
 
@@ -86,12 +110,12 @@ def index():
 def app_details(app_id):
     start = time.perf_counter()
 
-    with Connection(APPS_DB_PATH) as db:
-        app = get_app(app_id, db)
-        if app:
-            return app.json(indent=None)
-        else:
-            return abort(404)
+    app = SNAPSHOTS.current.get_apps([app_id]).get(app_id)
+    if app:
+        QUERIES.record([app_id])
+        return app.json(indent=None)
+    else:
+        return abort(404)
 
     stop = time.perf_counter()
 
@@ -99,6 +123,34 @@ def app_details(app_id):
     return app
 
 
+@app.route("/GetAppDetailsBatch")
+# @sql_limit
+def app_details_batch():
+    """Returns details of many apps at once.
+    returns -> {"apps": {app_id: details}, "missing": [app_id, ...]}
+    """
+    try:
+        app_ids = str_to_list(request.args.get("app_ids", default=""))
+    except ValueError as e:
+        print(color.RED + type(e).__name__ + ": " + str(e))
+        abort(400)
+
+    # Remove duplicates but keep the order
+    app_ids = list(dict.fromkeys(app_ids))
+    if len(app_ids) > BATCH_LIMIT:
+        abort(400, description=f"Error: Number of app_ids cannot be greater than {BATCH_LIMIT}")
+
+    apps = SNAPSHOTS.current.get_apps(app_ids)
+    QUERIES.record(list(apps))
+
+    # Same encoding as App.json(), so each app's details match /GetAppDetails
+    body = json.dumps({
+        "apps": {str(i): apps[i].as_dict() for i in app_ids if i in apps},
+        "missing": [i for i in app_ids if i not in apps]
+    })
+    return Response(body, mimetype="application/json")
+
+
 @app.route("/GetAppList", methods=['GET'])
 # @sql_limit
 def app_list():
@@ -127,6 +179,11 @@ def app_list():
     release_date = args.get("release_date", default=None)
     rating = args.get("rating", default=None)
 
+    # Keyset pagination, passing cursor (even empty) replaces index
+    cursor = args.get("cursor", default=None)
+    if cursor is not None:
+        index = 0
+
     if release_date:
         release_date = [i.strip() for i in release_date.split(',')]
     if rating:
@@ -140,12 +197,20 @@ def app_list():
         print(color.RED + e.name + ": " + e.description)
         abort(400)
 
+    snapshot = SNAPSHOTS.current
+    cache_key = applist_cache_key(filters, order, coming_soon, release_date, rating, index, limit, cursor)
+    encoded = APPLIST_CACHE.get(cache_key, snapshot.version)
+    if encoded is not None:
+        return send_encoded(encoded)
+
     start = time.perf_counter()
 
     try:
-        app_list = get_applist(
-            filters, order, coming_soon, release_date, rating, index, limit, MEMORY_CON.cursor()
-        )
+        with snapshot.pool.connection() as db:
+            app_list = get_applist(
+                filters, order, coming_soon, release_date, rating, index, limit, db,
+                snapshot.dimensions, snapshot.filter_index, cursor
+            )
     except (ValueError, TypeError) as e:
         print(color.RED + type(e).__name__ + ": " + str(e))
         abort(400)
@@ -159,29 +224,53 @@ def app_list():
                 continue
             tags = [i["id"] for i in tag_list]
 
+    if cursor is not None:
+        next_cursor = None
+        if app_list and len(app_list) == limit:
+            next_cursor = encode_cursor(app_list[-1], order)
+        response = jsonify({"apps": app_list, "next_cursor": next_cursor})
+    else:
+        response = jsonify(app_list)
 
-    return jsonify(app_list)
+    key_digest = hashlib.blake2b(repr(cache_key).encode(), digest_size=8).hexdigest()
+    encoded = EncodedResponse(response.get_data(), f"{snapshot.version}-{key_digest}")
+    APPLIST_CACHE.set(cache_key, snapshot.version, encoded)
+    return send_encoded(encoded)
 
 
 @app.route("/GetAppCount")
 # @sql_limit
 def app_count():
-    return jsonify(APP_COUNT)
+    return send_static("app_count")
 
 
 @app.route("/GetTagList")
 def get_tag_list():
-    return jsonify(TAG_LIST)
+    return send_static("tag_list")
 
 
 @app.route("/GetGenreList")
 def get_genre_list():
-    return jsonify(GENRE_LIST)
+    return send_static("genre_list")
 
 
 @app.route("/GetCategoryList")
 def get_category_list():
-    return jsonify(CATEGORY_LIST)
+    return send_static("category_list")
+
+
+@app.route("/GetStats")
+def get_stats():
+    snapshot = SNAPSHOTS.current
+    return jsonify({
+        "snapshot": {"version": snapshot.version, "reload_count": SNAPSHOTS.reload_count},
+        "read_pool": snapshot.pool.stats(),
+        "details_pool": snapshot.details_pool.stats(),
+        "applist_cache": APPLIST_CACHE.stats(),
+        "static_cache": STATIC_CACHE.stats(),
+        "query_plans": QUERY_PLANS.stats(),
+        "queries": QUERIES.stats()
+    })
 
 
 @app.errorhandler(HTTPException)
@@ -197,6 +286,17 @@ def handle_exception(e):
     return response
 
 
+def send_static(name: str):
+    """Sends snapshot attribute as json, encoded once per snapshot."""
+    snapshot = SNAPSHOTS.current
+    encoded = STATIC_CACHE.get(name, snapshot.version)
+    if encoded is None:
+        body = jsonify(getattr(snapshot, name)).get_data()
+        encoded = EncodedResponse(body, f"{snapshot.version}-{name}")
+        STATIC_CACHE.set(name, snapshot.version, encoded)
+    return send_encoded(encoded)
+
+
 def str_to_list(param: str):
     if param:
         return [int(i) for i in param.split(",")]
@@ -204,6 +304,22 @@ def str_to_list(param: str):
         return []
 
 
+def applist_cache_key(filters, order, coming_soon, release_date, rating, index, limit, cursor) -> tuple:
+    """Returns the same key for requests that have the same result.
+    Filter ids are sorted and deduplicated, app_id is appended to order like get_applist() does.
+    """
+    return (
+        tuple(tuple(sorted(set(filters[f]))) for f in ("tags", "genres", "categories")),
+        tuple(with_tiebreaker(order).items()),
+        coming_soon,
+        tuple(release_date) if release_date else None,
+        tuple(rating) if rating else None,
+        index,
+        limit,
+        cursor
+    )
+
+
 def parse_order_params(order_params) -> dict:
     order = {}
     i = 0
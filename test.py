@@ -1,16 +1,57 @@
+import io
+import os
+import sys
+import gzip
 import json
+import time
 import unittest
 import sqlite3
+import tempfile
+import subprocess
+import threading
+import logging
+import contextlib
+from unittest import mock
+
+import requests
+from flask import Flask
 
 from db.database import (
     init_db, get_applist, Connection, insert_app,
     check_filters, check_order, check_release_date,
     build_filters_sql, build_order_sql, build_release_date_sql,
-    build_coming_soon_sql, build_combined_sql, get_tags, get_app_ids
+    build_coming_soon_sql, build_combined_sql, get_tags, get_app_ids,
+    get_genres, get_categories, hydrate_applist, load_dimensions,
+    encode_cursor, decode_cursor, QUERY_PLANS, get_app, get_apps,
+    start_update_run, finish_update_run, insert_journal_entry,
+    insert_applist_page, insert_app_update, insert_non_game_app, get_planned_apps, create_update_plan,
+    DimensionCache, insert_failed_request, insert_exclusion, delete_exclusion, init_exclusions,
+    count_ignored_apps, count_rechecked_apps,
+    APPLIST_SHARD, get_shard, create_shards, lease_shard, renew_shard_lease, release_shard, count_unfinished_shards,
+    insert_review_count, insert_refresh_intervals
     )
 from db.appdata import App, AppSnippet
+from db.filter_index import FilterIndex
+from db.http_client import HTTPClient, conditional_headers, get_retry_after, redact_url
+from db.ratelimit import TokenBucket, AdaptiveTokenBucket
+from db.metrics import Histogram, UpdateMetrics, to_prometheus
+from db.raw_store import RawStore
+from db.writer import DBWriter, WriterError
+from db.pool import ReadPool
+from db.update_logger import UpdateLogger, DEFAULT_LOG
+from db.snapshot import Snapshot, SnapshotReloader, get_snapshot_version
+from db.queries import QueryRecorder, get_query_scores
+from cache import ResponseCache, EncodedResponse, send_encoded
+
+from db import update, errors
+from db.update import (
+    format_date, split_by_owner_count, map_steam_data, map_steamspy_response,
+    get_refresh_interval, MIN_UPDATE_AGE, MAX_REFRESH_INTERVAL
+)
 
-from db.update import format_date
+# test/ holds fixtures and tools, it isn't a package since this module is named test
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test"))
+from mock_server import Catalog, Faults, MockServer
 
 
 with open("./test/mock_data.json", "r") as f:
@@ -195,6 +236,1312 @@ class TestUpdateFunctions(unittest.TestCase):
         print(format_date("1 Apr, 1999"))
         print(format_date("29 Mar, 2007"))
 
+    def test_split_by_owner_count(self):
+        page = {
+            "10": {"appid": 10, "owners": "20,000 .. 50,000"},
+            "20": {"appid": 20, "owners": "1,000,000 .. 2,000,000"},
+            "30": {"appid": 30, "owners": "2,000,000 .. 5,000,000"},
+        }
+        self.assertEqual(split_by_owner_count(page), ({10, 20}, {30}))
+
+
+def create_mock_db():
+    con = sqlite3.connect(":memory:")
+    db = con.cursor()
+    init_db(db)
+    for app in mock_data:
+        insert_app(App(app), db)
+    return con
+
+
+def create_mock_db_file(path: str):
+    con = sqlite3.connect(path)
+    db = con.cursor()
+    init_db(db)
+    for app in mock_data:
+        insert_app(App(app), db)
+    con.commit()
+    con.close()
+
+
+class TestDimensionCache(unittest.TestCase):
+    def test_same_rows_as_without_cache(self):
+        expected = create_mock_db()
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        cache = DimensionCache()
+        cache.load(db)
+        for app in mock_data:
+            insert_app(App(app), db, cache)
+
+        for table in ("tags", "genres", "categories", "apps_tags", "apps_genres", "apps_categories"):
+            sql = f"SELECT * FROM {table} ORDER BY 1, 2"
+            self.assertEqual(db.execute(sql).fetchall(), expected.execute(sql).fetchall(), table)
+        self.assertEqual(cache.tags, dict(db.execute("SELECT name, tag_id FROM tags")))
+        expected.close()
+        con.close()
+
+    def test_tag_ids(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        cache = DimensionCache()
+        self.assertEqual(cache.get_tag_ids(["Indie", "RPG"], db), {"Indie": 1, "RPG": 2})
+        self.assertEqual(cache.get_tag_ids(["RPG", "Puzzle"], db), {"RPG": 2, "Puzzle": 3})
+        # Tags inserted by another cache are found in database
+        self.assertEqual(DimensionCache().get_tag_ids(["Puzzle"], db), {"Puzzle": 3})
+        con.close()
+
+
+class TestHydration(unittest.TestCase):
+    def setUp(self):
+        self.con = create_mock_db()
+        self.db = self.con.cursor()
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_hydrate_applist(self):
+        app_ids = get_app_ids(self.db) + [404]
+        applist = hydrate_applist([{"app_id": i} for i in app_ids], self.db, load_dimensions(self.db))
+
+        for snippet in applist:
+            app_id = snippet["app_id"]
+            self.assertEqual(snippet["tags"], get_tags(app_id, self.db))
+            self.assertEqual(snippet["genres"], get_genres(app_id, self.db))
+            self.assertEqual(snippet["categories"], get_categories(app_id, self.db))
+
+    def test_get_apps(self):
+        apps = get_apps([3, 404, 1], self.db)
+        self.assertEqual(sorted(apps), [1, 3])
+        for app_id, app in apps.items():
+            self.assertEqual(app.json(), get_app(app_id, self.db).json())
+            self.assertEqual(app.tags, get_tags(app_id, self.db))
+        self.assertIsNone(get_app(404, self.db))
+
+
+class TestFilterIndex(unittest.TestCase):
+    def setUp(self):
+        self.con = create_mock_db()
+        self.db = self.con.cursor()
+        self.filter_index = FilterIndex(self.db)
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_match(self):
+        self.assertIsNone(self.filter_index.match({"tags": [], "genres": [], "categories": []}))
+
+        cases = [
+            {"tags": [1], "genres": [], "categories": []},
+            {"tags": [1, 2], "genres": [], "categories": []},
+            {"tags": [2], "genres": [1], "categories": []},
+            {"tags": [], "genres": [2, 3], "categories": [2]},
+            {"tags": [1], "genres": [3], "categories": [1]},
+            {"tags": [404], "genres": [], "categories": []},
+        ]
+        for filters in cases:
+            sql = f"SELECT app_id FROM apps WHERE {build_filters_sql(filters)} ORDER BY app_id"
+            expected = [i[0] for i in self.db.execute(sql).fetchall()]
+            self.assertEqual(self.filter_index.match(filters), expected)
+
+    def test_broad_filters(self):
+        all_ids = [i[0] for i in self.db.execute("SELECT app_id FROM apps ORDER BY app_id")]
+        tag_counts = self.db.execute("SELECT tag_id, COUNT(*) FROM apps_tags GROUP BY tag_id").fetchall()
+        for tag_id, count in tag_counts:
+            filters = {"tags": [tag_id], "genres": [], "categories": []}
+            matched = self.filter_index.match(filters)
+            included, app_ids = self.filter_index.match_smaller(filters)
+            # Apps that don't match are passed to sql when they are fewer
+            self.assertEqual(included, count * 2 <= len(all_ids))
+            self.assertEqual(app_ids, matched if included else [i for i in all_ids if i not in matched])
+            for order in ({"owner_count": "DESC"}, {"name": "ASC"}):
+                self.assertEqual(
+                    get_applist(filters, order, None, None, None, 0, 20, self.db, None, self.filter_index),
+                    get_applist(filters, order, None, None, None, 0, 20, self.db)
+                )
+        self.assertTrue(any(count * 2 > len(all_ids) for _, count in tag_counts))
+
+
+class TestCursor(unittest.TestCase):
+    def setUp(self):
+        self.con = create_mock_db()
+        self.db = self.con.cursor()
+        self.no_filters = {"tags": [], "genres": [], "categories": []}
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_decode_cursor(self):
+        order = {"owner_count": "DESC"}
+        cursor = encode_cursor({"app_id": 2, "owner_count": None}, order)
+        self.assertEqual(decode_cursor(cursor, order), [None, 2])
+
+        for invalid in ("", "not-a-cursor", cursor[:-4]):
+            with self.assertRaises(ValueError):
+                decode_cursor(invalid, order)
+        with self.assertRaises(ValueError):
+            decode_cursor(cursor, {"price": "ASC"})
+
+    def test_walk_with_cursor(self):
+        orders = [{}, {"owner_count": "DESC"}, {"release_date": "ASC"}, {"header_image": "DESC", "price": "ASC"}]
+        for order in orders:
+            expected = get_applist(self.no_filters, order, None, None, None, 0, 10, self.db)
+
+            walked = []
+            cursor = None
+            while True:
+                page = get_applist(self.no_filters, order, None, None, None, 0, 1, self.db, cursor=cursor)
+                if not page:
+                    break
+                walked += page
+                cursor = encode_cursor(page[-1], order)
+
+            self.assertEqual([i["app_id"] for i in walked], [i["app_id"] for i in expected])
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ResponseCache(2)
+        cache.set("a", 1, b"A")
+        cache.set("b", 1, b"B")
+        self.assertEqual(cache.get("a", 1), b"A")
+        # "b" is the least recently used
+        cache.set("c", 1, b"C")
+        self.assertIsNone(cache.get("b", 1))
+        self.assertEqual(cache.get("c", 1), b"C")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_version_change_clears_cache(self):
+        cache = ResponseCache(2)
+        cache.set("a", 1, b"A")
+        self.assertIsNone(cache.get("a", 2))
+        self.assertIsNone(cache.get("a", 1))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (0, 2, 0))
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        # Characters that mean something in URIs
+        self.path = os.path.join(self.dir.name, "a?b#c%20d", "apps.db")
+        os.makedirs(os.path.dirname(self.path))
+        create_mock_db_file(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_version(self):
+        version = get_snapshot_version(self.path)
+        # Updater's bookkeeping doesn't change the version
+        with Connection(self.path) as db:
+            start_update_run(0, {}, db)
+            insert_app_update(1, 100, None, db)
+        self.assertEqual(get_snapshot_version(self.path), version)
+
+        with Connection(self.path) as db:
+            insert_app(App(mock_data[0]), db)
+        self.assertNotEqual(get_snapshot_version(self.path), version)
+
+    def test_hot_snapshot(self):
+        snapshot = Snapshot(self.path, 2, hot_only=True)
+        expected = sqlite3.connect(self.path)
+        app_ids = [i[0] for i in expected.execute("SELECT app_id FROM apps")] + [404]
+        self.assertEqual(snapshot.app_count, len(app_ids) - 1)
+
+        # Details are only in the file on disk
+        with snapshot.details_pool.connection() as db, snapshot.pool.connection() as memory_db:
+            sql = "SELECT COUNT(*) FROM apps WHERE about_the_game IS NULL"
+            self.assertEqual(memory_db.execute(sql).fetchone()[0], snapshot.app_count)
+            self.assertLess(db.execute(sql).fetchone()[0], snapshot.app_count)
+        apps = snapshot.get_apps(app_ids)
+        expected_apps = get_apps(app_ids, expected.cursor())
+        self.assertEqual(sorted(apps), sorted(expected_apps))
+        for app_id, app in apps.items():
+            self.assertEqual(app.json(), expected_apps[app_id].json())
+        expected.close()
+
+    def test_hot_details_after_update(self):
+        snapshot = Snapshot(self.path, 2, hot_only=True)
+        app = dict(mock_data[0], tags={"New Tag": 5}, developers=["New Developer"])
+        with Connection(self.path) as db:
+            insert_app(App(app), db)
+
+        # Details and tags of an app are read from the same state of the file,
+        # even tags the snapshot doesn't know yet
+        details = snapshot.get_apps([app["app_id"]])[app["app_id"]]
+        self.assertEqual(details.developers, ["New Developer"])
+        self.assertEqual([(tag["name"], tag["votes"]) for tag in details.tags], [("New Tag", 5)])
+        with snapshot.details_pool.connection() as db:
+            self.assertFalse(db.connection.in_transaction)
+
+    def test_reload(self):
+        reloader = SnapshotReloader(self.path, 60, 2, hot_only=True)
+        old = reloader.current
+        self.assertFalse(reloader.reload())
+
+        app = dict(mock_data[0], app_id=99999)
+        with Connection(self.path) as db:
+            insert_app(App(app), db)
+        self.assertTrue(reloader.reload())
+        self.assertEqual(reloader.reload_count, 1)
+        self.assertEqual(reloader.current.app_count, old.app_count + 1)
+
+        # Requests that took the old snapshot keep reading it
+        sql = "SELECT COUNT(*) FROM apps WHERE app_id = 99999"
+        with old.pool.connection() as db:
+            self.assertEqual(db.execute(sql).fetchone()[0], 0)
+        with reloader.current.pool.connection() as db:
+            self.assertEqual(db.execute(sql).fetchone()[0], 1)
+
+
+class TestReadPool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "apps.db")
+        create_mock_db_file(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_size_is_bounded(self):
+        pool = ReadPool(f"file:{self.path}?mode=ro", 2)
+        acquired = threading.Event()
+
+        def read():
+            with pool.connection() as db:
+                db.execute("SELECT COUNT(*) FROM apps").fetchone()
+                acquired.set()
+
+        with pool.connection(), pool.connection():
+            reader = threading.Thread(target=read)
+            reader.start()
+            # Third thread waits for a connection to be returned
+            self.assertFalse(acquired.wait(0.2))
+        reader.join()
+        self.assertTrue(acquired.is_set())
+        stats = pool.stats()
+        self.assertEqual((stats["opened"], stats["in_use"], stats["waits"]), (2, 0, 1))
+        pool.close()
+
+    def test_connection_is_returned_after_error(self):
+        pool = ReadPool(f"file:{self.path}?mode=ro", 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as db:
+                db.execute("SELECT * FROM no_such_table")
+        with pool.connection() as db:
+            self.assertEqual(db.execute("SELECT COUNT(*) FROM apps").fetchone()[0], len(mock_data))
+        stats = pool.stats()
+        self.assertEqual((stats["opened"], stats["in_use"]), (1, 0))
+        pool.close()
+
+
+class TestSendEncoded(unittest.TestCase):
+    def setUp(self):
+        encoded = EncodedResponse(b'{"a": 1}', "v1")
+        app = Flask(__name__)
+        app.add_url_rule("/", "index", lambda: send_encoded(encoded))
+        self.client = app.test_client()
+
+    def test_variants(self):
+        identity = self.client.get("/", headers={"Accept-Encoding": "identity"})
+        compressed = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(identity.data, b'{"a": 1}')
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.data), b'{"a": 1}')
+        self.assertEqual(identity.headers["ETag"], '"v1"')
+        self.assertEqual(compressed.headers["ETag"], '"v1-gzip"')
+
+    def test_not_modified(self):
+        for accept in ("identity", "gzip"):
+            for etag in ('"v1"', '"v1-gzip"'):
+                response = self.client.get("/", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+                self.assertEqual(response.status_code, 304, (accept, etag))
+                self.assertEqual(response.headers["ETag"], '"v1-gzip"' if accept == "gzip" else '"v1"')
+
+        response = self.client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": '"v0-gzip"'})
+        self.assertEqual(response.status_code, 200)
+
+
+main_dir = None
+
+
+def import_main():
+    """Returns main module. Importing it loads a snapshot and starts recording queries,
+    so it's first imported with database paths in a temporary directory.
+    """
+    global main_dir
+    if main_dir is None:
+        main_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(main_dir.name, "apps.db")
+        create_mock_db_file(path)
+        queries_path = os.path.join(main_dir.name, "app_queries.db")
+        with mock.patch.multiple("db.database", APPS_DB_PATH=path, QUERIES_DB_PATH=queries_path):
+            import main
+    import main
+    return main
+
+
+class APITestCase(unittest.TestCase):
+    """Sends requests to main.py's app, which serves a snapshot of mock data in a temporary directory."""
+
+    def setUp(self):
+        self.main = import_main()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "apps.db")
+        create_mock_db_file(self.path)
+
+        self.snapshots = SnapshotReloader(self.path, 60, 2, hot_only=True)
+        self.queries = QueryRecorder(os.path.join(self.dir.name, "app_queries.db"), 60)
+        patcher = mock.patch.multiple(
+            self.main,
+            SNAPSHOTS=self.snapshots,
+            QUERIES=self.queries,
+            APPLIST_CACHE=ResponseCache(16),
+            STATIC_CACHE=ResponseCache(16)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.main.limiter, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.main.app.test_client()
+
+
+class TestApplistCache(APITestCase):
+    def test_equivalent_queries(self):
+        groups = [
+            # Filter order and duplicates
+            ["?tags=1,2", "?tags=2,1", "?tags=2,1,2&genres="],
+            # Default values
+            ["", "?index=0&limit=20", "?order=owner_count,DESC", "?order=owner_count,DESC,app_id,ASC"],
+            # Cursor replaces index
+            ["?cursor=", "?cursor=&index=2"]
+        ]
+        for queries in groups:
+            first = self.client.get("/GetAppList" + queries[0])
+            self.assertEqual(first.status_code, 200)
+            for query in queries[1:]:
+                response = self.client.get("/GetAppList" + query)
+                self.assertEqual(response.headers["ETag"], first.headers["ETag"], query)
+                self.assertEqual(response.data, first.data, query)
+
+        stats = self.main.APPLIST_CACHE.stats()
+        self.assertEqual(stats["size"], len(groups))
+        self.assertEqual(stats["misses"], len(groups))
+        self.assertEqual(stats["hits"], sum(len(queries) - 1 for queries in groups))
+
+    def test_different_queries(self):
+        queries = [
+            "", "?tags=1", "?tags=2", "?tags=1,2", "?order=owner_count,ASC",
+            "?index=1", "?limit=2", "?cursor=", "?cursor=&limit=2"
+        ]
+        etags = {self.client.get("/GetAppList" + query).headers["ETag"] for query in queries}
+        self.assertEqual(len(etags), len(queries))
+        self.assertEqual(self.main.APPLIST_CACHE.stats()["hits"], 0)
+
+    def test_etag(self):
+        response = self.client.get("/GetAppList")
+        etag = response.headers["ETag"]
+        for accept in ("identity", "gzip"):
+            cached = self.client.get("/GetAppList", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.data, b"")
+
+        # New snapshot changes the ETag, old one gets the new list
+        app = dict(mock_data[0], app_id=99999, owner_count=10_000_000)
+        with Connection(self.path) as db:
+            insert_app(App(app), db)
+        self.assertTrue(self.snapshots.reload())
+        response = self.client.get("/GetAppList", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(json.loads(response.data)[0]["app_id"], 99999)
+
+
+class TestAppDetailsBatch(APITestCase):
+    def get_batch(self, app_ids: str):
+        return self.client.get("/GetAppDetailsBatch?app_ids=" + app_ids)
+
+    def test_apps_and_missing(self):
+        response = self.get_batch("3,404,1,2,3,1")
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.data)
+        self.assertEqual(list(body["apps"]), ["3", "1", "2"])
+        self.assertEqual(body["missing"], [404])
+        # Same details as /GetAppDetails
+        for app_id, details in body["apps"].items():
+            self.assertEqual(details, json.loads(self.client.get(f"/GetAppDetails/{app_id}").data))
+
+        # Only apps that were found are recorded
+        self.queries.flush()
+        self.assertEqual(sorted(get_query_scores(self.queries.path, int(time.time()))), [1, 2, 3])
+
+    def test_limit(self):
+        limit = self.main.BATCH_LIMIT
+        self.assertEqual(self.get_batch(",".join(str(i) for i in range(limit))).status_code, 200)
+        self.assertEqual(self.get_batch(",".join(str(i) for i in range(limit + 1))).status_code, 400)
+        # Duplicates count once
+        app_ids = ",".join(str(i % limit) for i in range(limit * 2))
+        self.assertEqual(self.get_batch(app_ids).status_code, 200)
+
+    def test_invalid_app_ids(self):
+        for app_ids in ("1,a", "1.5", "1,,2"):
+            response = self.get_batch(app_ids)
+            self.assertEqual(response.status_code, 400, app_ids)
+            self.assertEqual(json.loads(response.data)["code"], 400)
+
+        response = self.get_batch("")
+        self.assertEqual(json.loads(response.data), {"apps": {}, "missing": []})
+
+
+class TestHTTPClient(unittest.TestCase):
+    def test_rewrite(self):
+        client = HTTPClient(1, 1, {"steamspy.com": "http://127.0.0.1:8000/"})
+        self.assertEqual(
+            client._rewrite("https://steamspy.com/api.php?request=appdetails&appid=10"),
+            "http://127.0.0.1:8000/api.php?request=appdetails&appid=10"
+        )
+        url = "https://store.steampowered.com/api/appdetails/?appids=10"
+        self.assertEqual(client._rewrite(url), url)
+
+    def test_conditional_headers(self):
+        self.assertEqual(conditional_headers({"etag": None, "last_modified": None}), {})
+        self.assertEqual(
+            conditional_headers({"etag": '"a"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+            {"If-None-Match": '"a"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        )
+
+    def test_retry_after(self):
+        response = requests.Response()
+        self.assertIsNone(get_retry_after(response))
+        response.headers["Retry-After"] = "120"
+        self.assertEqual(get_retry_after(response), 120)
+        response.headers["Retry-After"] = "Mon, 01 Jan 2024 00:00:00 GMT"
+        self.assertEqual(get_retry_after(response), 0)
+
+    def test_redact_url(self):
+        url = "https://api.steampowered.com/IStoreService/GetAppList/v1/?key=SECRET&last_appid=10"
+        self.assertEqual(
+            redact_url(url), "https://api.steampowered.com/IStoreService/GetAppList/v1/?key=REDACTED&last_appid=10"
+        )
+        self.assertNotIn("SECRET", redact_url(f"ConnectionError: Max retries exceeded with url: {url}"))
+        self.assertEqual(redact_url("https://steamspy.com/api.php?request=appdetails&appid=10"),
+                         "https://steamspy.com/api.php?request=appdetails&appid=10")
+
+
+class TestMockServer(unittest.TestCase):
+    def setUp(self):
+        self.faults = Faults()
+        self.server = MockServer(Catalog(mock_data, 5, 0, 0, 0), self.faults, port=0)
+        self.server.start()
+        self.client = HTTPClient(1, 5, {
+            "store.steampowered.com": self.server.url, "steamspy.com": self.server.url,
+            "api.steampowered.com": self.server.url
+        })
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_app_details(self):
+        # Apps are saved with the data of fixtures they are made from
+        steam = self.client.get("https://store.steampowered.com/api/appdetails/?appids=20").json()["20"]
+        app = map_steam_data(steam["data"])
+        for key in ("developers", "release_date", "genres", "categories", "languages", "mac"):
+            self.assertEqual(app[key], mock_data[1][key], key)
+
+        response = self.client.get("https://steamspy.com/api.php?request=appdetails&appid=20")
+        app = map_steamspy_response(response.json())
+        for key in ("price", "owner_count", "positive_reviews", "tags"):
+            self.assertEqual(app[key], mock_data[1][key], key)
+
+        etag = response.headers["ETag"]
+        response = self.client.get("https://steamspy.com/api.php?request=appdetails&appid=20", {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_applist_pages(self):
+        api = "https://api.steampowered.com/IStoreService/GetAppList/v1/?max_results=3&if_modified_since=0"
+        first = self.client.get(api + "&last_appid=0").json()["response"]
+        second = self.client.get(api + f"&last_appid={first['last_appid']}").json()["response"]
+        self.assertEqual([app["appid"] for app in first["apps"] + second["apps"]], [10, 20, 30, 40, 50])
+        self.assertNotIn("have_more_results", second)
+
+    def test_faults(self):
+        self.faults.burst_every, self.faults.burst_length, self.faults.retry_after = 60, 60, 5
+        response = self.client.get("https://store.steampowered.com/api/appdetails/?appids=10")
+        self.assertEqual((response.status_code, response.headers["Retry-After"]), (429, "5"))
+
+        self.faults.burst_every, self.faults.error_rate = 0, 1
+        response = self.client.get("https://store.steampowered.com/api/appdetails/?appids=10")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.server.get_stats()["responses"], {"steam 429": 1, "steam 500": 1})
+
+
+class UpdaterTestCase(unittest.TestCase):
+    """Runs the updater against a MockServer of APPS apps, with its files and state in a temporary directory."""
+    APPS = 40
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.db_path = os.path.join(self.dir.name, "apps.db")
+        con = sqlite3.connect(self.db_path)
+        init_db(con.cursor())
+        con.close()
+
+        self.faults = Faults()
+        self.server = MockServer(Catalog(mock_data, self.APPS), self.faults, port=0)
+        self.server.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        client = HTTPClient(update.WORKERS, 5, {
+            "store.steampowered.com": self.server.url, "steamspy.com": self.server.url,
+            "api.steampowered.com": self.server.url
+        })
+        self.addCleanup(client.close)
+
+        log_path = os.path.join(self.dir.name, "update_log.json")
+        with open(log_path, "w") as f:
+            json.dump(DEFAULT_LOG, f)
+        self.patch(errors.ulogger, file=log_path)
+        self.patch(
+            update,
+            APPS_DB_PATH=self.db_path,
+            QUERIES_DB_PATH=os.path.join(self.dir.name, "app_queries.db"),
+            RAW_STORE_PATH=os.path.join(self.dir.name, "raw"),
+            METRICS_JSON_PATH=os.path.join(self.dir.name, "update_metrics.json"),
+            METRICS_PROM_PATH=os.path.join(self.dir.name, "update_metrics.prom"),
+            DEBUG_LOG=os.path.join(self.dir.name, "debug.log"),
+            STEAM_API_KEY="test",
+            STEAMSPY_BULK=False,
+            http_client=client,
+            LIMITERS={
+                "steam": AdaptiveTokenBucket(1000, 1000, 1000, 0),
+                "steamspy": AdaptiveTokenBucket(1000, 1000, 1000, 0),
+                "steamspy_bulk": TokenBucket(1000)
+            },
+            update_log=UpdateLogger(log_path).log,
+            tracker=dict.fromkeys(update.tracker, 0),
+            metrics=UpdateMetrics(),
+            dimension_cache=DimensionCache(),
+            app_updates={},
+            http_validators={},
+            steamspy_bulk={},
+            tag_updates={}
+        )
+
+    def patch(self, target, **attributes):
+        patcher = mock.patch.multiple(target, **attributes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_update(self, target=None, *args):
+        """Runs target, update.main() by default, without its output."""
+        logging.disable(logging.DEBUG)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return (target or update.main)(*args)
+        finally:
+            logging.disable(logging.NOTSET)
+
+    def query(self, sql: str) -> list:
+        con = sqlite3.connect(self.db_path)
+        try:
+            return con.execute(sql).fetchall()
+        finally:
+            con.close()
+
+
+class TestUpdatePipeline(UpdaterTestCase):
+    def test_update(self):
+        self.faults.latency = 0.01
+        self.run_update()
+        apps = self.server.catalog.apps.values()
+        games = [app for app in apps if app["type"] == "game" and app["owner_count"] < 1_000_000]
+        self.assertEqual(update.tracker["updated_apps"], len(games))
+        self.assertEqual(
+            sum(update.tracker[key] for key in update.STATUS_COUNTERS.values()), self.APPS
+        )
+        self.assertEqual(self.query("SELECT COUNT(*) FROM apps"), [(len(games), )])
+        stats = self.server.get_stats()["responses"]
+        self.assertEqual(update.tracker["steam_request_count"], stats["steam 200"])
+
+        # Nothing changed, so apps due again are requested with validators and are unchanged
+        self.patch(update, MIN_UPDATE_AGE=0, MAX_REFRESH_INTERVAL=0, tracker=dict.fromkeys(update.tracker, 0))
+        self.run_update()
+        self.assertEqual(update.tracker["updated_apps"], 0)
+        self.assertEqual(update.tracker["unchanged_apps"], len(games))
+
+    def test_resume_interrupted_run(self):
+        handle_result = update.handle_result
+        handled = []
+
+        def interrupt(app_id, future):
+            handled.append(app_id)
+            if len(handled) == 10:
+                raise KeyboardInterrupt
+            return handle_result(app_id, future)
+
+        with mock.patch.object(update, "handle_result", interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_update()
+        done = self.query("SELECT COUNT(*) FROM update_journal")[0][0]
+        self.assertGreaterEqual(done, 9)
+        self.assertEqual(self.query("SELECT finished_at FROM update_runs"), [(None, )])
+
+        # Next run is a new process, it continues from the journal
+        self.patch(update, update_log=dict(DEFAULT_LOG), tracker=dict.fromkeys(update.tracker, 0))
+        self.run_update()
+        self.assertEqual(self.server.get_stats()["responses"]["steamspy 200"], self.APPS)
+        self.assertEqual(sum(update.update_log[key] for key in update.STATUS_COUNTERS.values()), self.APPS)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM update_runs WHERE finished_at IS NOT NULL"), [(1, )])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM update_journal"), [(0, )])
+
+    def test_steam_request_limit(self):
+        # Apps already requesting Steam when the limit is reached are counted with their requests
+        self.faults.latency = 0.05
+        self.patch(update, STEAM_REQUEST_LIMIT=5)
+        self.run_update()
+        self.assertEqual(self.server.get_stats()["responses"]["steam 200"], 5)
+        self.assertEqual(update.tracker["steam_request_count"], 5)
+        self.assertEqual(
+            sum(update.tracker[key] for key in ("updated_apps", "non_game_apps", "failed_requests")), 5
+        )
+
+
+class TestSteamSpyBulk(UpdaterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patch(update, STEAMSPY_BULK=True)
+
+    def steamspy_requests(self) -> int:
+        stats = self.server.get_stats()["responses"]
+        return stats.get("steamspy 200", 0) + stats.get("steamspy 304", 0)
+
+    def test_bulk_fields(self):
+        self.run_update()
+        apps = self.server.catalog.apps.values()
+        games = [app for app in apps if app["type"] == "game" and app["owner_count"] < 1_000_000]
+        # Tags aren't in bulk listing, so each game's app details is requested once
+        self.assertEqual(self.steamspy_requests(), len(games))
+        self.assertEqual(update.tracker["updated_apps"], len(games))
+
+        # Reviews changed in bulk listing are saved without requesting app details
+        games[0]["positive_reviews"] += 100
+        self.patch(update, MIN_UPDATE_AGE=0, MAX_REFRESH_INTERVAL=0, tracker=dict.fromkeys(update.tracker, 0))
+        self.run_update()
+        self.assertEqual(self.steamspy_requests(), len(games))
+        self.assertEqual(update.tracker["updated_apps"], 1)
+        self.assertEqual(update.tracker["unchanged_apps"], len(games) - 1)
+        self.assertEqual(
+            self.query(f"SELECT positive_reviews FROM apps WHERE app_id = {games[0]['app_id']}"),
+            [(games[0]["positive_reviews"], )]
+        )
+
+        # Stale tags are requested again
+        con = sqlite3.connect(self.db_path)
+        with con:
+            con.execute("UPDATE tag_updates SET fetched_at = 0")
+        con.close()
+        self.patch(update, tracker=dict.fromkeys(update.tracker, 0))
+        self.run_update()
+        self.assertEqual(self.steamspy_requests(), len(games) * 2)
+        self.assertEqual(update.tracker["unchanged_apps"], len(games))
+
+
+class TestReplay(UpdaterTestCase):
+    def dump(self, path: str) -> dict:
+        """Returns saved apps of database at path. Tags are compared by name, their ids are given by the updater."""
+        con = sqlite3.connect(path)
+        try:
+            return {
+                "apps": con.execute("SELECT * FROM apps ORDER BY app_id").fetchall(),
+                "tags": con.execute(
+                    "SELECT app_id, name, votes FROM apps_tags JOIN tags USING (tag_id) ORDER BY app_id, name"
+                ).fetchall(),
+                "genres": con.execute("SELECT * FROM apps_genres ORDER BY app_id, genre_id").fetchall(),
+                "categories": con.execute("SELECT * FROM apps_categories ORDER BY app_id, category_id").fetchall(),
+                "over_million": con.execute("SELECT app_id FROM apps_over_million ORDER BY app_id").fetchall(),
+                "non_game_apps": con.execute("SELECT app_id FROM non_game_apps ORDER BY app_id").fetchall()
+            }
+        finally:
+            con.close()
+
+    def replay(self) -> dict:
+        """Replays raw store into an empty database and returns its dump."""
+        path = os.path.join(self.dir.name, "replayed.db")
+        if os.path.exists(path):
+            os.remove(path)
+        con = sqlite3.connect(path)
+        init_db(con.cursor())
+        con.close()
+        with mock.patch.object(update, "APPS_DB_PATH", path):
+            self.run_update(update.replay)
+        return self.dump(path)
+
+    def test_replay(self):
+        games = [app for app in self.server.catalog.apps.values() if app["type"] == "game"]
+        games[0]["owner_count"] = 5_000_000
+        self.run_update()
+        live = self.dump(self.db_path)
+        self.assertTrue(live["apps"])
+        self.assertEqual(live["over_million"], [(games[0]["app_id"], )])
+        self.assertEqual(self.replay(), live)
+
+    def test_replay_bulk_listing(self):
+        # Last SteamSpy responses of games are their app details merged with bulk listing entries
+        self.patch(update, STEAMSPY_BULK=True)
+        self.run_update()
+        for app in self.server.catalog.apps.values():
+            app["positive_reviews"] += 1
+        self.patch(update, MIN_UPDATE_AGE=0, MAX_REFRESH_INTERVAL=0)
+        self.run_update()
+        live = self.dump(self.db_path)
+        self.assertEqual(self.replay(), live)
+
+
+class TestWorkers(UpdaterTestCase):
+    """Workers run in processes of their own (see test/update_worker.py) sharing apps.db, like 'update.py --worker'."""
+    APPS = 120
+
+    def start_worker(self, name: str, shards: int) -> subprocess.Popen:
+        worker_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test", "update_worker.py")
+        process = subprocess.Popen(
+            [sys.executable, worker_path, self.dir.name, self.server.url, name, "--shards", str(shards),
+             "--lease-duration", "3", "--poll-interval", "0.1"],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        self.addCleanup(process.kill)
+        return process
+
+    def wait(self, process: subprocess.Popen) -> str:
+        output, _ = process.communicate(timeout=60)
+        self.assertEqual(process.returncode, 0, output)
+        return output
+
+    def assert_run_finished(self):
+        apps = self.server.catalog.apps.values()
+        saved = [app["app_id"] for app in apps if app["type"] == "game" and app["owner_count"] < 1_000_000]
+        self.assertEqual(self.query("SELECT app_id FROM apps ORDER BY app_id"), [(i, ) for i in sorted(saved)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM update_runs WHERE finished_at IS NULL"), [(0, )])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM shard_leases"), [(0, )])
+
+    def test_two_workers(self):
+        # Shards take longer than their lease, the worker done first waits for the one that renews it
+        self.faults.latency = 0.35
+        workers = [self.start_worker(name, 3) for name in ("a", "b")]
+        outputs = [self.wait(worker) for worker in workers]
+        for output in outputs:
+            self.assertRegex(output, r"Leased shard: [0-9]")
+        self.assert_run_finished()
+        # No app was updated by both
+        self.assertEqual(self.server.get_stats()["responses"]["steamspy 200"], self.APPS)
+
+    def test_lease_takeover(self):
+        # Worker a crashes with a shard leased, b takes it once its lease expires
+        self.faults.latency = 0.1
+        worker = self.start_worker("a", 3)
+        shard = None
+        while shard is None:
+            self.assertIsNone(worker.poll())
+            time.sleep(0.05)
+            try:
+                rows = self.query("SELECT shard FROM shard_leases WHERE owner = 'a' AND shard >= 0")
+            except sqlite3.OperationalError:
+                continue
+            shard = rows[0][0] if rows else None
+        worker.kill()
+        worker.communicate()
+
+        output = self.wait(self.start_worker("b", 3))
+        self.assertIn(f"Leased shard: {shard}", output)
+        self.assert_run_finished()
+
+    def test_lost_lease(self):
+        # Lease of the first shard of apps is taken by another worker at its first renewal
+        self.faults.latency = 0.1
+        self.patch(update, SHARD_COUNT=2, LEASE_DURATION=1, LEASE_POLL_INTERVAL=0.1, WRITE_INTERVAL=0.1)
+        renew_lease = update.renew_lease
+        release_shard = update.release_shard
+        lost = []
+        released = []
+
+        def take_lease(run_id, shard, worker):
+            if shard >= 0 and not lost:
+                lost.append(shard)
+                con = sqlite3.connect(self.db_path)
+                with con:
+                    con.execute(
+                        "UPDATE shard_leases SET owner = 'other', expires_at = ? WHERE run_id = ? AND shard = ?",
+                        (int(time.time()) + 1, run_id, shard)
+                    )
+                con.close()
+            return renew_lease(run_id, shard, worker)
+
+        def count_released(run_id, shard, worker, done, db):
+            journal = db.execute("SELECT app_id FROM update_journal WHERE run_id = ?", (run_id, )).fetchall()
+            released.append((shard, done, sum(1 for app_id, in journal if get_shard(app_id, 2) == shard)))
+            release_shard(run_id, shard, worker, done, db)
+
+        with mock.patch.object(update, "renew_lease", take_lease), \
+                mock.patch.object(update, "release_shard", count_released):
+            self.run_update(update.run_worker, "a")
+
+        # Worker stopped the shard without finishing it, then leased it again after it expired
+        shard_size = sum(1 for app_id in self.server.catalog.apps if get_shard(app_id, 2) == lost[0])
+        shard_releases = [(done, count) for released_shard, done, count in released if released_shard == lost[0]]
+        self.assertFalse(shard_releases[0][0])
+        self.assertLess(shard_releases[0][1], shard_size)
+        self.assertEqual(shard_releases[-1], (True, shard_size))
+        self.assertEqual(self.query("SELECT COUNT(*) FROM update_runs WHERE finished_at IS NULL"), [(0, )])
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(20)
+        start = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # First token is there from the start, others come every 1 / 20 seconds
+        self.assertAlmostEqual(time.monotonic() - start, 0.2, delta=0.05)
+
+    def test_pause(self):
+        bucket = TokenBucket(1000)
+        bucket.throttled(0.2)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        # Tokens don't pile up while paused
+        bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.25)
+
+
+class TestUpdateMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1, 10))
+        for value in (0.05, 0.5, 0.5, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual((histogram.quantile(0.5), histogram.quantile(0.8), histogram.quantile(1)), (1, 10, None))
+        self.assertEqual(histogram.as_dict()["buckets"], {"0.1": 1, "1": 3, "10": 4})
+
+    def test_snapshot(self):
+        metrics = UpdateMetrics(planned=10)
+        metrics.gauges["write_queue"] = lambda: 3
+        metrics.observe_request("steam", 0.2, "200")
+        metrics.observe_request("steam", 20, "Timeout")
+        metrics.count_error("steam", "RequestTimeoutError")
+        metrics.count_app("updated")
+        metrics.count_app("non_game_app")
+
+        snapshot = metrics.snapshot()
+        self.assertEqual((snapshot["done"], snapshot["apps"]), (2, {"updated": 1, "non_game_app": 1}))
+        self.assertEqual(snapshot["requests"], {"steam": {"200": 1, "Timeout": 1}})
+        self.assertEqual(snapshot["gauges"], {"write_queue": 3})
+
+        text = to_prometheus(snapshot)
+        self.assertIn('updater_apps_total{status="updated"} 1', text)
+        self.assertIn('updater_errors_total{provider="steam",error="RequestTimeoutError"} 1', text)
+        self.assertIn('updater_request_seconds_bucket{provider="steam",le="0.25"} 1', text)
+        self.assertIn('updater_request_seconds_count{provider="steam"} 2', text)
+        self.assertIn("updater_write_queue 3", text)
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = AdaptiveTokenBucket(1, 0.25, 2, increase=0.1, decrease=0.5, cooldown=60)
+        bucket.succeeded()
+        self.assertAlmostEqual(bucket.rate, 1.1)
+        bucket.throttled()
+        self.assertAlmostEqual(bucket.rate, 0.55)
+        # Throttles in cooldown are from requests made before the decrease
+        bucket.throttled()
+        self.assertAlmostEqual(bucket.rate, 0.55)
+
+        bucket.set_rate(10)
+        self.assertEqual(bucket.rate, 2)
+        bucket.set_rate(0)
+        self.assertEqual(bucket.rate, 0.25)
+
+
+class TestUpdateLogger(unittest.TestCase):
+    def test_save_from_threads(self):
+        with tempfile.TemporaryDirectory() as path:
+            path = os.path.join(path, "update_log.json")
+            with open(path, "w") as f:
+                json.dump({"reset_log": False}, f)
+            logger = UpdateLogger(path)
+            stop = threading.Event()
+            errors = []
+
+            def save():
+                while not stop.is_set():
+                    try:
+                        logger.save()
+                        with open(path, "r") as f:
+                            json.load(f)
+                    except Exception as e:
+                        errors.append(e)
+
+            savers = [threading.Thread(target=save) for _ in range(4)]
+            for saver in savers:
+                saver.start()
+            # Main thread keeps adding keys while workers save
+            deadline = time.time() + 0.5
+            i = 0
+            while time.time() < deadline:
+                logger.log[f"key_{i}"] = i
+                logger.log.pop(f"key_{i - 200}", None)
+                i += 1
+            stop.set()
+            for saver in savers:
+                saver.join()
+            self.assertEqual(errors, [])
+            logger.save()
+            with open(path, "r") as f:
+                self.assertEqual(json.load(f), logger.log)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["update_log.json"])
+
+
+class TestUpdateJournal(unittest.TestCase):
+    def test_resume_interrupted_run(self):
+        con = create_mock_db()
+        db = con.cursor()
+        run_id, start_log, journal = start_update_run(100, {"updated_apps": 5}, db)
+        self.assertEqual(journal, [])
+        insert_journal_entry(run_id, 10, "updated", 2, db)
+        insert_journal_entry(run_id, 20, "over_million", 0, db)
+
+        # Run wasn't finished, so it's resumed with its start_log
+        self.assertEqual(start_update_run(200, {"updated_apps": 7}, db), (
+            run_id, {"updated_apps": 5}, [(10, "updated", 2), (20, "over_million", 0)]
+        ))
+
+        # Journal of a finished run isn't kept
+        finish_update_run(run_id, 300, db)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM update_journal").fetchone()[0], 0)
+        new_run_id, start_log, journal = start_update_run(400, {"updated_apps": 7}, db)
+        self.assertNotEqual(new_run_id, run_id)
+        self.assertEqual((start_log, journal), ({"updated_apps": 7}, []))
+        con.close()
+
+
+class TestPlannedApps(unittest.TestCase):
+    def test_planned_apps(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_applist_page([(i, str(i), 1) for i in range(1, 8)], db)
+        insert_app_update(2, 500, None, db)
+        insert_app_update(3, 100, None, db)
+        insert_app_update(4, 950, None, db)
+        insert_exclusion(5, "non_game_app", 2000, db)
+        run_id, _, _ = start_update_run(0, {}, db)
+        insert_journal_entry(run_id, 7, "failed_request", 1, db)
+
+        self.assertEqual(create_update_plan(1000, 900, run_id, db), (2, 2))
+        # New apps first, then stale apps from the oldest
+        # recently updated, ignored and already done apps are left out
+        first_page = get_planned_apps(run_id, (-2, 0), 3, db)
+        self.assertEqual([i["app_id"] for i in first_page], [1, 6, 3])
+        last = first_page[-1]
+        second_page = get_planned_apps(run_id, (last["update_key"], last["app_id"]), 3, db)
+        self.assertEqual([i["app_id"] for i in second_page], [2])
+        # Excluded apps are planned again once their next check passed
+        self.assertEqual(create_update_plan(3000, 900, run_id, db), (3, 2))
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM update_plan").fetchone()[0], 5)
+        finish_update_run(run_id, 3000, db)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM update_plan").fetchone()[0], 0)
+        con.close()
+
+    def test_plan_is_written_once(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_applist_page([(i, str(i), 1) for i in range(1, 8)], db)
+        create_update_plan(1000, 900, 1, db)
+        # Pages come from the plan, apps added to applist after it's written aren't in it
+        insert_applist_page([(8, "8", 1)], db)
+        pages, after = [], (-2, 0)
+        while page := get_planned_apps(1, after, 2, db):
+            pages.append([i["app_id"] for i in page])
+            after = (page[-1]["update_key"], page[-1]["app_id"])
+        self.assertEqual(pages, [[1, 2], [3, 4], [5, 6], [7]])
+        plan = db.execute(
+            "EXPLAIN QUERY PLAN SELECT app_id FROM update_plan WHERE run_id = 1 AND shard = 0 "
+            "AND (update_key, app_id) > (0, 0) ORDER BY update_key, app_id"
+        ).fetchall()
+        self.assertNotIn("TEMP B-TREE", str(plan))
+        con.close()
+
+
+class TestExclusions(unittest.TestCase):
+    def test_exclusions(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_applist_page([(i, str(i), 1) for i in range(1, 6)], db)
+        insert_non_game_app(1, db)
+        insert_failed_request(2, "steam", "failed", None, db)
+        insert_failed_request(3, "steam", "TooManyRequestsError", 429, db)
+        init_exclusions(1000, {"non_game_app": 10, "over_million": 10, "failed": 10}, db)
+
+        # Only failures Steam reported are excluded, others are retried
+        self.assertEqual(count_ignored_apps(999, db), 2)
+        self.assertEqual(count_rechecked_apps(1010, db), 2)
+
+        delete_exclusion(1, db)
+        self.assertEqual(count_ignored_apps(999, db), 1)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM non_game_apps").fetchone()[0], 0)
+        con.close()
+
+
+class TestRefreshIntervals(unittest.TestCase):
+    def test_refresh_intervals(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_applist_page([(i, str(i), 1) for i in range(1, 5)], db)
+        for app_id in range(1, 5):
+            insert_app_update(app_id, 700, None, db)
+        insert_refresh_intervals([(1, 1000), (2, 250), (3, 280)], db)
+
+        # Most overdue for their interval first, app 1 isn't due yet and app 4 has the default interval
+        self.assertEqual(create_update_plan(1000, 900, 1, db), (0, 3))
+        apps = get_planned_apps(1, (-2, 0), 10, db)
+        self.assertEqual([i["app_id"] for i in apps], [4, 2, 3])
+        con.close()
+
+    def test_review_velocity(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_review_count(1, 100, 0, db)
+        insert_review_count(1, 150, 2 * 86400, db)
+        insert_refresh_intervals([(1, 5000)], db)
+        self.assertEqual(
+            db.execute("SELECT refresh_interval, reviews, review_velocity FROM update_queue").fetchall(),
+            [(5000, 150, 25.0)]
+        )
+        con.close()
+
+    def test_get_refresh_interval(self):
+        dead = get_refresh_interval(10_000, 0, False, 0)
+        self.assertLessEqual(dead, MAX_REFRESH_INTERVAL)
+        self.assertLess(get_refresh_interval(500_000, 0, False, 0), dead)
+        self.assertLess(get_refresh_interval(10_000, 50, False, 0), dead)
+        self.assertLess(get_refresh_interval(10_000, 0, False, 100), dead)
+        self.assertLess(get_refresh_interval(10_000, 0, True, 0), MIN_UPDATE_AGE * 2)
+        self.assertEqual(get_refresh_interval(900_000, 1000, True, 1000), MIN_UPDATE_AGE)
+
+
+class TestQueryRecorder(unittest.TestCase):
+    def test_flush(self):
+        with tempfile.TemporaryDirectory() as path:
+            path = os.path.join(path, "queries.db")
+            self.assertEqual(get_query_scores(path, 0), {})
+
+            recorder = QueryRecorder(path, 60, half_life=100)
+            recorder.record([1, 2, 1])
+            recorder.flush()
+            recorder.record([2])
+            recorder.flush()
+            scores = get_query_scores(path, int(time.time()), half_life=100)
+            self.assertAlmostEqual(scores[1], 2, delta=0.1)
+            self.assertAlmostEqual(scores[2], 2, delta=0.1)
+            # Scores halve every half life
+            scores = get_query_scores(path, int(time.time()) + 100, half_life=100)
+            self.assertAlmostEqual(scores[1], 1, delta=0.1)
+            self.assertEqual(recorder.stats()["flushes"], 2)
+
+    def test_saved_on_exit(self):
+        # Counts recorded by main.py since its last flush are saved when its process exits
+        with tempfile.TemporaryDirectory() as path:
+            apps_path = os.path.join(path, "apps.db")
+            queries_path = os.path.join(path, "app_queries.db")
+            create_mock_db_file(apps_path)
+            code = (
+                "from unittest import mock\n"
+                f"with mock.patch.multiple('db.database', APPS_DB_PATH={apps_path!r}, QUERIES_DB_PATH={queries_path!r}):\n"
+                "    import main\n"
+                "main.QUERIES.record([1, 1])\n"
+            )
+            root = os.path.dirname(os.path.abspath(__file__))
+            subprocess.run([sys.executable, "-c", code], cwd=root, check=True, capture_output=True)
+            self.assertAlmostEqual(get_query_scores(queries_path, int(time.time()))[1], 2, delta=0.1)
+
+
+class TestShardLeases(unittest.TestCase):
+    def test_leases(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        create_shards(1, 2, db)
+        create_shards(1, 2, db)
+        self.assertEqual(count_unfinished_shards(1, db), 3)
+
+        # Shards of apps wait until applist is synced
+        self.assertEqual(lease_shard(1, "a", 100, 200, db), APPLIST_SHARD)
+        self.assertIsNone(lease_shard(1, "b", 100, 200, db))
+        release_shard(1, APPLIST_SHARD, "a", True, db)
+
+        self.assertEqual(lease_shard(1, "a", 100, 200, db), 0)
+        self.assertEqual(lease_shard(1, "b", 100, 200, db), 1)
+        self.assertIsNone(lease_shard(1, "c", 150, 250, db))
+        self.assertTrue(renew_shard_lease(1, 0, "a", 300, db))
+
+        # Expired lease of b is taken by c, b can't renew or finish it anymore
+        self.assertEqual(lease_shard(1, "c", 250, 350, db), 1)
+        self.assertFalse(renew_shard_lease(1, 1, "b", 400, db))
+        release_shard(1, 1, "b", True, db)
+        self.assertEqual(count_unfinished_shards(1, db), 2)
+
+        release_shard(1, 0, "a", True, db)
+        release_shard(1, 1, "c", True, db)
+        self.assertEqual(count_unfinished_shards(1, db), 0)
+        con.close()
+
+    def test_planned_apps_of_shard(self):
+        con = sqlite3.connect(":memory:")
+        db = con.cursor()
+        init_db(db)
+        insert_applist_page([(i, str(i), 1) for i in range(1, 8)], db)
+        shard_apps = [i for i in range(1, 8) if get_shard(i, 3) == 1]
+        self.assertEqual(create_update_plan(1000, 900, 1, db, 1, 3), (len(shard_apps), 0))
+        apps = get_planned_apps(1, (-2, 0), 10, db, 1)
+        self.assertEqual([i["app_id"] for i in apps], shard_apps)
+
+        # Shards of app ids in steps of 10 are about even
+        sizes = [0] * 8
+        for app_id in range(10, 100010, 10):
+            sizes[get_shard(app_id, 8)] += 1
+        self.assertLess(max(sizes) / min(sizes), 1.1)
+        con.close()
+
+
+def insert_number(number: int, db):
+    db.execute("INSERT INTO numbers VALUES (?)", (number, ))
+
+
+def insert_and_fail(number: int, db):
+    insert_number(number, db)
+    raise ValueError("failing write")
+
+
+class TestDBWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "writer.db")
+        con = sqlite3.connect(self.path)
+        con.execute("CREATE TABLE numbers (number INTEGER)")
+        con.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def get_numbers(self) -> list:
+        con = sqlite3.connect(self.path)
+        numbers = [i[0] for i in con.execute("SELECT number FROM numbers ORDER BY number")]
+        con.close()
+        return numbers
+
+    def test_group_commit(self):
+        writer = DBWriter(self.path, batch_size=3, interval=60)
+        writer.start()
+        for i in range(5):
+            writer.submit(insert_number, i)
+        writer.flush()
+        self.assertEqual(self.get_numbers(), [0, 1, 2, 3, 4])
+        # One commit for the full batch, one for the flush
+        self.assertEqual(writer.commits, 2)
+        writer.close()
+
+    def test_failed_write_is_rolled_back_alone(self):
+        rollbacks = []
+        writer = DBWriter(self.path, interval=60, on_rollback=lambda: rollbacks.append(1))
+        writer.start()
+        writer.submit(insert_number, 1)
+        writer.submit(insert_and_fail, 2)
+        writer.submit(insert_number, 3)
+        writer.close()
+        self.assertEqual(self.get_numbers(), [1, 3])
+        self.assertEqual((writer.writes, writer.failed_writes, len(rollbacks)), (2, 1, 1))
+
+    def test_failed_commit_stops_writer(self):
+        # A reader holding the database keeps commit from getting its lock
+        reader = sqlite3.connect(self.path, isolation_level=None)
+        reader.execute("BEGIN")
+        reader.execute("SELECT * FROM numbers").fetchall()
+
+        writer = DBWriter(self.path, interval=60, timeout=0.1)
+        writer.start()
+        writer.submit(insert_number, 1)
+        with self.assertRaises(WriterError):
+            writer.flush()
+        self.assertFalse(writer.is_alive())
+        with self.assertRaises(WriterError):
+            writer.submit(insert_number, 2)
+        with self.assertRaises(WriterError):
+            writer.close()
+
+        reader.execute("COMMIT")
+        reader.close()
+        self.assertEqual(self.get_numbers(), [])
+
+
+class TestRawStore(unittest.TestCase):
+    def test_save_and_latest(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = RawStore(path)
+            first = store.save("steam", 10, b'{"a": 1}')
+            store.save("steamspy", 10, b'{"b": 1}')
+            store.save("steam", 20, b'{"a": 1}')
+            store.save("steam", 10, b'{"a": 2}')
+
+            # Same bodies are stored once
+            objects = sum(len(files) for _, _, files in os.walk(store.objects_dir))
+            self.assertEqual(objects, 3)
+            self.assertEqual(store.load(first), b'{"a": 1}')
+            self.assertEqual(list(store.latest()), [
+                (10, {"steam": b'{"a": 2}', "steamspy": b'{"b": 1}'}),
+                (20, {"steam": b'{"a": 1}'})
+            ])
+            self.assertEqual(store.load_latest("steam", 10), b'{"a": 2}')
+            self.assertIsNone(store.load_latest("steamspy", 20))
+            store.close()
+
+
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.con = create_mock_db()
+        self.db = self.con.cursor()
+
+    def tearDown(self):
+        self.con.close()
+
+    def test_same_shape_reuses_plan(self):
+        def query(tags, release_date, offset):
+            filters = {"tags": tags, "genres": [], "categories": []}
+            return get_applist(filters, {"price": "DESC"}, None, release_date, None, offset, 10, self.db)
+
+        query([1], [">", "2000-01-01"], 0)
+        compiles = QUERY_PLANS.stats()["compiles"]
+
+        self.assertEqual([i["app_id"] for i in query([1, 2], [">", "2000-01-01"], 0)], [3, 2])
+        self.assertEqual([i["app_id"] for i in query([1], ["<=", "2000-01-02"], 1)], [1])
+        self.assertEqual(QUERY_PLANS.stats()["compiles"], compiles + 1)
+
+        query([2], [">", "2000"], 1)
+        self.assertEqual(QUERY_PLANS.stats()["compiles"], compiles + 1)
+
 
 # class TestGetAppList():
 #     def setUp(self):
@@ -0,0 +1,72 @@
+"""Times /GetAppList's filtering with FilterIndex against sql joins on map tables,
+on a generated catalog where a few tags are on most apps and most tags on a few.
+
+Run it from the project's root:
+    python test/bench_filters.py --apps 60000
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.database import init_db, get_applist, load_dimensions, create_snapshot_indexes
+from db.filter_index import FilterIndex
+
+TAG_COUNT = 450
+
+
+def create_catalog(size: int, seed: int) -> sqlite3.Connection:
+    """Returns in-memory database of 'size' apps, each with about 10 tags of Pareto distributed popularity."""
+    rnd = random.Random(seed)
+    con = sqlite3.connect(":memory:")
+    db = con.cursor()
+    init_db(db)
+    db.executemany("INSERT INTO tags (tag_id, name) VALUES (?, ?)", [(i, f"Tag {i}") for i in range(1, TAG_COUNT + 1)])
+    db.executemany(
+        "INSERT INTO apps (app_id, name, owner_count, rating, price) VALUES (?, ?, ?, ?, ?)",
+        [(i, f"App {i}", rnd.randint(0, 1_000_000), rnd.randint(0, 100), 999) for i in range(1, size + 1)]
+    )
+    db.executemany("INSERT INTO apps_tags (app_id, tag_id, votes) VALUES (?, ?, 1)", [
+        (app_id, tag_id) for app_id in range(1, size + 1)
+        for tag_id in {min(TAG_COUNT, int(rnd.paretovariate(0.6))) for _ in range(12)}
+    ])
+    con.commit()
+    create_snapshot_indexes(con)
+    return con
+
+
+def time_applist(filters: dict, db, dimensions: dict, filter_index, repeat: int) -> float:
+    """Returns average milliseconds of get_applist()"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        get_applist(filters, {"owner_count": "DESC"}, None, None, None, 0, 20, db, dimensions, filter_index)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of FilterIndex against sql joins")
+    parser.add_argument("--apps", type=int, default=60_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    con = create_catalog(args.apps, args.seed)
+    db = con.cursor()
+    dimensions = load_dimensions(db)
+    filter_index = FilterIndex(db)
+
+    print(f"{'tag':>5} {'apps':>8} {'sql ms':>8} {'index ms':>9}")
+    for tag_id in (1, 2, 5, 20, 100, 400):
+        filters = {"tags": [tag_id], "genres": [], "categories": []}
+        count = len(filter_index.match(filters))
+        sql_time = time_applist(filters, db, dimensions, None, args.repeat)
+        index_time = time_applist(filters, db, dimensions, filter_index, args.repeat)
+        print(f"{tag_id:>5} {count:>8,} {sql_time:>8.2f} {index_time:>9.2f}")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
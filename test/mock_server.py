@@ -0,0 +1,315 @@
+"""Local stand-in for Steam and SteamSpy APIs, to run and benchmark the updater without network.
+
+Start it:
+    python test/mock_server.py --apps 10000 --latency 0.05 --error-rate 0.01 --rate-limit 20
+Then point the updater at it (on a copy of the project, update writes apps.db, db/raw and update_log.json):
+    UPDATE_API_URL=http://127.0.0.1:8000 python db/update.py --ignore-timer
+Ctrl+C prints what was served. GET /stats returns the same as JSON while it runs.
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(current_dir, "mock_data.json")
+
+# last_modified of every app in applist, a second sync finds nothing new
+LAST_MODIFIED = 1_700_000_000
+# Apps per page of SteamSpy's bulk listing
+BULK_PAGE_SIZE = 1000
+
+
+class Catalog:
+    """Apps served by MockServer. Each app is made from a fixture (an App dict as in test/mock_data.json),
+    so the updater should save it with the fixture's data.
+    Shares of apps that aren't games, are over a million owners or
+    that Steam has no details for are picked randomly with 'seed'.
+    """
+
+    def __init__(self, fixtures: list, size: int, non_game_rate: float = 0.1,
+                 over_million_rate: float = 0.05, missing_rate: float = 0.02, seed: int = 0):
+        rnd = random.Random(seed)
+        self.apps = {}
+        for i in range(size):
+            app = dict(fixtures[i % len(fixtures)])
+            app["app_id"] = (i + 1) * 10
+            app["name"] = f"{app['name']} {i + 1}" if i >= len(fixtures) else app["name"]
+            roll = rnd.random()
+            app["type"] = "game"
+            if roll < missing_rate:
+                app["type"] = None
+            elif roll < missing_rate + non_game_rate:
+                app["type"] = "dlc"
+            elif roll < missing_rate + non_game_rate + over_million_rate:
+                app["owner_count"] = 3_500_000
+            self.apps[app["app_id"]] = app
+        self.app_ids = sorted(self.apps)
+
+    def applist(self, last_appid: int, if_modified_since: int, max_results: int) -> dict:
+        """IStoreService/GetAppList response"""
+        apps = []
+        if if_modified_since < LAST_MODIFIED:
+            apps = [
+                {"appid": app_id, "name": self.apps[app_id]["name"], "last_modified": LAST_MODIFIED}
+                for app_id in self.app_ids if app_id > last_appid
+            ]
+        response = {"apps": apps[:max_results]}
+        if len(apps) > max_results:
+            response.update({"have_more_results": True, "last_appid": apps[max_results - 1]["appid"]})
+        return {"response": response}
+
+    def applist_v2(self) -> dict:
+        """ISteamApps/GetAppList/v2 response"""
+        return {"applist": {"apps": [{"appid": app_id, "name": self.apps[app_id]["name"]} for app_id in self.app_ids]}}
+
+    def steam_appdetails(self, app_id: int) -> dict:
+        app = self.apps.get(app_id)
+        if app is None or app["type"] is None:
+            return {str(app_id): {"success": False}}
+
+        release_date = {"date": "", "coming_soon": app["coming_soon"]}
+        if app["release_date"]:
+            date = datetime.date.fromisoformat(app["release_date"])
+            release_date["date"] = f"{date.day} {date.strftime('%b, %Y')}"
+        data = {
+            "type": app["type"],
+            "name": app["name"],
+            "steam_appid": app_id,
+            "developers": app["developers"],
+            "publishers": app["publishers"],
+            "genres": [{"id": _id, "description": name} for name, _id in app["genres"].items()],
+            "categories": [{"id": _id, "description": name} for name, _id in app["categories"].items()],
+            "release_date": release_date,
+            "supported_languages": app["languages"],
+            "platforms": {"windows": app["windows"], "mac": app["mac"], "linux": app["linux"]},
+            "screenshots": []
+        }
+        return {str(app_id): {"success": True, "data": data}}
+
+    def steamspy_appdetails(self, app_id: int) -> dict:
+        app = self.apps.get(app_id)
+        if app is None:
+            return {"appid": app_id, "name": None, "owners": "0 .. 20,000", "price": None,
+                    "positive": 0, "negative": 0, "tags": []}
+        details = self._steamspy_entry(app)
+        details["tags"] = app["tags"]
+        return details
+
+    def steamspy_all(self, page: int) -> dict:
+        """SteamSpy's bulk listing page, it has no tags"""
+        app_ids = self.app_ids[page * BULK_PAGE_SIZE:(page + 1) * BULK_PAGE_SIZE]
+        return {str(app_id): self._steamspy_entry(self.apps[app_id]) for app_id in app_ids}
+
+    @staticmethod
+    def _steamspy_entry(app: dict) -> dict:
+        # Range is around owner_count, so its average is owner_count
+        owners = app["owner_count"]
+        return {
+            "appid": app["app_id"],
+            "name": app["name"],
+            "owners": f"{owners // 2:,} .. {owners * 3 // 2:,}",
+            "price": None if app["price"] is None else str(app["price"]),
+            "positive": app["positive_reviews"],
+            "negative": app["negative_reviews"]
+        }
+
+
+class Faults:
+    """Failures MockServer adds to app details responses.
+    latency: average seconds a response is delayed, 0 to 2 * latency
+    error_rate: share of requests that get a 500
+    rate_limit: requests per second allowed to each API, others get a 429. 0 for no limit
+    burst_every, burst_length: every 'burst_every' seconds all requests get a 429 for 'burst_length' seconds
+    retry_after: Retry-After seconds sent with 429s, 0 to leave it out
+    """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0, rate_limit: float = 0,
+                 burst_every: float = 0, burst_length: float = 0, retry_after: int = 0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = {}  # api -> (window start, requests in window)
+
+    def get_delay(self) -> float:
+        with self._lock:
+            return self._random.uniform(0, 2 * self.latency)
+
+    def get_status(self, api: str, now: float) -> int:
+        """Returns status code to respond to a request made to api at now, 200 if it shouldn't fail."""
+        if self.burst_every and now % self.burst_every < self.burst_length:
+            return 429
+        with self._lock:
+            if self.rate_limit:
+                start, count = self._requests.get(api, (now, 0))
+                if now - start >= 1:
+                    start, count = now, 0
+                self._requests[api] = (start, count + 1)
+                if count >= self.rate_limit:
+                    return 429
+            if self._random.random() < self.error_rate:
+                return 500
+        return 200
+
+
+class MockServer(ThreadingHTTPServer):
+    """Serves Catalog with Faults. Routes by path, so every API host can be pointed at it."""
+    daemon_threads = True
+
+    def __init__(self, catalog: Catalog, faults: Faults, host: str = "127.0.0.1", port: int = 8000):
+        super().__init__((host, port), MockHandler)
+        self.catalog = catalog
+        self.faults = faults
+        self.started = time.monotonic()
+        self.stats = {}  # "api status" -> count
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> threading.Thread:
+        """Serves in a background thread, stop it with shutdown()"""
+        thread = threading.Thread(target=self.serve_forever, name="MockServer", daemon=True)
+        thread.start()
+        return thread
+
+    def handle_error(self, request, client_address):
+        # Clients that went away in the middle of a response, e.g. a killed updater, aren't errors of the server
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, api: str, status: int):
+        with self._lock:
+            key = f"{api} {status}"
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(sorted(self.stats.items()))
+        elapsed = time.monotonic() - self.started
+        served = sum(count for key, count in stats.items() if key.endswith((" 200", " 304")))
+        return {"elapsed": round(elapsed, 1), "served_per_sec": round(served / elapsed, 2), "responses": stats}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        catalog = self.server.catalog
+        try:
+            if parts.path == "/stats":
+                return self.send_json(self.server.get_stats())
+            elif parts.path.startswith("/IStoreService/GetAppList"):
+                return self.send_json(catalog.applist(
+                    int(query.get("last_appid", 0)), int(query.get("if_modified_since", 0)),
+                    int(query.get("max_results", 10_000))
+                ), "applist")
+            elif parts.path.startswith("/ISteamApps/GetAppList"):
+                return self.send_json(catalog.applist_v2(), "applist")
+            elif parts.path.startswith("/api/appdetails"):
+                return self.send_app_details("steam", lambda: catalog.steam_appdetails(int(query["appids"])))
+            elif parts.path == "/api.php" and query.get("request") == "appdetails":
+                return self.send_app_details("steamspy", lambda: catalog.steamspy_appdetails(int(query["appid"])))
+            elif parts.path == "/api.php" and query.get("request") == "all":
+                return self.send_json(catalog.steamspy_all(int(query.get("page", 0))), "steamspy_bulk")
+        except (KeyError, ValueError):
+            return self.send_status(400, "bad_request")
+        self.send_status(404, "not_found")
+
+    def send_app_details(self, api: str, get_response):
+        faults = self.server.faults
+        delay = faults.get_delay()
+        if delay:
+            time.sleep(delay)
+
+        status = faults.get_status(api, time.monotonic())
+        if status == 429:
+            headers = {"Retry-After": str(faults.retry_after)} if faults.retry_after else {}
+            return self.send_status(429, api, headers)
+        elif status != 200:
+            return self.send_status(status, api)
+
+        body = json.dumps(get_response()).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.send_status(304, api, {"ETag": etag})
+        self.send_body(body, api, {"ETag": etag})
+
+    def send_json(self, data, api: str = None):
+        self.send_body(json.dumps(data).encode(), api)
+
+    def send_body(self, body: bytes, api: str = None, headers: dict = None):
+        # Counted before replying, so a client sees counts of requests it got a reply to
+        if api:
+            self.server.count(api, 200)
+        self.send_response(200)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_status(self, status: int, api: str, headers: dict = None):
+        self.server.count(api, status)
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for Steam and SteamSpy APIs")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fixtures", default=FIXTURES_PATH, help="json list of App dicts apps are made from")
+    parser.add_argument("--apps", type=int, default=1000, help="number of apps in applist")
+    parser.add_argument("--non-game-rate", type=float, default=0.1)
+    parser.add_argument("--over-million-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.02, help="share of apps Steam has no details for")
+    parser.add_argument("--latency", type=float, default=0, help="average seconds to delay app details")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of app details requests that get a 500")
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests per second allowed to each API")
+    parser.add_argument("--burst-every", type=float, default=0, help="seconds between bursts of 429s")
+    parser.add_argument("--burst-length", type=float, default=0, help="seconds each burst of 429s lasts")
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.fixtures, "r") as f:
+        fixtures = json.load(f)
+    catalog = Catalog(fixtures, args.apps, args.non_game_rate, args.over_million_rate, args.missing_rate, args.seed)
+    faults = Faults(args.latency, args.error_rate, args.rate_limit,
+                    args.burst_every, args.burst_length, args.retry_after, args.seed)
+    server = MockServer(catalog, faults, port=args.port)
+    print(f"Serving {len(catalog.apps):,} apps at: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
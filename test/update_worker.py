@@ -0,0 +1,61 @@
+"""Runs an updater worker (update.run_worker) against a MockServer, with its files in a directory.
+Tests start workers with it, so each one runs in a process of its own like 'update.py --worker NAME' does:
+    python test/update_worker.py DIR SERVER_URL NAME --shards 2 --lease-duration 3
+DIR should have an apps.db made with init_db() and an update_log.json.
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import update, errors
+from db.http_client import HTTPClient
+from db.ratelimit import TokenBucket, AdaptiveTokenBucket
+from db.update_logger import UpdateLogger
+
+
+def configure(directory: str, server_url: str, shards: int, lease_duration: int, poll_interval: float):
+    """Points update's files to directory and its requests to server_url, without rate limits."""
+    log_path = os.path.join(directory, "update_log.json")
+    errors.ulogger.file = log_path
+    update.APPS_DB_PATH = os.path.join(directory, "apps.db")
+    update.QUERIES_DB_PATH = os.path.join(directory, "app_queries.db")
+    update.RAW_STORE_PATH = os.path.join(directory, "raw")
+    update.METRICS_JSON_PATH = os.path.join(directory, "update_metrics.json")
+    update.METRICS_PROM_PATH = os.path.join(directory, "update_metrics.prom")
+    update.DEBUG_LOG = os.path.join(directory, "debug.log")
+    update.UPDATE_HISTORY_PATH = os.path.join(directory, "update_history.jsonl")
+    update.update_log = UpdateLogger(log_path).log
+    update.STEAM_API_KEY = "test"
+    update.STEAMSPY_BULK = False
+    update.SHARD_COUNT = shards
+    update.LEASE_DURATION = lease_duration
+    update.LEASE_POLL_INTERVAL = poll_interval
+    # Short leases are renewed in time only if other workers' write transactions are shorter
+    update.WRITE_INTERVAL = lease_duration / 10
+    update.LIMITERS = {
+        "steam": AdaptiveTokenBucket(1000, 1000, 1000, 0),
+        "steamspy": AdaptiveTokenBucket(1000, 1000, 1000, 0),
+        "steamspy_bulk": TokenBucket(1000)
+    }
+    update.http_client = HTTPClient(update.WORKERS, 5, {
+        "store.steampowered.com": server_url, "steamspy.com": server_url, "api.steampowered.com": server_url
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Updater worker for tests")
+    parser.add_argument("directory")
+    parser.add_argument("server_url")
+    parser.add_argument("name")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--lease-duration", type=int, default=3)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    configure(args.directory, args.server_url, args.shards, args.lease_duration, args.poll_interval)
+    update.run_worker(args.name)
+
+
+if __name__ == "__main__":
+    main()